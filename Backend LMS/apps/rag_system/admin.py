@@ -64,22 +64,28 @@
 
 
 from django.contrib import admin
-from .models import DocumentStore, ChatHistory, QueryCache, RAGMetrics
+from .models import DocumentStore, ChatHistory, QueryCache, RAGMetrics, RAGLatencyHistogram
 
 
 @admin.register(DocumentStore)
 class DocumentStoreAdmin(admin.ModelAdmin):
-    list_display = ['title', 'document_type', 'uploaded_by', 'is_processed', 'uploaded_at']
-    list_filter = ['document_type', 'is_processed', 'uploaded_at']
+    list_display = ['title', 'document_type', 'uploaded_by', 'status', 'progress', 'chunk_count', 'uploaded_at']
+    list_filter = ['document_type', 'status', 'is_processed', 'uploaded_at']
     search_fields = ['title', 'uploaded_by__username']
-    readonly_fields = ['uploaded_at', 'vector_count', 'id']
+    readonly_fields = [
+        'uploaded_at', 'vector_count', 'id',
+        'status', 'progress', 'chunk_count', 'processing_stats', 'processed_at'
+    ]
     
     fieldsets = (
         ('Document Info', {
             'fields': ('id', 'title', 'document_type', 'file')
         }),
         ('Processing', {
-            'fields': ('is_processed', 'vector_count', 'metadata')
+            'fields': (
+                'status', 'progress', 'is_processed', 'chunk_count', 'vector_count',
+                'processing_stats', 'processed_at', 'metadata'
+            )
         }),
         ('Tracking', {
             'fields': ('uploaded_by', 'uploaded_at')
@@ -102,8 +108,8 @@ class ChatHistoryAdmin(admin.ModelAdmin):
 
 @admin.register(QueryCache)
 class QueryCacheAdmin(admin.ModelAdmin):
-    list_display = ['short_query', 'hit_count', 'last_used', 'created_at']
-    list_filter = ['created_at', 'last_used']
+    list_display = ['short_query', 'user_role', 'hit_count', 'last_used', 'created_at']
+    list_filter = ['user_role', 'created_at', 'last_used']
     search_fields = ['query_text', 'response']
     readonly_fields = ['query_hash', 'created_at', 'last_used']
     ordering = ['-hit_count']
@@ -117,8 +123,16 @@ class QueryCacheAdmin(admin.ModelAdmin):
 class RAGMetricsAdmin(admin.ModelAdmin):
     list_display = [
         'date', 'total_queries', 'successful_queries', 
-        'failed_queries', 'avg_response_time', 'cache_hit_rate'
+        'failed_queries', 'avg_response_time', 'cache_hits', 'cache_hit_rate'
     ]
     list_filter = ['date']
     readonly_fields = ['date']
-    date_hierarchy = 'date'
\ No newline at end of file
+    date_hierarchy = 'date'
+
+
+@admin.register(RAGLatencyHistogram)
+class RAGLatencyHistogramAdmin(admin.ModelAdmin):
+    list_display = ['date', 'query_type', 'metric', 'sample_count', 'updated_at']
+    list_filter = ['query_type', 'metric', 'date']
+    readonly_fields = ['date', 'query_type', 'metric', 'histogram', 'sample_count', 'updated_at']
+    date_hierarchy = 'date'
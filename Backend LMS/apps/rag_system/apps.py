@@ -33,7 +33,10 @@ class RagSystemConfig(AppConfig):
     
     def ready(self):
         """Initialize when Django starts"""
-        pass
+        from django.db.models.signals import post_migrate
+        from .services.table_stats import invalidate_table_stats
+        
+        post_migrate.connect(invalidate_table_stats, dispatch_uid='rag_system_table_stats')
 
 
 
@@ -0,0 +1,114 @@
+# ============================================
+# RAG SETTINGS ACCESS
+# File: apps/rag_system/conf.py
+# ============================================
+
+from django.conf import settings
+
+
+# Defaults for every key read from settings.RAG_SETTINGS
+DEFAULTS = {
+    'VECTOR_STORE_PATH': './data/vectorstore',
+    'WARMUP_ON_STARTUP': False,
+    'EMBEDDING_MODEL': 'sentence-transformers/all-MiniLM-L6-v2',
+
+    # Retrieval (services/vectorstore_service.py, services/bm25_index.py,
+    # services/retrieval_filters.py)
+    'HYBRID_SEARCH_ENABLED': True,
+    'QUERY_EXPANSION_ENABLED': False,
+    'BM25_K1': 1.5,
+    'BM25_B': 0.75,
+    # How often a process checks whether other processes changed the BM25
+    # index (index file rewritten, or collection size differs)
+    'KEYWORD_INDEX_REFRESH_SECONDS': 30,
+    # Filtered searches returning fewer hits than this fall back to unfiltered
+    'RETRIEVAL_FILTER_MIN_RESULTS': 3,
+
+    # HNSW index of the Chroma collection (services/vectorstore_service.py).
+    # Defaults are Chroma's own; space/M/construction_ef only apply when the
+    # collection is created, so rebuild it after changing them. Compare
+    # settings with `manage.py benchmark_hnsw`.
+    'HNSW_SPACE': 'l2',
+    'HNSW_M': 16,
+    'HNSW_CONSTRUCTION_EF': 100,
+    'HNSW_SEARCH_EF': 10,
+
+    # LLM-free answers for count/list/top-N questions (services/template_query.py)
+    'TEMPLATE_QUERY_ENABLED': True,
+    'TEMPLATE_QUERY_MAX_ROWS': 20,
+    # Roles (user_context['user_type']) that may list rows; everyone gets counts
+    'TEMPLATE_QUERY_ROW_ROLES': ['admin', 'Employee'],
+
+    # Generated/templated SQL execution (services/sql_executor.py, services/text_to_sql.py).
+    # Text-to-SQL costs one extra GROQ call (SQL generation) per new database or
+    # analytical question template, before the answer call
+    'TEXT_TO_SQL_ENABLED': True,
+    'SQL_STATEMENT_TIMEOUT_MS': 3000,
+    'SQL_MAX_ROWS': 20,
+    'SQL_MAX_COST': 50000,      # planner cost units (EXPLAIN total cost); pricier queries are rejected
+    'SQL_FETCH_SIZE': 100,      # rows per server-side cursor round trip
+    'SQL_CACHE_SIZE': 512,      # generated SQL kept per normalized question template
+
+    # Prompt context (services/context_packer.py)
+    'CONTEXT_TOKEN_BUDGET': 1500,
+
+    # GROQ client (services/groq_service.py, services/circuit_breaker.py)
+    'GROQ_CONNECT_TIMEOUT': 5,     # seconds
+    'GROQ_READ_TIMEOUT': 30,       # seconds between bytes, not for the whole completion
+    'GROQ_MAX_CONNECTIONS': 20,    # keep-alive pool shared by the process
+    'GROQ_MAX_RETRIES': 2,
+    'GROQ_RETRY_BACKOFF': 0.5,     # seconds, doubled per retry, full jitter
+    'GROQ_BREAKER_FAILURES': 5,    # consecutive failures that open the circuit
+    'GROQ_BREAKER_RESET': 30,      # seconds open before a probe call
+
+    # Embedding cache (services/embedding_cache.py)
+    'EMBEDDING_CACHE_SIZE': 10000,
+    'EMBEDDING_CACHE_DISK': True,
+    'EMBEDDING_CACHE_DISK_SIZE': 200000,   # rows in the SQLite tier (~1.6 KB each at 384 dims)
+
+    # Answer cache (services/query_cache.py)
+    'QUERY_CACHE_TTL': 3600,
+    'QUERY_CACHE_L1_SIZE': 256,
+    'QUERY_CACHE_L1_TTL': 300,
+    'QUERY_CACHE_MAX_ENTRIES': 5000,
+
+    # Near-duplicate answer cache (services/semantic_cache.py)
+    'SEMANTIC_CACHE_ENABLED': True,
+    'SEMANTIC_CACHE_THRESHOLD': 0.92,
+    'SEMANTIC_CACHE_SIZE': 1000,
+
+    # Identical concurrent queries share one computation (services/single_flight.py)
+    'COALESCE_ENABLED': True,
+    'COALESCE_TIMEOUT': 30,  # seconds a waiting request gives the in-flight one
+
+    # Intent/entity keyword matching (services/query_matcher.py)
+    'QUERY_MATCHER_CACHE_SIZE': 2048,  # normalized queries
+
+    # Table columns / row estimates (services/table_stats.py)
+    'TABLE_STATS_TTL': 600,
+
+    # Chat history / metrics writes (services/metrics_recorder.py)
+    'METRICS_BUFFERED': True,
+    'METRICS_FLUSH_INTERVAL': 5,   # seconds
+    'METRICS_MAX_BUFFER': 500,     # chats waiting before an early flush
+
+    # Document ingestion (services/ingestion.py)
+    'DOCUMENT_AUTO_INGEST': True,
+    'INGESTION_WORKERS': 0,  # 0 = one per CPU, capped at 4
+    'INGESTION_PAGES_PER_TASK': 25,
+    'INGESTION_BATCH_SIZE': 64,
+
+    # Extracted document text (services/text_cache.py)
+    'TEXT_CACHE_ENABLED': True,
+    'TEXT_CACHE_PATH': None,  # default: extracted_text.sqlite3 next to the vector store
+}
+
+
+def rag_setting(name: str, default=None):
+    """Read a RAG setting, falling back to the app defaults"""
+    user_settings = getattr(settings, 'RAG_SETTINGS', {}) or {}
+    if name in user_settings:
+        return user_settings[name]
+    if default is not None:
+        return default
+    return DEFAULTS.get(name)
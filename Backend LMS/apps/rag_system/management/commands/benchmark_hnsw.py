@@ -0,0 +1,218 @@
+# ============================================
+# HNSW BENCHMARK
+# File: apps/rag_system/management/commands/benchmark_hnsw.py
+# ============================================
+
+import json
+import os
+import time
+import uuid
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.rag_system.conf import rag_setting
+from apps.rag_system.services.benchmark import percentile
+from apps.rag_system.services.vectorstore_service import hnsw_metadata
+
+
+# Compared when no --config is given (the configured settings always run first)
+DEFAULT_CONFIGS = [
+    {"M": 16, "construction_ef": 100, "search_ef": 10},
+    {"M": 16, "construction_ef": 200, "search_ef": 50},
+    {"M": 32, "construction_ef": 200, "search_ef": 100},
+    {"M": 8, "construction_ef": 100, "search_ef": 10},
+]
+
+
+def exact_neighbors(corpus: np.ndarray, queries: np.ndarray, k: int, space: str) -> np.ndarray:
+    """Brute-force top-k indices using the same distance Chroma uses for `space`"""
+    if space == 'cosine':
+        corpus = corpus / np.linalg.norm(corpus, axis=1, keepdims=True).clip(min=1e-12)
+        queries = queries / np.linalg.norm(queries, axis=1, keepdims=True).clip(min=1e-12)
+        distances = 1 - queries @ corpus.T
+    elif space == 'ip':
+        distances = 1 - queries @ corpus.T
+    else:  # squared l2
+        distances = (
+            (queries ** 2).sum(axis=1)[:, None] - 2 * queries @ corpus.T + (corpus ** 2).sum(axis=1)[None, :]
+        )
+    k = min(k, corpus.shape[0])
+    top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(distances, top, axis=1).argsort(axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def estimated_index_mb(count: int, dim: int, m: int) -> float:
+    """hnswlib layout: vectors + 2*M level-0 links + label per element (upper levels ~ 1/M of that)"""
+    level0 = dim * 4 + 2 * m * 4 + 4 + 8
+    upper = (m * 4 + 4) / max(m, 2)
+    return round(count * (level0 + upper) / (1024 * 1024), 2)
+
+
+def rss_mb():
+    """Resident set size of this process (Linux), or None"""
+    try:
+        with open('/proc/self/statm') as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark HNSW settings: recall@k vs brute force, query latency and index memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--config',
+            action='append',
+            default=[],
+            help='HNSW settings to test, e.g. "M=32,construction_ef=200,search_ef=100" (repeatable)',
+        )
+        parser.add_argument('--k', type=int, default=10, help='Neighbours per query (recall@k)')
+        parser.add_argument('--queries', type=int, default=200, help='Number of query vectors')
+        parser.add_argument('--limit', type=int, help='Use at most this many vectors from the collection')
+        parser.add_argument(
+            '--synthetic',
+            type=int,
+            help='Benchmark N random clustered vectors instead of the live collection (simulates growth)',
+        )
+        parser.add_argument('--dim', type=int, default=384, help='Dimension of synthetic vectors')
+        parser.add_argument('--space', type=str, choices=['l2', 'cosine', 'ip'], help='Distance (default: HNSW_SPACE)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        import chromadb
+
+        np.random.seed(options['seed'])
+        space = options['space'] or rag_setting('HNSW_SPACE')
+        k = options['k']
+
+        corpus = self._load_corpus(options)
+        if corpus.shape[0] <= k:
+            raise CommandError(f'Need more than k={k} vectors, found {corpus.shape[0]}')
+
+        # Queries: stored vectors with a little noise, so a query is near,
+        # but not identical to, its source chunk
+        sample = np.random.choice(corpus.shape[0], size=min(options['queries'], corpus.shape[0]), replace=False)
+        noise = np.random.normal(scale=corpus.std() * 0.1, size=(len(sample), corpus.shape[1]))
+        queries = (corpus[sample] + noise).astype(np.float32)
+
+        self.stdout.write(f'Computing exact neighbours for {len(queries)} queries over {corpus.shape[0]} vectors...')
+        truth = exact_neighbors(corpus, queries, k, space)
+
+        extra = [self._parse(value) for value in options['config']] or DEFAULT_CONFIGS
+        configs = [self._configured()] + extra
+        seen, unique = set(), []
+        for config in configs:
+            key = tuple(sorted(config.items()))
+            if key not in seen:
+                seen.add(key)
+                unique.append(config)
+
+        client = chromadb.EphemeralClient()
+        ids = [str(i) for i in range(corpus.shape[0])]
+        report = {
+            "vectors": corpus.shape[0],
+            "dimension": corpus.shape[1],
+            "queries": len(queries),
+            "k": k,
+            "space": space,
+            "results": [],
+        }
+
+        for config in unique:
+            name = f"bench_{uuid.uuid4().hex[:12]}"
+            rss_before = rss_mb()
+            build_started = time.perf_counter()
+            collection = client.create_collection(
+                name=name,
+                metadata=hnsw_metadata(space, config["M"], config["construction_ef"], config["search_ef"])
+            )
+            for start in range(0, len(ids), 5000):
+                collection.add(ids=ids[start:start + 5000], embeddings=corpus[start:start + 5000].tolist())
+            build_seconds = time.perf_counter() - build_started
+            rss_after = rss_mb()
+
+            latencies, hits = [], 0
+            for query, expected in zip(queries, truth):
+                started = time.perf_counter()
+                found = collection.query(query_embeddings=[query.tolist()], n_results=k, include=["distances"])
+                latencies.append((time.perf_counter() - started) * 1000)
+                hits += len({int(doc_id) for doc_id in found["ids"][0]} & set(expected.tolist()))
+
+            report["results"].append({
+                **config,
+                "recall_at_k": round(hits / (len(queries) * truth.shape[1]), 4),
+                "latency_ms": {
+                    "p50": round(percentile(latencies, 50), 3),
+                    "p95": round(percentile(latencies, 95), 3),
+                    "p99": round(percentile(latencies, 99), 3),
+                    "mean": round(sum(latencies) / len(latencies), 3),
+                },
+                "build_seconds": round(build_seconds, 2),
+                "estimated_index_mb": estimated_index_mb(corpus.shape[0], corpus.shape[1], config["M"]),
+                "rss_delta_mb": round(rss_after - rss_before, 1) if rss_before is not None else None,
+            })
+            client.delete_collection(name)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self._print_report(report)
+
+    def _load_corpus(self, options) -> np.ndarray:
+        if options['synthetic']:
+            # Clustered like real chunk embeddings, not uniform noise
+            count, dim = options['synthetic'], options['dim']
+            centers = np.random.normal(size=(max(1, count // 100), dim))
+            assignment = np.random.randint(0, centers.shape[0], size=count)
+            return (centers[assignment] + np.random.normal(scale=0.3, size=(count, dim))).astype(np.float32)
+
+        from apps.rag_system.services.engine import get_rag_engine
+
+        collection = get_rag_engine().vectorstore.vectorstore._collection
+        data = collection.get(include=["embeddings"], limit=options['limit'])
+        if data["embeddings"] is None or not len(data["embeddings"]):
+            raise CommandError('The vector store is empty; index it first or use --synthetic N')
+        return np.asarray(data["embeddings"], dtype=np.float32)
+
+    @staticmethod
+    def _configured():
+        return {
+            "M": rag_setting('HNSW_M'),
+            "construction_ef": rag_setting('HNSW_CONSTRUCTION_EF'),
+            "search_ef": rag_setting('HNSW_SEARCH_EF'),
+        }
+
+    def _parse(self, value: str):
+        config = self._configured()
+        for part in value.split(','):
+            key, _, number = part.partition('=')
+            key = key.strip()
+            if key not in config or not number.strip().isdigit():
+                raise CommandError(f'Invalid --config entry "{part}" (use M, construction_ef, search_ef)')
+            config[key] = int(number)
+        return config
+
+    def _print_report(self, report):
+        self.stdout.write(self.style.SUCCESS(
+            f"\n📊 HNSW BENCHMARK ({report['vectors']} vectors, dim {report['dimension']}, "
+            f"{report['queries']} queries, k={report['k']}, space={report['space']})"
+        ))
+        self.stdout.write('=' * 96)
+        self.stdout.write(
+            f"{'M':>4} {'ef_constr':>10} {'ef_search':>10} {'recall@k':>9} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'build s':>8} {'index MB':>9} {'RSS +MB':>8}"
+        )
+        for row in report["results"]:
+            rss = '-' if row["rss_delta_mb"] is None else f"{row['rss_delta_mb']:.1f}"
+            self.stdout.write(
+                f"{row['M']:>4} {row['construction_ef']:>10} {row['search_ef']:>10} {row['recall_at_k']:>9.4f} "
+                f"{row['latency_ms']['p50']:>8.3f} {row['latency_ms']['p95']:>8.3f} {row['latency_ms']['p99']:>8.3f} "
+                f"{row['build_seconds']:>8.2f} {row['estimated_index_mb']:>9.2f} {rss:>8}"
+            )
+        self.stdout.write('=' * 96)
+        self.stdout.write('First row is the configured RAG_SETTINGS. Latency includes Chroma query overhead.\n')
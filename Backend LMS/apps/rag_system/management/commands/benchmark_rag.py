@@ -0,0 +1,102 @@
+# ============================================
+# OFFLINE RAG BENCHMARK
+# File: apps/rag_system/management/commands/benchmark_rag.py
+# ============================================
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.rag_system.conf import rag_setting
+from apps.rag_system.services.benchmark import (
+    BENCHMARK_QUESTIONS, StubGroqService, compare_reports, run_benchmark
+)
+from apps.rag_system.services.stage_timer import STAGES
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the RAG pipeline offline (stubbed LLM) with per-stage latency percentiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=3, help='Timed passes over the question corpus')
+        parser.add_argument('--warmup', type=int, default=1, help='Untimed passes before measuring')
+        parser.add_argument('--llm-latency', type=float, default=800.0, help='Stub LLM latency in ms')
+        parser.add_argument('--llm-jitter', type=float, default=0.0, help='Uniform +/- jitter on the stub latency in ms')
+        parser.add_argument('--questions', type=str, help='File with one question per line (default: built-in corpus)')
+        parser.add_argument(
+            '--embedding-cache',
+            action='store_true',
+            help='Keep the embedding cache (default: bypass it so embedding time is measured)',
+        )
+        parser.add_argument('--output', type=str, help='Write the JSON report to this file')
+        parser.add_argument('--baseline', type=str, help='Compare against a previous JSON report')
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Allowed p95 slowdown vs --baseline before failing (0.2 = 20%%)',
+        )
+
+    def handle(self, *args, **options):
+        from apps.rag_system.services.database_connector import DatabaseConnector
+        from apps.rag_system.services.vectorstore_service import VectorStoreService
+        from apps.rag_system.services.rag_service import VectorStoreRAGService
+        from apps.rag_system.services.orchestrator import VectorStoreOrchestrator
+
+        questions = BENCHMARK_QUESTIONS
+        if options['questions']:
+            with open(options['questions'], encoding='utf-8') as file:
+                questions = [line.strip() for line in file if line.strip()]
+
+        # Real retrieval and database context, stubbed LLM
+        stub = StubGroqService(latency_ms=options['llm_latency'], jitter_ms=options['llm_jitter'])
+        db_connector = DatabaseConnector()
+        vectorstore = VectorStoreService(
+            persist_directory=str(rag_setting('VECTOR_STORE_PATH')),
+            db_connector=db_connector
+        )
+        if not options['embedding_cache']:
+            vectorstore.embeddings = getattr(vectorstore.embeddings, 'underlying', vectorstore.embeddings)
+        rag_service = VectorStoreRAGService(groq_service=stub, vectorstore=vectorstore, db_connector=db_connector)
+        orchestrator = VectorStoreOrchestrator(rag_service=rag_service, groq_service=stub, db_connector=db_connector)
+
+        self.stdout.write(
+            f"Running {len(questions)} questions x {options['iterations']} iterations "
+            f"(stub LLM {options['llm_latency']:.0f}ms)..."
+        )
+        report = run_benchmark(orchestrator, questions, options['iterations'], options['warmup'])
+        report["llm_stub"] = {"latency_ms": options['llm_latency'], "jitter_ms": options['llm_jitter']}
+        report["embedding_cache"] = options['embedding_cache']
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+
+        self._print_summary(report)
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)
+            regressions = compare_reports(baseline, report, options['tolerance'])
+            if regressions:
+                for line in regressions:
+                    self.stdout.write(self.style.ERROR(f"  ✗ {line}"))
+                raise CommandError(f"{len(regressions)} latency regression(s) vs {options['baseline']}")
+            self.stdout.write(self.style.SUCCESS(f"✓ No p95 regressions beyond {options['tolerance']:.0%}"))
+
+    def _print_summary(self, report):
+        self.stdout.write(self.style.SUCCESS('\n📊 RAG BENCHMARK (ms)'))
+        self.stdout.write('=' * 60)
+        self.stdout.write(f"{'stage':<16} {'count':>6} {'p50':>10} {'p95':>10} {'p99':>10}")
+        rows = [(name, report["stages_ms"].get(name)) for name in STAGES] + [("total", report["total_ms"])]
+        for name, stats in rows:
+            if stats and stats["count"]:
+                self.stdout.write(
+                    f"{name:<16} {stats['count']:>6} {stats['p50']:>10.2f} {stats['p95']:>10.2f} {stats['p99']:>10.2f}"
+                )
+        self.stdout.write('=' * 60)
+        if report["failures"]:
+            self.stdout.write(self.style.WARNING(f"  {report['failures']} run(s) returned success=False"))
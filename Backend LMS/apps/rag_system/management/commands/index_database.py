@@ -3,7 +3,7 @@
 # ============================================
 
 from django.core.management.base import BaseCommand
-from apps.rag_system.services.rag_service import RAGService
+from apps.rag_system.services.engine import get_rag_engine
 
 
 class Command(BaseCommand):
@@ -19,34 +19,32 @@ class Command(BaseCommand):
         parser.add_argument(
             '--all',
             action='store_true',
-            help='Index all important tables',
+            help='Refresh the whole database knowledge base (default)',
         )
 
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Starting database indexing...'))
         
         try:
-            rag_service = RAGService()
+            vectorstore = get_rag_engine().vectorstore
             
             if options['tables']:
                 tables = options['tables']
                 self.stdout.write(f"Indexing specific tables: {', '.join(tables)}")
-                rag_service.index_database_tables(tables)
-            elif options['all']:
-                self.stdout.write("Indexing all important tables...")
-                rag_service.index_database_tables(None)
+                # Chunks from the tables' old descriptions are pruned, other tables are untouched
+                result = vectorstore.index_tables(tables)
             else:
-                # Default tables
-                default_tables = [
-                    'students', 'teachers', 'classes', 'sections',
-                    'subjects', 'attendance', 'exam_results', 'fee_invoices'
-                ]
-                self.stdout.write(f"Indexing default tables: {', '.join(default_tables)}")
-                rag_service.index_database_tables(default_tables)
+                # Unchanged chunks are kept, so a full refresh only embeds what changed
+                self.stdout.write("Refreshing all database knowledge...")
+                result = vectorstore.initialize_with_database_knowledge(refresh=True)
             
+            if result:
+                self.stdout.write(
+                    f"  Added: {result['added']}, unchanged: {result['unchanged']}, removed: {result['deleted']}"
+                )
             self.stdout.write(self.style.SUCCESS('✓ Database indexing completed successfully!'))
-            
+        
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Error indexing database: {e}'))
             import traceback
-            traceback.print_exc()
\ No newline at end of file
+            traceback.print_exc()
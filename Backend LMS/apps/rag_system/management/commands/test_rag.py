@@ -4,7 +4,7 @@
 
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
-from apps.rag_system.services.orchestrator import RAGOrchestrator
+from apps.rag_system.services.engine import get_rag_engine
 
 
 class Command(BaseCommand):
@@ -38,7 +38,7 @@ class Command(BaseCommand):
         
         # Initialize orchestrator
         self.stdout.write(self.style.SUCCESS('Initializing RAG system...'))
-        orchestrator = RAGOrchestrator()
+        orchestrator = get_rag_engine().orchestrator
         
         # Test queries
         if options['query']:
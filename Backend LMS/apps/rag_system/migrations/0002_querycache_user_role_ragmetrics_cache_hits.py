@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_system', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='querycache',
+            name='user_role',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='ragmetrics',
+            name='cache_hits',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_system', '0003_documentstore_ingestion_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RAGLatencyHistogram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('query_type', models.CharField(max_length=50)),
+                ('metric', models.CharField(max_length=50)),
+                ('histogram', models.JSONField(default=dict)),
+                ('sample_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'rag_latency_histogram',
+                'ordering': ['-date', 'query_type', 'metric'],
+                'unique_together': {('date', 'query_type', 'metric')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_system', '0004_raglatencyhistogram'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ragmetrics',
+            name='date',
+            field=models.DateField(default=django.utils.timezone.localdate, unique=True),
+        ),
+    ]
@@ -4,6 +4,7 @@ from django.db import models
 
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 import uuid
 
 User = get_user_model()
@@ -17,6 +18,12 @@ class DocumentStore(models.Model):
         ('txt', 'Text File'),
         ('csv', 'CSV File'),
     )
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     title = models.CharField(max_length=255)
@@ -28,6 +35,13 @@ class DocumentStore(models.Model):
     vector_count = models.IntegerField(default=0)
     metadata = models.JSONField(default=dict, blank=True)
     
+    # Ingestion pipeline progress
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    progress = models.IntegerField(default=0)  # percent
+    chunk_count = models.IntegerField(default=0)
+    processing_stats = models.JSONField(default=dict, blank=True)  # timings, pages, errors
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
     class Meta:
         db_table = 'rag_document_store'
         ordering = ['-uploaded_at']
@@ -61,6 +75,7 @@ class QueryCache(models.Model):
     """Cache frequent queries"""
     query_hash = models.CharField(max_length=64, unique=True, db_index=True)
     query_text = models.TextField()
+    user_role = models.CharField(max_length=50, blank=True, default='')
     response = models.TextField()
     context = models.JSONField(default=dict)
     hit_count = models.IntegerField(default=0)
@@ -77,12 +92,14 @@ class QueryCache(models.Model):
 
 class RAGMetrics(models.Model):
     """Track RAG system performance"""
-    date = models.DateField(auto_now_add=True, unique=True)
+    # Set explicitly by the metrics recorder, which may flush a day's counters after midnight
+    date = models.DateField(default=timezone.localdate, unique=True)
     total_queries = models.IntegerField(default=0)
     successful_queries = models.IntegerField(default=0)
     failed_queries = models.IntegerField(default=0)
     avg_response_time = models.FloatField(default=0.0)
     total_tokens_used = models.IntegerField(default=0)
+    cache_hits = models.IntegerField(default=0)
     cache_hit_rate = models.FloatField(default=0.0)
     
     class Meta:
@@ -90,4 +107,21 @@ class RAGMetrics(models.Model):
         ordering = ['-date']
     
     def __str__(self):
-        return f"Metrics for {self.date}"
\ No newline at end of file
+        return f"Metrics for {self.date}"
+
+class RAGLatencyHistogram(models.Model):
+    """Per-day, per-query-type histogram of one stage's latency (ms) or token counts"""
+    date = models.DateField(db_index=True)
+    query_type = models.CharField(max_length=50)
+    metric = models.CharField(max_length=50)
+    histogram = models.JSONField(default=dict)
+    sample_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'rag_latency_histogram'
+        ordering = ['-date', 'query_type', 'metric']
+        unique_together = [('date', 'query_type', 'metric')]
+    
+    def __str__(self):
+        return f"{self.date} {self.query_type}/{self.metric} ({self.sample_count} samples)"
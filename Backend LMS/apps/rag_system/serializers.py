@@ -83,9 +83,13 @@ class DocumentStoreSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'document_type', 'file', 
             'uploaded_by', 'uploaded_by_username', 'uploaded_at',
-            'is_processed', 'vector_count', 'metadata'
+            'is_processed', 'vector_count', 'metadata',
+            'status', 'progress', 'chunk_count', 'processing_stats', 'processed_at'
+        ]
+        read_only_fields = [
+            'id', 'uploaded_by', 'uploaded_at', 'is_processed', 'vector_count',
+            'status', 'progress', 'chunk_count', 'processing_stats', 'processed_at'
         ]
-        read_only_fields = ['id', 'uploaded_by', 'uploaded_at', 'is_processed', 'vector_count']
 
 
 class ChatQuerySerializer(serializers.Serializer):
@@ -132,7 +136,7 @@ class RAGMetricsSerializer(serializers.ModelSerializer):
         fields = [
             'date', 'total_queries', 'successful_queries',
             'failed_queries', 'success_rate', 'avg_response_time',
-            'total_tokens_used', 'cache_hit_rate'
+            'total_tokens_used', 'cache_hits', 'cache_hit_rate'
         ]
     
     def get_success_rate(self, obj):
@@ -25,6 +25,7 @@ from .database_connector import DatabaseConnector
 from .pdf_reader import DocumentReader
 from .rag_service import VectorStoreRAGService
 from .orchestrator import VectorStoreOrchestrator
+from .engine import RAGEngine, get_rag_engine
 
 __all__ = [
     'GroqService',
@@ -33,4 +34,6 @@ __all__ = [
     'DocumentReader',
     'VectorStoreRAGService',
     'VectorStoreOrchestrator',
+    'RAGEngine',
+    'get_rag_engine',
 ]
\ No newline at end of file
@@ -37,7 +37,7 @@ Analyze the issue and suggest alternatives.
         ]
         
         try:
-            response = self.groq.client.chat.completions.create(
+            response = self.groq.complete(
                 model=self.groq.model,
                 messages=messages,
                 temperature=0.3,
@@ -0,0 +1,191 @@
+# ============================================
+# OFFLINE RAG BENCHMARK
+# File: apps/rag_system/services/benchmark.py
+# ============================================
+
+import asyncio
+import platform
+import random
+import time
+from typing import Dict, Iterator, List
+
+from .stage_timer import STAGES, StageTimer
+
+
+# Fixed question corpus: every query type the orchestrator routes, so a
+# regression in any path shows up in the numbers
+BENCHMARK_QUESTIONS = [
+    # database_query
+    "How many students are enrolled?",
+    "Show me all teachers",
+    "List students with pending fees",
+    "How many classes are there?",
+    "Show all exams",
+    "Count the vehicles on each route",
+    "List employees on leave",
+    "How many users have the admin role?",
+    # analytical
+    "What is the total fee collection?",
+    "Calculate average attendance",
+    "What is the average exam score?",
+    # column_query
+    "Students with attendance below 75 percent",
+    "Teachers by department",
+    # procedural
+    "How to register a new student?",
+    "What are the steps to generate a fee invoice?",
+    # factual
+    "What is the school's grading policy?",
+    "When does the next semester start?",
+    "Which subjects are taught in grade 10?",
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(samples: List[float]) -> Dict:
+    """p50/p95/p99/mean/max of millisecond samples"""
+    if not samples:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    return {
+        "count": len(samples),
+        "p50": round(percentile(samples, 50), 3),
+        "p95": round(percentile(samples, 95), 3),
+        "p99": round(percentile(samples, 99), 3),
+        "mean": round(sum(samples) / len(samples), 3),
+        "max": round(max(samples), 3),
+    }
+
+
+class StubGroqService:
+    """
+    Drop-in GroqService for benchmarks: no network, configurable latency.
+
+    Sleeps latency_ms (+/- uniform jitter_ms) per call and returns a
+    canned answer, so everything except the LLM runs for real and the
+    LLM stage is a known constant. Token counts are estimated at ~4
+    characters per token to keep tokens_used plausible.
+    """
+
+    def __init__(self, latency_ms: float = 800.0, jitter_ms: float = 0.0, seed: int = 42):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.model = "stub"
+        self._random = random.Random(seed)
+        self.calls = 0
+
+    def generate_response(self, query: str, context: List[str], system_prompt: str = None) -> Dict:
+        time.sleep(self._delay())
+        return self._result(query, context, system_prompt)
+
+    async def agenerate_response(self, query: str, context: List[str], system_prompt: str = None) -> Dict:
+        await asyncio.sleep(self._delay())
+        return self._result(query, context, system_prompt)
+
+    def generate_response_stream(self, query: str, context: List[str], system_prompt: str = None) -> Iterator[Dict]:
+        time.sleep(self._delay())
+        result = self._result(query, context, system_prompt)
+        for word in result["response"].split(" "):
+            yield {"type": "token", "content": word + " "}
+        yield {"type": "done", "success": True, "tokens_used": result["tokens_used"], "model": self.model}
+
+    def generate_intelligent_sql(self, query: str, table_context: Dict, fallback: bool = True) -> str:
+        time.sleep(self._delay())
+        self.calls += 1
+        return f"SELECT COUNT(*) AS count FROM {table_context['table_name']}"
+
+    def test_connection(self) -> bool:
+        return True
+
+    def stats(self) -> Dict:
+        return {"model": self.model, "calls": self.calls}
+
+    def _delay(self) -> float:
+        jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+    def _result(self, query: str, context: List[str], system_prompt: str = None) -> Dict:
+        self.calls += 1
+        prompt_chars = len(query) + len(system_prompt or "") + sum(len(item) for item in context or [])
+        response = f"Stub answer for: {query}"
+        return {
+            "success": True,
+            "response": response,
+            "tokens_used": prompt_chars // 4 + len(response) // 4,
+            "model": self.model,
+        }
+
+
+def run_benchmark(orchestrator, questions: List[str] = None, iterations: int = 3, warmup: int = 1,
+                  user_context: Dict = None) -> Dict:
+    """
+    Run every question `iterations` times through process_intelligent_query
+    after `warmup` untimed passes.
+
+    Caches are bypassed (use_cache=False) so each run does the full
+    pipeline. Returns a JSON-serialisable report with per-stage and total
+    latency percentiles in milliseconds.
+    """
+    questions = questions or BENCHMARK_QUESTIONS
+    user_context = user_context or {"user_id": 0, "user_type": "admin", "username": "benchmark"}
+
+    # Untimed passes load the model, fill OS caches and open DB connections
+    for _ in range(warmup):
+        for question in questions:
+            orchestrator.process_intelligent_query(question, user_context, use_cache=False)
+
+    stage_samples: Dict[str, List[float]] = {name: [] for name in STAGES}
+    totals, failures = [], 0
+    per_query: Dict[str, List[float]] = {}
+
+    for _ in range(iterations):
+        for question in questions:
+            started = time.perf_counter()
+            with StageTimer() as timer:
+                result = orchestrator.process_intelligent_query(question, user_context, use_cache=False)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+            totals.append(elapsed_ms)
+            per_query.setdefault(question, []).append(elapsed_ms)
+            if not result.get("success", False):
+                failures += 1
+            for name, ms in timer.as_ms().items():
+                stage_samples.setdefault(name, []).append(ms)
+
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "questions": len(questions),
+        "iterations": iterations,
+        "runs": len(totals),
+        "failures": failures,
+        "total_ms": summarize(totals),
+        "stages_ms": {name: summarize(samples) for name, samples in stage_samples.items()},
+        "per_query_p50_ms": {question: round(percentile(samples, 50), 3) for question, samples in per_query.items()},
+    }
+
+
+def compare_reports(baseline: Dict, current: Dict, tolerance: float = 0.2, metric: str = "p95") -> List[str]:
+    """Regressions of `metric` beyond `tolerance` (fractional) vs a baseline report"""
+    regressions = []
+    pairs = [("total", baseline.get("total_ms", {}), current.get("total_ms", {}))]
+    pairs += [
+        (name, baseline.get("stages_ms", {}).get(name, {}), stats)
+        for name, stats in current.get("stages_ms", {}).items()
+    ]
+    for name, before, after in pairs:
+        old, new = before.get(metric), after.get(metric)
+        if not old or new is None:
+            continue
+        if new > old * (1 + tolerance):
+            regressions.append(f"{name} {metric}: {old:.1f}ms -> {new:.1f}ms (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
@@ -0,0 +1,174 @@
+# ============================================
+# BM25 KEYWORD INDEX
+# File: apps/rag_system/services/bm25_index.py
+# ============================================
+
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+")
+STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in",
+    "is", "it", "of", "on", "or", "the", "to", "what", "which", "with",
+})
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase word tokens for BM25.
+
+    snake_case identifiers are kept whole and also split into their
+    parts, so "fee_invoices" matches both the exact table name and a
+    question that says "fee invoices".
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if "_" in token:
+            tokens.extend(part for part in token.split("_") if len(part) > 1 and part not in STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """
+    In-process BM25 (Okapi) index over the vector store's chunks.
+
+    Documents are keyed by the same chunk IDs as the Chroma collection
+    and keep their content and metadata, so keyword hits can be fused
+    with vector hits without another round-trip. Supports incremental
+    add/remove and persists as JSON next to the collection.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+        self._docs: Dict[str, Dict] = {}              # id -> {"content", "metadata", "length"}
+        self._postings: Dict[str, Dict[str, int]] = {}  # term -> {id: term frequency}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, doc_id: str, content: str, metadata: Dict = None):
+        with self._lock:
+            if doc_id in self._docs:
+                self._remove(doc_id)
+
+            terms = Counter(tokenize(content))
+            self._docs[doc_id] = {
+                "content": content,
+                "metadata": metadata or {},
+                "length": sum(terms.values()),
+                "terms": dict(terms),
+            }
+            self._total_length += self._docs[doc_id]["length"]
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[doc_id] = tf
+
+    def add_many(self, items: Iterable[Tuple[str, str, Dict]]):
+        with self._lock:
+            for doc_id, content, metadata in items:
+                self.add(doc_id, content, metadata)
+
+    def remove(self, doc_ids: Iterable[str]):
+        with self._lock:
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        doc = self._docs.get(doc_id)
+        if doc is None:
+            return None
+        return {"content": doc["content"], "metadata": doc["metadata"]}
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top k (doc_id, score) for a query"""
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._docs)
+            if not n or not terms:
+                return []
+            avg_length = self._total_length / n
+
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    length = self._docs[doc_id]["length"]
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+            self._postings.clear()
+            self._total_length = 0
+
+    def save(self, path: str):
+        """
+        Write the index atomically (postings are rebuilt on load).
+
+        Each writer dumps to its own temporary file in the target directory
+        and renames it over the index, so readers in other processes see
+        either the previous file or the complete new one.
+        """
+        with self._lock:
+            payload = {
+                "k1": self.k1,
+                "b": self.b,
+                "docs": {
+                    doc_id: {"content": doc["content"], "metadata": doc["metadata"]}
+                    for doc_id, doc in self._docs.items()
+                },
+            }
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)), prefix=".bm25_", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                json.dump(payload, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as file:
+            payload = json.load(file)
+        index = cls(k1=payload.get("k1", 1.5), b=payload.get("b", 0.75))
+        index.add_many(
+            (doc_id, doc["content"], doc["metadata"]) for doc_id, doc in payload.get("docs", {}).items()
+        )
+        return index
+
+    def _remove(self, doc_id: str):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self._total_length -= doc["length"]
+        for term in doc["terms"]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
@@ -0,0 +1,123 @@
+# ============================================
+# UPSTREAM CIRCUIT BREAKER
+# File: apps/rag_system/services/circuit_breaker.py
+# ============================================
+
+import threading
+import time
+from typing import Dict, Optional
+
+from .latency_histogram import LatencyHistogram
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one upstream service.
+
+    Closed: calls go through. After `failure_threshold` failures in a row
+    it opens and every call fails fast for `reset_timeout` seconds. Then
+    it is half-open: a single probe call is let through, which closes the
+    breaker on success or re-opens it on failure; a probe that ends with
+    neither (cancelled, interrupted) must be given back with release().
+    Call latencies are kept in a LatencyHistogram (ms) for status reporting.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+        self.latency = LatencyHistogram()
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def allow(self) -> bool:
+        """Whether a call may go out now (reserves the probe when half-open)"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self, seconds: float = None):
+        with self._lock:
+            self._record_call(seconds)
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def release(self):
+        """Give back a probe reserved by allow() whose call had no outcome"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self, seconds: float = None, error: Exception = None):
+        with self._lock:
+            self._record_call(seconds)
+            self.failures += 1
+            self._failures += 1
+            self.last_error = str(error)[:200] if error is not None else None
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.opened += 1
+                    print(f"⚠️ Circuit '{self.name}' opened after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            state = self._current_state()
+            retry_in = (
+                max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+                if state == self.OPEN else 0.0
+            )
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "retry_in_seconds": round(retry_in, 1),
+                "calls": self.calls,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "times_opened": self.opened,
+                "last_error": self.last_error,
+                "latency_ms": self.latency.summary(),
+            }
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def _record_call(self, seconds: Optional[float]):
+        self.calls += 1
+        if seconds is not None:
+            self.latency.record(seconds * 1000)
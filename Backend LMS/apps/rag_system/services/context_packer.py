@@ -0,0 +1,224 @@
+# ============================================
+# TOKEN-BUDGETED CONTEXT PACKING
+# File: apps/rag_system/services/context_packer.py
+# ============================================
+
+import re
+from typing import Dict, List, Optional
+
+from ..conf import rag_setting
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+    print("⚠️ tiktoken not installed. Prompt token counts will be estimated.")
+
+
+_WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+class TokenCounter:
+    """
+    Token counts for prompt budgeting.
+
+    Uses tiktoken's cl100k_base when installed. Groq's Llama models use a
+    different vocabulary, but cl100k is within a few percent on English
+    and SQL identifiers, which is plenty for a budget. Without tiktoken a
+    word/punctuation heuristic is used, biased slightly high so the budget
+    is not overshot.
+    """
+
+    def __init__(self, encoding_name: str = "cl100k_base"):
+        self.estimated = True
+        self._encoding = None
+        if TIKTOKEN_AVAILABLE:
+            try:
+                self._encoding = tiktoken.get_encoding(encoding_name)
+                self.estimated = False
+            except Exception as e:
+                print(f"⚠️ tiktoken encoding unavailable, estimating tokens: {e}")
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        # One token per word/punctuation piece, more for long identifiers, +10% margin
+        pieces = _WORD_PATTERN.findall(text)
+        return int(sum(1 + len(piece) // 8 for piece in pieces) * 1.1) + 1
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Longest prefix of `text` within max_tokens, cut at a word boundary"""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        max_tokens -= self.count("...")
+        if max_tokens <= 0:
+            return ""
+        if self._encoding is not None:
+            prefix = self._encoding.decode(self._encoding.encode(text, disallowed_special=())[:max_tokens])
+        else:
+            low, high = 0, len(text)
+            while low < high:
+                mid = (low + high + 1) // 2
+                if self.count(text[:mid]) <= max_tokens:
+                    low = mid
+                else:
+                    high = mid - 1
+            prefix = text[:low]
+        cut = prefix.rfind(" ")
+        return (prefix[:cut] if cut > len(prefix) // 2 else prefix).rstrip() + "..."
+
+
+class PackedContext:
+    """Context list for the LLM plus the accounting behind it"""
+
+    def __init__(self, context: List[str], budget: int, tokens_used: int, tokens_candidate: int,
+                 chunks_used: int, chunks_dropped: int, duplicates_removed: int, estimated: bool):
+        self.context = context
+        self.budget = budget
+        self.tokens_used = tokens_used
+        self.tokens_candidate = tokens_candidate
+        self.chunks_used = chunks_used
+        self.chunks_dropped = chunks_dropped
+        self.duplicates_removed = duplicates_removed
+        self.estimated = estimated
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.tokens_candidate - self.tokens_used)
+
+    def stats(self) -> Dict:
+        return {
+            "budget": self.budget,
+            "tokens_used": self.tokens_used,
+            "tokens_saved": self.tokens_saved,
+            "chunks_used": self.chunks_used,
+            "chunks_dropped": self.chunks_dropped,
+            "duplicates_removed": self.duplicates_removed,
+            "estimated": self.estimated,
+        }
+
+
+class ContextPacker:
+    """
+    Fills a token budget with the most relevant, non-redundant context.
+
+    Search results are taken in relevance order (RRF score, then vector
+    score). Sentences already sent (e.g. the overlap between neighbouring
+    chunks of one document) are removed, and a chunk that is mostly
+    repeats is dropped. Exact query results (facts) go first, capped at
+    half the budget. Budget for the schema facts is reserved next because
+    they are small and carry exact counts; the block itself is built after
+    the sources and appended last, leaving out columns that a packed table
+    document already lists. The last chunk that does not fit is truncated
+    if a useful amount of budget is left.
+    """
+
+    MIN_CHUNK_TOKENS = 48        # don't bother sending a truncated stub shorter than this
+    MIN_CHUNK_CHARS = 50         # same cut-off as the old context builder
+    DUPLICATE_THRESHOLD = 0.8    # drop a chunk when this share of its sentences were already sent
+
+    def __init__(self, budget: int = None, counter: TokenCounter = None):
+        self.budget = budget or rag_setting('CONTEXT_TOKEN_BUDGET')
+        self.counter = counter or TokenCounter()
+
+    def pack(self, search_results: List[Dict], schema_info: Optional[Dict] = None,
+             facts: Optional[str] = None) -> PackedContext:
+        schema_info = schema_info or {}
+        ranked = sorted(
+            (r for r in search_results if len(r.get("content") or "") > self.MIN_CHUNK_CHARS),
+            key=lambda r: (r.get("rrf_score", 0.0), r.get("score", 0.0)),
+            reverse=True
+        )
+
+        tokens_candidate = sum(self.counter.count(r["content"]) for r in ranked)
+        remaining = self.budget
+        duplicates = 0
+
+        facts_block = ""
+        if facts:
+            tokens_candidate += self.counter.count(facts)
+            facts_block = self.counter.truncate(facts, remaining // 2)
+            remaining -= self.counter.count(facts_block)
+
+        # Reserve room for the full schema block; deduplicating can only shrink it
+        full_schema, schema_candidate = self._schema_block(schema_info, {})
+        tokens_candidate += schema_candidate
+        schema_reserved = self.counter.count(self.counter.truncate(full_schema, remaining)) if full_schema else 0
+        remaining -= schema_reserved
+
+        # Columns listed by the table documents actually sent
+        listed_columns: Dict[str, set] = {}
+        seen_sentences = set()
+        sources = []
+        dropped = 0
+        for result in ranked:
+            sentences = [s for s in _SENTENCE_SPLIT.split(result["content"]) if s.strip()]
+            fresh = [s for s in sentences if self._normalize(s) not in seen_sentences]
+            if sentences and len(fresh) <= len(sentences) * (1 - self.DUPLICATE_THRESHOLD):
+                duplicates += 1
+                continue
+            if len(fresh) < len(sentences):
+                duplicates += 1
+
+            context_type = (result.get("metadata") or {}).get("type", "unknown")
+            body = result["content"] if len(fresh) == len(sentences) else "\n".join(fresh)
+            header = f"[Source {len(sources) + 1} - {context_type}]\n"
+            cost = self.counter.count(header + body)
+            if cost > remaining:
+                if remaining - self.counter.count(header) < self.MIN_CHUNK_TOKENS:
+                    dropped += 1
+                    continue
+                body = self.counter.truncate(body, remaining - self.counter.count(header))
+                cost = self.counter.count(header + body)
+
+            sources.append(header + body)
+            remaining -= cost
+            seen_sentences.update(self._normalize(s) for s in fresh)
+            table = (result.get("metadata") or {}).get("table_name")
+            if table:
+                listed_columns.setdefault(table, set()).update(re.findall(r"\w+", body))
+
+        remaining += schema_reserved
+        schema_block = ""
+        if full_schema:
+            schema_block = self.counter.truncate(self._schema_block(schema_info, listed_columns)[0], remaining)
+            remaining -= self.counter.count(schema_block)
+
+        context = ([facts_block] if facts_block else []) + sources + ([schema_block] if schema_block else [])
+        return PackedContext(
+            context=context,
+            budget=self.budget,
+            tokens_used=self.budget - remaining,
+            tokens_candidate=tokens_candidate,
+            chunks_used=len(sources),
+            chunks_dropped=dropped,
+            duplicates_removed=duplicates,
+            estimated=self.counter.estimated,
+        )
+
+    def _schema_block(self, schema_info: Dict, listed_columns: Dict[str, set]):
+        """(compact schema block, token count of the undeduplicated block)"""
+        if not schema_info:
+            return "", 0
+
+        full = ["[Database Schema Information]"]
+        lines = ["[Database Schema Information]"]
+        for table, info in schema_info.items():
+            columns = list(info.get("columns", []))[:8]
+            fact = f"• Table: {table} ({info.get('row_count', 0)} records, entity: {info.get('entity_type', 'unknown')})"
+            full.append(f"{fact}\n  Columns: {', '.join(columns)}")
+
+            new_columns = [c for c in columns if c not in listed_columns.get(table, ())]
+            lines.append(f"{fact}\n  Columns: {', '.join(new_columns)}" if new_columns else fact)
+
+        return "\n".join(lines), self.counter.count("\n".join(full))
+
+    @staticmethod
+    def _normalize(sentence: str) -> str:
+        return " ".join(sentence.lower().split())
@@ -1062,6 +1062,10 @@ from django.db import connection
 from typing import List, Dict, Optional
 import re
 
+from .query_matcher import ENTITY_TABLES, SYSTEM_TABLE_PREFIXES, is_junction_table, match_query, table_entity
+from .schema_snapshot import SchemaSnapshot
+from .table_stats import table_stats
+
 
 class DatabaseConnector:
     """Enhanced connector for mixed table naming with PostgreSQL"""
@@ -1071,8 +1075,16 @@ class DatabaseConnector:
         self._table_mapping = None
         self._all_tables_cache = None
     
+    def get_schema_snapshot(self) -> SchemaSnapshot:
+        """Shared snapshot of all public tables, columns, FKs and row estimates"""
+        return table_stats.get_snapshot()
+    
     def get_all_tables(self) -> List[str]:
         """Get all tables from PostgreSQL"""
+        snapshot = self.get_schema_snapshot()
+        if snapshot.tables:
+            return snapshot.table_names
+        
         if self._all_tables_cache is not None:
             return self._all_tables_cache
             
@@ -1104,113 +1116,11 @@ class DatabaseConnector:
         entity_lower = entity_type.lower()
         all_tables = self.get_all_tables()
         
-        # Direct mapping based on your actual tables
-        direct_map = {
-            # User-related
-            'user': ['users_user', 'auth_user'],
-            'users': ['users_user', 'auth_user'],
-            
-            # Student-related
-            'student': ['students', 'student_behavior', 'student_discounts'],
-            'students': ['students', 'student_behavior', 'student_discounts'],
-            
-            # Teacher-related
-            'teacher': ['teachers', 'teachers_teacher'],
-            'teachers': ['teachers', 'teachers_teacher'],
-            
-            # Role-related
-            'role': ['users_role', 'users_role_permissions', 'auth_group'],
-            'roles': ['users_role', 'users_role_permissions', 'auth_group'],
-            
-            # Parent-related
-            'parent': ['parents', 'parents_students'],
-            'parents': ['parents', 'parents_students'],
-            
-            # Class-related
-            'class': ['classes', 'class_subjects'],
-            'classes': ['classes', 'class_subjects'],
-            
-            # Subject-related
-            'subject': ['subjects', 'class_subjects'],
-            'subjects': ['subjects', 'class_subjects'],
-            
-            # Vehicle-related
-            'vehicle': ['vehicles'],
-            'vehicles': ['vehicles'],
-            
-            # Route-related
-            'route': ['routes'],
-            'routes': ['routes'],
-            
-            # Exam-related
-            'exam': ['exams', 'exam_results', 'exam_schedules', 'exam_types'],
-            'exams': ['exams', 'exam_results', 'exam_schedules', 'exam_types'],
-            
-            # Fee-related
-            'fee': ['fee_invoices', 'fee_payments', 'fee_structures', 'fee_types'],
-            'fees': ['fee_invoices', 'fee_payments', 'fee_structures', 'fee_types'],
-            
-            # Attendance-related
-            'attendance': ['daily_attendance', 'attendance_summary', 'attendance_configuration'],
-            
-            # Book/Library-related
-            'book': ['images_images', 'images_categories'],
-            'books': ['images_images', 'images_categories'],
-            
-            # Employee-related
-            'employee': ['users_employee'],
-            'employees': ['users_employee'],
-            
-            # Permission-related
-            'permission': ['users_permission', 'auth_permission'],
-            'permissions': ['users_permission', 'auth_permission'],
-            
-            # Assignment-related
-            'assignment': ['assignments', 'assignment_submissions'],
-            'assignments': ['assignments', 'assignment_submissions'],
-            
-            # Leave-related
-            'leave': ['leave_applications', 'leave_balances', 'leave_types'],
-            'leaves': ['leave_applications', 'leave_balances', 'leave_types'],
-            
-            # Message-related
-            'message': ['messages'],
-            'messages': ['messages'],
-            
-            # Notification-related
-            'notification': ['notifications'],
-            'notifications': ['notifications'],
-            
-            # Department-related
-            'department': ['departments'],
-            'departments': ['departments'],
-            
-            # Course-related
-            'course': ['courses', 'course_enrollments'],
-            'courses': ['courses', 'course_enrollments'],
-            
-            # Quiz-related
-            'quiz': ['quizzes', 'quiz_answers', 'quiz_attempts'],
-            'quizzes': ['quizzes', 'quiz_answers', 'quiz_attempts'],
-            
-            # Timetable-related
-            'timetable': ['timetables', 'time_slots'],
-            'timetables': ['timetables', 'time_slots'],
-            
-            # Certificate-related
-            'certificate': ['certificates', 'certificate_templates'],
-            'certificates': ['certificates', 'certificate_templates'],
-        }
-        
-        # Try direct mapping first
-        if entity_lower in direct_map:
-            possible_tables = direct_map[entity_lower]
-            
-            # Find which table actually exists
-            for table in possible_tables:
-                if table in all_tables:
-                    print(f"✅ Direct map: '{entity_lower}' → '{table}'")
-                    return table
+        # Try the known tables for the entity first
+        for table in ENTITY_TABLES.get(entity_lower, []):
+            if table in all_tables:
+                print(f"✅ Direct map: '{entity_lower}' → '{table}'")
+                return table
         
         # If not found, try pattern matching
         return self._find_table_by_pattern(entity_lower, query, all_tables)
@@ -1270,56 +1180,33 @@ class DatabaseConnector:
     
     def _is_junction_table(self, table_name: str) -> bool:
         """Check if table is a junction/mapping table"""
-        table_lower = table_name.lower()
-        
-        junction_indicators = [
-            '_permissions', '_groups_', 'permission', 'token',
-            'blacklist', 'log', 'migration', 'session', 'admin'
-        ]
-        
-        return any(indicator in table_lower for indicator in junction_indicators)
+        return is_junction_table(table_name)
     
     def get_table_columns(self, table_name: str) -> List[Dict]:
         """Get columns for a table"""
-        with self.connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT 
-                    column_name, 
-                    data_type, 
-                    is_nullable,
-                    column_default
-                FROM information_schema.columns 
-                WHERE table_name = %s
-                ORDER BY ordinal_position;
-            """, [table_name])
-            
-            columns = []
-            for row in cursor.fetchall():
-                columns.append({
-                    "name": row[0],
-                    "type": row[1],
-                    "nullable": row[2] == 'YES',
-                    "default": row[3]
-                })
-            
-            return columns
+        return table_stats.get_columns(table_name)
     
-    def get_table_schema_info(self, table_name: str) -> Dict:
-        """Get comprehensive schema information"""
+    def get_table_schema_info(self, table_name: str, exact_count: bool = False) -> Dict:
+        """
+        Get comprehensive schema information
+        
+        Row counts are planner estimates unless exact_count=True
+        ("row_count_estimated" says which one you got).
+        """
         try:
             columns = self.get_table_columns(table_name)
             column_names = [col["name"] for col in columns]
             
             # Get row count
-            with self.connection.cursor() as cursor:
-                cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-                row_count = cursor.fetchone()[0]
+            count = table_stats.get_row_count(table_name, exact=exact_count)
             
             return {
                 "table_name": table_name,
                 "columns": column_names,
                 "column_details": columns,
-                "row_count": row_count,
+                "row_count": count["row_count"],
+                "row_count_estimated": count["estimated"],
+                "foreign_keys": self.get_schema_snapshot().foreign_keys(table_name),
                 "entity_type": self._guess_entity_type(table_name, column_names)
             }
         except Exception as e:
@@ -1332,107 +1219,62 @@ class DatabaseConnector:
     
     def _guess_entity_type(self, table_name: str, columns: List[str]) -> str:
         """Guess entity type from table name and columns"""
-        table_lower = table_name.lower()
-        
-        entity_patterns = {
-            "user": ["user", "account"],
-            "student": ["student", "pupil"],
-            "teacher": ["teacher", "instructor"],
-            "role": ["role", "permission"],
-            "class": ["class", "grade", "section"],
-            "subject": ["subject", "course"],
-            "exam": ["exam", "test", "result"],
-            "fee": ["fee", "payment", "invoice"],
-            "attendance": ["attendance"],
-            "vehicle": ["vehicle", "transport"],
-            "route": ["route"],
-            "parent": ["parent", "guardian"],
-            "employee": ["employee", "staff"],
-            "assignment": ["assignment"],
-            "leave": ["leave"],
-            "department": ["department"],
-            "quiz": ["quiz"],
-            "certificate": ["certificate"]
-        }
-        
-        for entity, keywords in entity_patterns.items():
-            for keyword in keywords:
-                if keyword in table_lower:
-                    return entity
-        
-        return "unknown"
+        return table_entity(table_name)
     
-    def execute_query(self, sql: str, params: tuple = None) -> List[Dict]:
-        """Execute SQL query and return results as list of dicts"""
+    def execute_query(self, sql: str, params: tuple = None, max_rows: int = None) -> List[Dict]:
+        """
+        Execute a SELECT and return results as list of dicts.
+        
+        Runs through SafeSQLExecutor: read-only, statement_timeout, cost
+        check and at most max_rows (default SQL_MAX_ROWS) rows.
+        """
+        # Imported here: sql_executor imports utils, which imports this module
+        from .sql_executor import SafeSQLExecutor
+        
         try:
-            with self.connection.cursor() as cursor:
-                cursor.execute(sql, params)
-                
-                # Get column names
-                columns = [col[0] for col in cursor.description]
-                
-                # Fetch results
-                results = []
-                for row in cursor.fetchall():
-                    results.append(dict(zip(columns, row)))
-                
-                return results
+            return SafeSQLExecutor(self.connection).execute(sql, params, max_rows).as_dicts()
         except Exception as e:
             print(f"❌ Query execution error: {e}")
             print(f"   SQL: {sql}")
             return []
     
     def get_schema_info(self) -> Dict:
-        """Get schema information for all tables"""
-        all_tables = self.get_all_tables()
+        """Get schema information for all tables (from the snapshot, no per-table queries)"""
+        snapshot = self.get_schema_snapshot()
         schema = {}
         
-        for table in all_tables:
+        for table in snapshot.table_names:
             # Skip system tables
-            if any(skip in table.lower() for skip in ['django_', 'auth_permission', 'token_blacklist']):
+            if table.lower().startswith(SYSTEM_TABLE_PREFIXES):
                 continue
             
-            schema[table] = self.get_table_schema_info(table)
+            column_names = snapshot.columns(table)
+            row_estimate = snapshot.row_estimate(table)
+            schema[table] = {
+                "table_name": table,
+                "columns": column_names,
+                "column_details": snapshot.column_details(table),
+                "foreign_keys": snapshot.foreign_keys(table),
+                "row_count": row_estimate or 0,
+                "row_count_estimated": True,
+                "entity_type": self._guess_entity_type(table, column_names)
+            }
         
         return schema
     
     def discover_relevant_tables(self, query: str) -> List[str]:
         """Discover which tables are relevant to the query"""
-        all_tables = self.get_all_tables()
+        snapshot = self.get_schema_snapshot()
+        all_tables = snapshot.table_names or self.get_all_tables()
         query_lower = query.lower()
         
-        # Map keywords to entity types
-        keyword_map = {
-            'user': ['user', 'account', 'profile', 'auth'],
-            'student': ['student', 'pupil', 'learner'],
-            'teacher': ['teacher', 'instructor', 'faculty', 'staff'],
-            'parent': ['parent', 'guardian'],
-            'class': ['class', 'grade', 'section'],
-            'subject': ['subject', 'course', 'discipline'],
-            'exam': ['exam', 'test', 'assessment', 'result'],
-            'fee': ['fee', 'payment', 'invoice', 'billing'],
-            'attendance': ['attendance', 'present', 'absent'],
-            'vehicle': ['vehicle', 'bus', 'transport'],
-            'route': ['route', 'path'],
-            'assignment': ['assignment', 'homework', 'submission'],
-            'leave': ['leave', 'absence', 'vacation'],
-            'employee': ['employee', 'staff', 'worker'],
-            'department': ['department', 'division'],
-            'quiz': ['quiz', 'test', 'question'],
-            'certificate': ['certificate', 'credential'],
-            'timetable': ['timetable', 'schedule', 'time_slot'],
-            'message': ['message', 'notification', 'announcement'],
-        }
-        
         relevant_tables = []
         
-        # Find relevant entity types
-        for entity, keywords in keyword_map.items():
-            if any(keyword in query_lower for keyword in keywords):
-                # Find matching tables
-                table_name = self.get_actual_table_name(entity, query)
-                if table_name and table_name not in relevant_tables:
-                    relevant_tables.append(table_name)
+        # Entities the query mentions (one precompiled pass, cached per query)
+        for entity in match_query(query).table_entities:
+            table_name = self.get_actual_table_name(entity, query)
+            if table_name and table_name not in relevant_tables:
+                relevant_tables.append(table_name)
         
         # If no specific matches, search broadly
         if not relevant_tables:
@@ -1443,5 +1285,15 @@ class DatabaseConnector:
                     if not self._is_junction_table(table):
                         relevant_tables.append(table)
         
+        # Still nothing: match query words against column names, biggest tables first
+        if not relevant_tables and snapshot.tables:
+            query_words = [w for w in query_lower.split() if len(w) > 3]
+            by_size = sorted(all_tables, key=lambda t: snapshot.row_estimate(t) or 0, reverse=True)
+            for table in by_size:
+                if self._is_junction_table(table):
+                    continue
+                if any(word in column.lower() for column in snapshot.columns(table) for word in query_words):
+                    relevant_tables.append(table)
+        
         print(f"🎯 Relevant tables for '{query}': {relevant_tables}")
         return relevant_tables[:5]  # Limit to top 5 tables
\ No newline at end of file
@@ -0,0 +1,179 @@
+# ============================================
+# EMBEDDING CACHE
+# File: apps/rag_system/services/embedding_cache.py
+# ============================================
+
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LRU cache in front of an embedding model.
+
+    Keys are sha256(model name + text), so switching models never serves
+    stale vectors. Vectors live in memory as float32 arrays; an optional
+    SQLite file keeps them across restarts and is shared by all workers.
+    The file holds at most max_disk_entries rows: once an insert takes it
+    past that, the oldest rows (by insertion order) are deleted. Hot
+    vectors sit in the memory LRU, so an evicted row only costs a re-embed.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        max_entries: int = 10000,
+        disk_path: Optional[str] = None,
+        max_disk_entries: int = 200000
+    ):
+        self.underlying = embeddings
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.max_disk_entries = max_disk_entries
+
+        self._memory: "OrderedDict[str, array]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        # Rows in the SQLite file as of our last count (other workers add to it too)
+        self._disk_rows = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_pruned = 0
+
+        if disk_path:
+            self._open_disk_tier(disk_path)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        vectors: List[Optional[List[float]]] = [self._get(key) for key in keys]
+
+        # Embed each distinct missing text once, in one batch
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], texts[i])
+
+        if missing:
+            computed = self.underlying.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), computed))
+            self._put_many(fresh)
+            vectors = [vector if vector is not None else list(fresh[keys[i]]) for i, vector in enumerate(vectors)]
+
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self._get(key)
+        if vector is None:
+            vector = self.underlying.embed_query(text)
+            self._put_many({key: vector})
+        return list(vector)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "model": self.model_name,
+            "memory_entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups * 100, 2) if lookups else 0.0,
+            "disk_path": self.disk_path,
+            "disk_entries": self._disk_rows,
+            "max_disk_entries": self.max_disk_entries,
+            "disk_pruned": self.disk_pruned,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+                self._disk_rows = 0
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\x00{text}".encode()).hexdigest()
+
+    def _get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return list(vector)
+
+            if self._db is not None:
+                row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    vector = array('f')
+                    vector.frombytes(row[0])
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return list(vector)
+
+            self.misses += 1
+            return None
+
+    def _put_many(self, vectors: Dict[str, List[float]]):
+        packed = {key: array('f', vector) for key, vector in vectors.items()}
+        with self._lock:
+            for key, vector in packed.items():
+                self._remember(key, vector)
+            if self._db is not None:
+                try:
+                    inserted = self._db.executemany(
+                        "INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)",
+                        [(key, vector.tobytes()) for key, vector in packed.items()]
+                    ).rowcount
+                    self._disk_rows += max(inserted, 0)
+                    if self._disk_rows > self.max_disk_entries:
+                        self._prune_disk()
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    print(f"⚠️ Embedding disk cache write failed: {e}")
+
+    def _remember(self, key: str, vector: array):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _prune_disk(self):
+        """Delete the oldest rows beyond max_disk_entries (lock held, caller commits)"""
+        count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_disk_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY rowid LIMIT ?)",
+                (excess,)
+            )
+            self.disk_pruned += excess
+        self._disk_rows = count - max(excess, 0)
+
+    def _open_disk_tier(self, path: str):
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            # Files written before the size cap existed may already be over it
+            self._prune_disk()
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ Embedding disk cache unavailable ({path}): {e}")
+            self._db = None
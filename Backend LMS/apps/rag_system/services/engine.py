@@ -0,0 +1,160 @@
+# ============================================
+# PROCESS-WIDE RAG ENGINE
+# File: apps/rag_system/services/engine.py
+# ============================================
+
+import atexit
+import threading
+import time
+from typing import Dict, Optional
+
+from ..conf import rag_setting
+
+
+class RAGEngine:
+    """
+    Holds one shared set of RAG components per worker process.
+
+    DRF builds a new viewset for every request, so anything cached on the
+    view is rebuilt each time. The engine owns the embedding model, Chroma
+    client, GROQ client and database connector instead, and hands the same
+    instances to every endpoint and Celery task in the process.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._orchestrator = None
+        self.started_at: Optional[float] = None
+        self.startup_time: float = 0.0
+
+    @property
+    def is_started(self) -> bool:
+        return self._orchestrator is not None
+
+    def start(self):
+        """Build the components once (thread-safe, idempotent)"""
+        if self._orchestrator is not None:
+            return self
+
+        with self._lock:
+            if self._orchestrator is not None:
+                return self
+
+            from .groq_service import GroqService
+            from .database_connector import DatabaseConnector
+            from .vectorstore_service import VectorStoreService
+            from .rag_service import VectorStoreRAGService
+            from .orchestrator import VectorStoreOrchestrator
+
+            print("🚀 Starting shared RAG engine...")
+            start = time.time()
+
+            groq_service = GroqService()
+            db_connector = DatabaseConnector()
+            vectorstore = VectorStoreService(
+                persist_directory=str(rag_setting('VECTOR_STORE_PATH')),
+                db_connector=db_connector
+            )
+            rag_service = VectorStoreRAGService(
+                groq_service=groq_service,
+                vectorstore=vectorstore,
+                db_connector=db_connector
+            )
+            self._orchestrator = VectorStoreOrchestrator(
+                rag_service=rag_service,
+                groq_service=groq_service,
+                db_connector=db_connector
+            )
+
+            self.started_at = time.time()
+            self.startup_time = self.started_at - start
+            print(f"✅ Shared RAG engine ready in {self.startup_time:.2f}s")
+
+        return self
+
+    def warmup(self):
+        """Start the engine and run one embedding so model weights are paged in"""
+        self.start()
+        try:
+            # Bypass the embedding cache: a cached vector would skip the model
+            embeddings = self.vectorstore.embeddings
+            getattr(embeddings, 'underlying', embeddings).embed_query("warmup")
+        except Exception as e:
+            print(f"⚠️ RAG engine warmup embedding failed: {e}")
+        return self
+
+    def shutdown(self):
+        """Drop all components; the next access starts a fresh engine"""
+        with self._lock:
+            if self._orchestrator is None:
+                return
+            print("🛑 Shutting down shared RAG engine...")
+            self._orchestrator = None
+            self.started_at = None
+        
+        # Buffered chat history / metrics must not be lost with the worker
+        from .metrics_recorder import flush_metrics
+        flush_metrics()
+
+    @property
+    def orchestrator(self):
+        return self.start()._orchestrator
+
+    @property
+    def rag_service(self):
+        return self.orchestrator.rag_service
+
+    @property
+    def vectorstore(self):
+        return self.rag_service.vectorstore
+
+    @property
+    def db_connector(self):
+        return self.rag_service.db_connector
+
+    @property
+    def groq_service(self):
+        return self.rag_service.groq_service
+
+    def status(self) -> Dict:
+        """Engine lifecycle information for status endpoints"""
+        return {
+            "started": self.is_started,
+            "uptime_seconds": round(time.time() - self.started_at, 1) if self.started_at else 0,
+            "startup_time": round(self.startup_time, 2)
+        }
+
+
+_engine: Optional[RAGEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_rag_engine() -> RAGEngine:
+    """Return the process-wide engine (components are built on first use)"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RAGEngine()
+                atexit.register(_engine.shutdown)
+    return _engine
+
+
+def warmup_rag_engine() -> RAGEngine:
+    """Eagerly start the engine, e.g. from a worker start hook"""
+    return get_rag_engine().warmup()
+
+
+def warmup_if_configured():
+    """Warm the engine when RAG_SETTINGS['WARMUP_ON_STARTUP'] is enabled"""
+    if rag_setting('WARMUP_ON_STARTUP'):
+        try:
+            warmup_rag_engine()
+        except Exception as e:
+            print(f"⚠️ RAG engine warmup failed: {e}")
+
+
+def shutdown_rag_engine():
+    """Release the engine, e.g. from a worker shutdown hook"""
+    if _engine is not None:
+        _engine.shutdown()
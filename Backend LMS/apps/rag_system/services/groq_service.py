@@ -336,11 +336,88 @@
 # Groq Service code
 
 
-from groq import Groq
+from groq import Groq, AsyncGroq, APIConnectionError, APIStatusError, InternalServerError, RateLimitError
 from decouple import config
-from typing import List, Dict
+from typing import List, Dict, Iterator
+import asyncio
+import httpx
 import json
 import os
+import random
+import threading
+import time
+import weakref
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from ..conf import rag_setting
+
+
+# Connection errors, timeouts, 429s and 5xx: retried, and counted by the breaker
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)
+MAX_RETRY_DELAY = 10.0  # seconds
+
+ERROR_RESPONSE = "Sorry, I encountered an error processing your request. Please try again."
+DEGRADED_RESPONSE = "The AI assistant is temporarily unavailable. Please try again in a moment."
+
+_client_lock = threading.Lock()
+_clients: Dict[str, Groq] = {}
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> {api_key: AsyncGroq}
+_breaker = None
+
+
+def _http_settings() -> Dict:
+    return {
+        "timeout": httpx.Timeout(rag_setting('GROQ_READ_TIMEOUT'), connect=rag_setting('GROQ_CONNECT_TIMEOUT')),
+        "limits": httpx.Limits(
+            max_connections=rag_setting('GROQ_MAX_CONNECTIONS'),
+            max_keepalive_connections=rag_setting('GROQ_MAX_CONNECTIONS'),
+        ),
+    }
+
+
+def shared_groq_client(api_key: str) -> Groq:
+    """Process-wide GROQ client over one keep-alive connection pool"""
+    with _client_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            http = _http_settings()
+            client = _clients[api_key] = Groq(
+                api_key=api_key,
+                timeout=http["timeout"],
+                max_retries=0,  # GroqService retries, under the circuit breaker
+                http_client=httpx.Client(**http),
+            )
+        return client
+
+
+def shared_async_groq_client(api_key: str) -> AsyncGroq:
+    """AsyncGroq for the running event loop (httpx async pools are loop-specific)"""
+    loop = asyncio.get_running_loop()
+    with _client_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(api_key)
+        if client is None:
+            http = _http_settings()
+            client = clients[api_key] = AsyncGroq(
+                api_key=api_key,
+                timeout=http["timeout"],
+                max_retries=0,
+                http_client=httpx.AsyncClient(**http),
+            )
+        return client
+
+
+def groq_breaker() -> CircuitBreaker:
+    """Circuit breaker shared by every GroqService in the process"""
+    global _breaker
+    if _breaker is None:
+        with _client_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    "groq",
+                    failure_threshold=rag_setting('GROQ_BREAKER_FAILURES'),
+                    reset_timeout=rag_setting('GROQ_BREAKER_RESET'),
+                )
+    return _breaker
 
 
 class GroqService:
@@ -355,7 +432,10 @@ class GroqService:
             if not api_key:
                 raise ValueError("GROQ_API_KEY not found in environment variables")
             
-            self.client = Groq(api_key=api_key)
+            self._api_key = api_key
+            self.client = shared_groq_client(api_key)
+            self.breaker = groq_breaker()
+            self.max_retries = rag_setting('GROQ_MAX_RETRIES')
             
             # ✅ UPDATED MODEL (not deprecated)
             self.model = "llama-3.3-70b-versatile"
@@ -382,7 +462,219 @@ class GroqService:
         Returns:
             Dict with response, success status, tokens used
         """
+        messages = self._build_messages(query, context, system_prompt)
+        
+        try:
+            # Call GROQ API
+            response = self.complete(
+                model=self.model,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=2048,
+                top_p=0.9,
+            )
+            
+            # Extract response
+            answer = response.choices[0].message.content
+            tokens = response.usage.total_tokens
+            
+            print(f"✅ GROQ response generated ({tokens} tokens)")
+            
+            return {
+                "success": True,
+                "response": answer,
+                "tokens_used": tokens,
+                "model": self.model
+            }
+            
+        except Exception as e:
+            print(f"❌ GROQ API Error: {e}")
+            return self._failure(e)
+    
+    async def agenerate_response(
+        self, 
+        query: str, 
+        context: List[str], 
+        system_prompt: str = None
+    ) -> Dict:
+        """Async variant of generate_response (does not block a worker thread)"""
+        messages = self._build_messages(query, context, system_prompt)
+        
+        try:
+            response = await self.acomplete(
+                model=self.model,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=2048,
+                top_p=0.9,
+            )
+            
+            answer = response.choices[0].message.content
+            tokens = response.usage.total_tokens
+            
+            print(f"✅ GROQ async response generated ({tokens} tokens)")
+            
+            return {
+                "success": True,
+                "response": answer,
+                "tokens_used": tokens,
+                "model": self.model
+            }
+            
+        except Exception as e:
+            print(f"❌ GROQ async API Error: {e}")
+            return self._failure(e)
+    
+    def complete(self, **params):
+        """
+        chat.completions.create with bounded, jittered retries.
+        
+        Every attempt goes through the shared circuit breaker: while it is
+        open this raises CircuitOpenError without touching the network.
+        Only connection errors, timeouts, 429s and 5xx are retried. An
+        attempt cut short by cancellation or an interrupt is not counted,
+        but gives back the half-open probe it may hold.
+        """
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError("GROQ is unavailable (circuit open)")
+            started = time.perf_counter()
+            try:
+                response = self.client.chat.completions.create(**params)
+            except Exception as e:
+                if not self._record_error(e, time.perf_counter() - started, attempt):
+                    raise
+                time.sleep(self._backoff(attempt, e))
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                self.breaker.record_success(time.perf_counter() - started)
+                return response
+    
+    async def acomplete(self, **params):
+        """Async variant of complete()"""
+        client = shared_async_groq_client(self._api_key)
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError("GROQ is unavailable (circuit open)")
+            started = time.perf_counter()
+            try:
+                response = await client.chat.completions.create(**params)
+            except Exception as e:
+                if not self._record_error(e, time.perf_counter() - started, attempt):
+                    raise
+                await asyncio.sleep(self._backoff(attempt, e))
+            except BaseException:
+                # asyncio.CancelledError (client disconnected, request timeout)
+                self.breaker.release()
+                raise
+            else:
+                self.breaker.record_success(time.perf_counter() - started)
+                return response
+    
+    def _record_error(self, error: Exception, seconds: float, attempt: int) -> bool:
+        """Report a failed attempt to the breaker; True if it should be retried"""
+        if isinstance(error, APIStatusError) and not isinstance(error, RETRYABLE_ERRORS):
+            # GROQ answered; the request itself was rejected (bad request, auth, ...)
+            self.breaker.record_success(seconds)
+            return False
+        
+        self.breaker.record_failure(seconds, error)
+        if not isinstance(error, RETRYABLE_ERRORS) or attempt >= self.max_retries:
+            return False
+        print(f"⚠️ GROQ call failed ({error.__class__.__name__}), retry {attempt + 1}/{self.max_retries}")
+        return True
+    
+    @staticmethod
+    def _backoff(attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff; a 429's Retry-After is honoured up to MAX_RETRY_DELAY"""
+        delay = random.uniform(0, rag_setting('GROQ_RETRY_BACKOFF') * 2 ** attempt)
+        response = getattr(error, 'response', None)
+        try:
+            retry_after = float(response.headers.get('retry-after', 0)) if response is not None else 0.0
+        except (TypeError, ValueError):
+            retry_after = 0.0
+        return min(max(delay, retry_after), MAX_RETRY_DELAY)
+    
+    @staticmethod
+    def _failure(error: Exception) -> Dict:
+        """Result dict for a failed call; upstream outages are flagged as degraded"""
+        degraded = isinstance(error, (CircuitOpenError,) + RETRYABLE_ERRORS)
+        return {
+            "success": False,
+            "degraded": degraded,
+            "error": str(error),
+            "response": DEGRADED_RESPONSE if degraded else ERROR_RESPONSE,
+            "tokens_used": 0
+        }
+    
+    def stats(self) -> Dict:
+        """Upstream health for system status"""
+        return {
+            "model": self.model,
+            "max_retries": self.max_retries,
+            "circuit_breaker": self.breaker.stats(),
+        }
+    
+    def generate_response_stream(
+        self, 
+        query: str, 
+        context: List[str], 
+        system_prompt: str = None
+    ) -> Iterator[Dict]:
+        """
+        Stream a response from GROQ
+        
+        Yields {"type": "token", "content": ...} for every delta, then one
+        {"type": "done", ...} dict shaped like generate_response's result
+        (without the response text, which the caller has assembled). The
+        GROQ stream is closed however the generator ends, including a
+        client disconnect (GeneratorExit), so its pooled connection is
+        returned.
+        """
+        messages = self._build_messages(query, context, system_prompt)
+        tokens = 0
+        stream = None
         
+        try:
+            stream = self.complete(
+                model=self.model,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=2048,
+                top_p=0.9,
+                stream=True,
+            )
+            
+            for chunk in stream:
+                if chunk.choices:
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield {"type": "token", "content": delta}
+                
+                # GROQ reports usage on the final chunk
+                x_groq = getattr(chunk, 'x_groq', None)
+                usage = getattr(x_groq, 'usage', None) if x_groq else None
+                if usage is not None:
+                    tokens = usage.total_tokens
+            
+            print(f"✅ GROQ stream finished ({tokens} tokens)")
+            yield {"type": "done", "success": True, "tokens_used": tokens, "model": self.model}
+            
+        except Exception as e:
+            print(f"❌ GROQ streaming error: {e}")
+            if isinstance(e, RETRYABLE_ERRORS) and stream is not None:
+                # Dropped mid-stream, after complete() had already counted a success
+                self.breaker.record_failure(error=e)
+            yield {"type": "done", **self._failure(e), "tokens_used": tokens}
+        
+        finally:
+            if stream is not None:
+                stream.close()
+    
+    def _build_messages(self, query: str, context: List[str], system_prompt: str = None) -> List[Dict]:
+        """Build the chat messages sent to GROQ"""
         # Default system prompt if not provided
         if not system_prompt:
             system_prompt = """You are an intelligent LMS (Learning Management System) assistant.
@@ -425,40 +717,15 @@ Guidelines:
             }
         ]
         
-        try:
-            # Call GROQ API
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.3,
-                max_tokens=2048,
-                top_p=0.9,
-            )
-            
-            # Extract response
-            answer = response.choices[0].message.content
-            tokens = response.usage.total_tokens
-            
-            print(f"✅ GROQ response generated ({tokens} tokens)")
-            
-            return {
-                "success": True,
-                "response": answer,
-                "tokens_used": tokens,
-                "model": self.model
-            }
-            
-        except Exception as e:
-            print(f"❌ GROQ API Error: {e}")
-            return {
-                "success": False,
-                "error": str(e),
-                "response": "Sorry, I encountered an error processing your request. Please try again.",
-                "tokens_used": 0
-            }
+        return messages
     
-    def generate_intelligent_sql(self, query: str, table_context: Dict) -> str:
-        """Generate SQL by understanding the actual table context"""
+    def generate_intelligent_sql(self, query: str, table_context: Dict, fallback: bool = True) -> str:
+        """
+        Generate SQL by understanding the actual table context.
+        
+        If GROQ fails this returns a plain COUNT(*) on the table, or None
+        with fallback=False (callers that execute or cache the SQL).
+        """
         
         table_name = table_context.get("table_name")
         columns = table_context.get("columns", [])
@@ -509,7 +776,7 @@ Use ONLY table: {table_name}"""
         ]
         
         try:
-            response = self.client.chat.completions.create(
+            response = self.complete(
                 model=self.model,
                 messages=messages,
                 temperature=0.05,
@@ -537,6 +804,8 @@ Use ONLY table: {table_name}"""
             
         except Exception as e:
             print(f"❌ Error generating SQL: {e}")
+            if not fallback:
+                return None
             # Simple fallback
             return f"SELECT COUNT(*) FROM {table_name} WHERE (deleted = FALSE OR deleted IS NULL) LIMIT 100"
 
@@ -568,7 +837,7 @@ Use ONLY table: {table_name}"""
             True if connection successful, False otherwise
         """
         try:
-            response = self.client.chat.completions.create(
+            response = self.complete(
                 model=self.model,
                 messages=[
                     {"role": "user", "content": "Hello, this is a test. Reply with 'OK'."}
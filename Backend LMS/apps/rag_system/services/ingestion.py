@@ -0,0 +1,261 @@
+# ============================================
+# DOCUMENT INGESTION PIPELINE
+# File: apps/rag_system/services/ingestion.py
+# ============================================
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from django.utils import timezone
+
+from ..conf import rag_setting
+from ..models import DocumentStore
+from .pdf_reader import DocumentReader
+from .text_cache import ExtractedTextCache, get_text_cache
+from .vectorstore_service import VectorStoreService, chunk_id
+
+try:
+    # Celery's multiprocessing fork; unlike multiprocessing it can start a
+    # pool from a daemonic (prefork worker) process
+    from billiard.pool import Pool as BilliardPool
+except ImportError:
+    BilliardPool = None
+
+
+def _extract_page_range(args: Tuple[str, int, int]) -> List[Tuple[int, str]]:
+    """Process-pool entry point (must be module level to be picklable)"""
+    file_path, start, end = args
+    return DocumentReader.read_pdf_pages(file_path, start, end)
+
+
+class DocumentIngestionPipeline:
+    """
+    Staged ingestion of an uploaded DocumentStore file into the vector store.
+
+    extract -> chunk -> embed/upsert run as a stream: PDF pages are
+    extracted in a process pool in page ranges (a billiard pool inside
+    Celery prefork workers, serially if neither is possible; the mode is
+    recorded as stats["extract_mode"]), CSV and text files are
+    read in bounded batches (memory stays flat), chunks are embedded and
+    upserted in batches as soon as they are ready, and progress is written
+    to the DocumentStore row after every batch. Chunk IDs are content
+    hashes, so re-processing a document only embeds what changed and
+    chunks from an older version of the file are pruned at the end.
+    """
+
+    def __init__(self, vectorstore: VectorStoreService, workers: int = None,
+                 pages_per_task: int = None, batch_size: int = None):
+        self.vectorstore = vectorstore
+        self.workers = workers or rag_setting('INGESTION_WORKERS') or min(4, os.cpu_count() or 1)
+        self.pages_per_task = pages_per_task or rag_setting('INGESTION_PAGES_PER_TASK')
+        self.batch_size = batch_size or rag_setting('INGESTION_BATCH_SIZE')
+
+    def ingest(self, document: DocumentStore) -> Dict:
+        """Run the pipeline for one document; returns the processing stats"""
+        started = time.monotonic()
+        stats = {
+            "segments": 0,
+            "characters": 0,
+            "chunks_added": 0,
+            "chunks_unchanged": 0,
+            "chunks_removed": 0,
+            "extract_seconds": 0.0,
+            "embed_seconds": 0.0,
+            "text_cache": None,
+            "extract_mode": None,
+        }
+        self._update(document, status='processing', progress=0, chunk_count=0, processing_stats={})
+
+        try:
+            file_path = document.file.path
+            doc_type = (document.document_type or '').lower()
+            base_metadata = {
+                'document_id': str(document.id),
+                'title': document.title,
+                'type': doc_type
+            }
+
+            all_ids = []
+            seen = set()
+            batch: Dict[str, tuple] = {}
+            unit_key = 'page' if doc_type == 'pdf' else 'batch'
+
+            # PDFs report progress by page, streamed text files by bytes read
+            cached_pages, cache_key = self._lookup_cached_pages(file_path, doc_type, stats)
+            if cached_pages is not None:
+                total_units = max(len(cached_pages), 1)
+                segments = iter(cached_pages)
+            else:
+                total_units = max(self._count_units(file_path, doc_type), 1)
+                segments = self._iter_segments(file_path, doc_type, cache_key, stats)
+            while True:
+                extract_started = time.monotonic()
+                segment = next(segments, None)
+                stats["extract_seconds"] += time.monotonic() - extract_started
+                if segment is None:
+                    break
+
+                unit, text = segment
+                stats["segments"] += 1
+                stats["characters"] += len(text)
+
+                for chunk in self.vectorstore.text_splitter.split_text(text):
+                    metadata = {**base_metadata, unit_key: unit}
+                    cid = chunk_id(chunk, metadata)
+                    if cid not in seen:
+                        seen.add(cid)
+                        batch[cid] = (chunk, metadata)
+                        all_ids.append(cid)
+
+                    # Flush per chunk count, so one large segment (a DOCX, a
+                    # big TXT batch) is still embedded in batch_size pieces
+                    if len(batch) >= self.batch_size:
+                        self._flush(batch, stats)
+                        batch = {}
+                        done = stats["segments"] if doc_type == 'pdf' else stats["characters"]
+                        progress = min(99, int(done / total_units * 100))
+                        self._update(document, progress=progress, chunk_count=len(all_ids))
+
+            self._flush(batch, stats)
+
+            # Drop chunks left over from a previous version of this file
+            stats["chunks_removed"] = self.vectorstore.prune({'document_id': str(document.id)}, keep_ids=all_ids)
+
+            stats["total_seconds"] = round(time.monotonic() - started, 2)
+            stats["extract_seconds"] = round(stats["extract_seconds"], 2)
+            stats["embed_seconds"] = round(stats["embed_seconds"], 2)
+
+            if not all_ids:
+                stats["error"] = "No text could be extracted"
+                self._update(document, status='failed', processing_stats=stats)
+                return stats
+
+            self._update(
+                document,
+                status='completed',
+                progress=100,
+                chunk_count=len(all_ids),
+                vector_count=len(all_ids),
+                is_processed=True,
+                processing_stats=stats,
+                processed_at=timezone.now()
+            )
+            print(f"✅ Ingested '{document.title}': {len(all_ids)} chunks in {stats['total_seconds']}s")
+            return stats
+
+        except Exception as e:
+            print(f"❌ Ingestion failed for {document.id}: {e}")
+            stats["error"] = str(e)
+            stats["total_seconds"] = round(time.monotonic() - started, 2)
+            self._update(document, status='failed', processing_stats=stats)
+            raise
+
+    def _lookup_cached_pages(self, file_path: str, doc_type: str, stats: Dict) -> Tuple[Optional[List], Optional[str]]:
+        """(cached PDF pages or None, cache key); only PDFs are worth caching here"""
+        cache = get_text_cache()
+        if doc_type != 'pdf' or cache is None:
+            return None, None
+
+        key = ExtractedTextCache.cache_key(file_path, doc_type, DocumentReader.EXTRACTOR_VERSION)
+        cached = cache.get(key)
+        stats["text_cache"] = "hit" if cached is not None else "miss"
+        if cached is None:
+            return None, key
+        return ExtractedTextCache.split_pages(cached), key
+
+    def _iter_segments(self, file_path: str, doc_type: str, cache_key: str = None,
+                       stats: Dict = None) -> Iterator[Tuple[int, str]]:
+        """Yield (page or section number, text) in document order"""
+        if doc_type == 'pdf':
+            pages = []
+            for page in self._iter_pdf_pages(file_path, stats):
+                if cache_key:
+                    pages.append(page)
+                yield page
+            if cache_key and pages:
+                get_text_cache().set_pages(cache_key, pages)
+            return
+
+        if doc_type == 'csv':
+            # One batch per chunk, so every chunk carries the CSV header
+            batches = DocumentReader.iter_csv_batches(file_path, max_chars=self.vectorstore.CHUNK_SIZE)
+            yield from enumerate(batches, 1)
+            return
+
+        if doc_type in ('txt', 'md', 'markdown'):
+            batches = DocumentReader.iter_txt_batches(file_path, max_chars=self.vectorstore.CHUNK_SIZE * 20)
+            yield from enumerate(batches, 1)
+            return
+
+        text = DocumentReader.read_document(file_path, doc_type)
+        if text:
+            yield 1, text
+
+    def _iter_pdf_pages(self, file_path: str, stats: Dict = None) -> Iterator[Tuple[int, str]]:
+        stats = stats if stats is not None else {}
+        total_pages = DocumentReader.count_pdf_pages(file_path)
+        ranges = [
+            (file_path, start, min(start + self.pages_per_task, total_pages))
+            for start in range(0, total_pages, self.pages_per_task)
+        ]
+        workers = min(self.workers, len(ranges))
+
+        if workers < 2:
+            mode = "serial"
+        elif not multiprocessing.current_process().daemon:
+            mode = "process_pool"
+        elif BilliardPool is not None:
+            # Celery prefork children are daemonic: multiprocessing may not start processes there
+            mode = "billiard"
+        else:
+            mode = "serial"
+        stats["extract_mode"] = mode
+        print(f"📄 Extracting {total_pages} pages in {len(ranges)} ranges ({mode})")
+
+        if mode == "serial":
+            for page_range in ranges:
+                yield from _extract_page_range(page_range)
+            return
+
+        if mode == "billiard":
+            pool = BilliardPool(processes=workers)
+            try:
+                # imap() yields ranges in order, like executor.map() below
+                for pages in pool.imap(_extract_page_range, ranges):
+                    yield from pages
+            finally:
+                pool.terminate()
+                pool.join()
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map() yields ranges in order as they finish, so embedding
+            # starts while later pages are still being extracted
+            for pages in executor.map(_extract_page_range, ranges):
+                yield from pages
+
+    def _count_units(self, file_path: str, doc_type: str) -> int:
+        if doc_type == 'pdf':
+            return DocumentReader.count_pdf_pages(file_path)
+        if doc_type in ('csv', 'txt', 'md', 'markdown'):
+            return os.path.getsize(file_path)
+        return 1
+
+    def _flush(self, batch: Dict[str, tuple], stats: Dict):
+        if not batch:
+            return
+        embed_started = time.monotonic()
+        result = self.vectorstore.upsert_chunks(batch)
+        stats["embed_seconds"] += time.monotonic() - embed_started
+        stats["chunks_added"] += result["added"]
+        stats["chunks_unchanged"] += result["unchanged"]
+
+    @staticmethod
+    def _update(document: DocumentStore, **fields):
+        """Write progress fields without touching the rest of the row"""
+        for name, value in fields.items():
+            setattr(document, name, value)
+        DocumentStore.objects.filter(pk=document.pk).update(**fields)
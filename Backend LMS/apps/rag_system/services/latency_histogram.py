@@ -0,0 +1,144 @@
+# ============================================
+# LATENCY HISTOGRAMS
+# File: apps/rag_system/services/latency_histogram.py
+# ============================================
+
+import math
+from typing import Dict, Iterable, Optional
+
+
+class LatencyHistogram:
+    """
+    Sparse log-bucketed histogram (HDR-style) for latencies and counts.
+
+    A value v > 0 falls in bucket ceil(log(v) / log(1 + precision)), so
+    every bucket spans the same relative width and any percentile read
+    back is within `precision` of the true value, whether it is 2ms or
+    20s. Only non-empty buckets are stored, which keeps a day's worth of
+    samples to a few hundred integers; histograms with the same precision
+    merge by adding counts.
+    """
+
+    def __init__(self, precision: float = 0.05):
+        self.precision = precision
+        self._log_base = math.log1p(precision)
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0  # values <= 0 (e.g. 0 tokens on an error)
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def record(self, value: float, times: int = 1):
+        if value is None or times <= 0:
+            return
+        value = float(value)
+        if value <= 0:
+            self.zero_count += times
+        else:
+            index = math.ceil(math.log(value) / self._log_base)
+            self.buckets[index] = self.buckets.get(index, 0) + times
+        self.count += times
+        self.total += value * times
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def record_many(self, values: Iterable[float]):
+        for value in values:
+            self.record(value)
+
+    def merge(self, other: "LatencyHistogram"):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge histograms with different precision")
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        if other.max is not None:
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def percentile(self, pct: float) -> float:
+        """Value at percentile `pct` (0-100), as the upper edge of its bucket"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(pct / 100 * self.count))
+        seen = self.zero_count
+        if seen >= rank:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # Clamp to the observed range so p100 == max, p0 >= min
+                value = math.exp(index * self._log_base)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self, percentiles=(50, 90, 99)) -> Dict:
+        result = {"count": self.count, "mean": round(self.mean, 3)}
+        for pct in percentiles:
+            result[f"p{pct}"] = round(self.percentile(pct), 3)
+        result["max"] = round(self.max, 3) if self.max is not None else 0.0
+        return result
+
+    def to_dict(self) -> Dict:
+        return {
+            "precision": self.precision,
+            "buckets": {str(index): count for index, count in self.buckets.items()},
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> "LatencyHistogram":
+        data = data or {}
+        histogram = cls(precision=data.get("precision", 0.05))
+        histogram.buckets = {int(index): count for index, count in (data.get("buckets") or {}).items()}
+        histogram.zero_count = data.get("zero_count", 0)
+        histogram.count = data.get("count", 0)
+        histogram.total = data.get("total", 0.0)
+        histogram.min = data.get("min")
+        histogram.max = data.get("max")
+        return histogram
+
+
+def latency_samples(result: Dict) -> Dict[str, float]:
+    """Histogram samples for one query result: stage timings (ms), total (ms) and tokens"""
+    samples = dict(result.get("stage_timings_ms") or {})
+    if "total" not in samples:
+        samples["total"] = float(result.get("response_time") or 0) * 1000
+    samples["tokens"] = result.get("tokens_used") or 0
+    return samples
+
+
+def summarize_histograms(rows: Iterable, percentiles=(50, 90, 99)) -> Dict:
+    """
+    Merge stored histograms across days.
+
+    `rows` yields (query_type, metric, histogram dict). Returns summaries
+    per metric for all queries and per query type; every metric is in
+    milliseconds except "tokens".
+    """
+    overall: Dict[str, LatencyHistogram] = {}
+    by_type: Dict[str, Dict[str, LatencyHistogram]] = {}
+    for query_type, metric, data in rows:
+        histogram = LatencyHistogram.from_dict(data)
+        by_type.setdefault(query_type, {}).setdefault(metric, LatencyHistogram(histogram.precision)).merge(histogram)
+        overall.setdefault(metric, LatencyHistogram(histogram.precision)).merge(histogram)
+    return {
+        "all": {metric: histogram.summary(percentiles) for metric, histogram in overall.items()},
+        "by_query_type": {
+            query_type: {metric: histogram.summary(percentiles) for metric, histogram in metrics.items()}
+            for query_type, metrics in by_type.items()
+        },
+    }
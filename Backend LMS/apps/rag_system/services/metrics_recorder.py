@@ -0,0 +1,248 @@
+# ============================================
+# BUFFERED METRICS / CHAT HISTORY RECORDER
+# File: apps/rag_system/services/metrics_recorder.py
+# ============================================
+
+import atexit
+import threading
+from datetime import date
+from typing import Dict, List, Tuple
+
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Round
+from django.utils import timezone
+
+from ..conf import rag_setting
+from ..models import ChatHistory, RAGLatencyHistogram, RAGMetrics
+from .latency_histogram import LatencyHistogram, latency_samples
+
+
+class _DailyCounters:
+    """Counter deltas for one day's RAGMetrics row"""
+
+    __slots__ = ("queries", "successful", "failed", "tokens", "cache_hits", "response_time_sum")
+
+    def __init__(self):
+        self.queries = 0
+        self.successful = 0
+        self.failed = 0
+        self.tokens = 0
+        self.cache_hits = 0
+        self.response_time_sum = 0.0
+
+    def add(self, other: "_DailyCounters"):
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+
+class MetricsRecorder:
+    """
+    Buffers chat history and metrics in-process and writes them in batches.
+
+    Requests only append to in-memory buffers; a background thread flushes
+    every METRICS_FLUSH_INTERVAL seconds (sooner once METRICS_MAX_BUFFER
+    chats are waiting). A flush bulk-creates ChatHistory rows, applies the
+    day's counter deltas to RAGMetrics in one UPDATE with F() expressions
+    (no read-modify-write, so concurrent workers never lose increments),
+    and merges latency histograms under a row lock. Failed flushes put
+    their data back for the next attempt. With METRICS_BUFFERED off every
+    record is flushed immediately. ChatHistory.created_at is the flush
+    time, at most one interval after the query.
+    """
+
+    def __init__(self, flush_interval: float = None, max_buffer: int = None, buffered: bool = None):
+        self.flush_interval = flush_interval or rag_setting('METRICS_FLUSH_INTERVAL')
+        self.max_buffer = max_buffer or rag_setting('METRICS_MAX_BUFFER')
+        self.buffered = rag_setting('METRICS_BUFFERED') if buffered is None else buffered
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._chats: List[ChatHistory] = []
+        self._counters: Dict[date, _DailyCounters] = {}
+        self._histograms: Dict[Tuple[date, str, str], LatencyHistogram] = {}
+
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self.flushes = 0
+        self.flush_errors = 0
+
+    def record_chat(self, user, session_id: str, query: str, result: Dict):
+        """Buffer a chat history row plus the metrics for its result"""
+        chat = ChatHistory(
+            user=user,
+            session_id=session_id,
+            query=query,
+            response=result.get('response', ''),
+            context_used=result.get('context_sources', {}),
+            tokens_used=result.get('tokens_used', 0),
+            response_time=result.get('response_time', 0.0)
+        )
+        with self._lock:
+            self._chats.append(chat)
+        self.record_metrics(result)
+
+    def record_metrics(self, result: Dict):
+        """Buffer counter and histogram updates for one query result"""
+        today = timezone.localdate()
+        query_type = result.get('query_type') or 'unknown'
+
+        with self._lock:
+            counters = self._counters.setdefault(today, _DailyCounters())
+            counters.queries += 1
+            if result.get('success'):
+                counters.successful += 1
+            else:
+                counters.failed += 1
+            counters.tokens += result.get('tokens_used', 0) or 0
+            counters.response_time_sum += result.get('response_time', 0) or 0
+            if result.get('cached'):
+                counters.cache_hits += 1
+
+            for metric, value in latency_samples(result).items():
+                key = (today, query_type, metric)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = LatencyHistogram()
+                histogram.record(value)
+
+            backlog = len(self._chats)
+
+        if not self.buffered:
+            self.flush()
+        else:
+            self._ensure_thread()
+            if backlog >= self.max_buffer:
+                self._wakeup.set()
+
+    def flush(self) -> Dict:
+        """Write everything buffered so far; returns what was written"""
+        with self._flush_lock:
+            with self._lock:
+                chats, self._chats = self._chats, []
+                counters, self._counters = self._counters, {}
+                histograms, self._histograms = self._histograms, {}
+
+            if not (chats or counters or histograms):
+                return {"chats": 0, "days": 0, "histograms": 0}
+
+            try:
+                with transaction.atomic():
+                    if chats:
+                        ChatHistory.objects.bulk_create(chats, batch_size=500)
+                    for day, delta in counters.items():
+                        self._apply_counters(day, delta)
+                    for (day, query_type, metric), histogram in sorted(histograms.items()):
+                        self._merge_histogram(day, query_type, metric, histogram)
+            except Exception as e:
+                self.flush_errors += 1
+                print(f"⚠️ Metrics flush failed, will retry: {e}")
+                self._requeue(chats, counters, histograms)
+                return {"chats": 0, "days": 0, "histograms": 0, "error": str(e)}
+
+            self.flushes += 1
+            return {"chats": len(chats), "days": len(counters), "histograms": len(histograms)}
+
+    def stop(self):
+        """Stop the flusher thread and write what is left (worker/engine shutdown)"""
+        self._stopped.set()
+        self._wakeup.set()
+        self.flush()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            pending_chats = len(self._chats)
+            pending_queries = sum(c.queries for c in self._counters.values())
+        return {
+            "buffered": self.buffered,
+            "flush_interval": self.flush_interval,
+            "pending_chats": pending_chats,
+            "pending_queries": pending_queries,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+        }
+
+    @staticmethod
+    def _apply_counters(day: date, delta: _DailyCounters):
+        # Buffered deltas may belong to yesterday, so the row's date is always explicit
+        RAGMetrics.objects.get_or_create(date=day)
+        total = F('total_queries') + delta.queries
+        RAGMetrics.objects.filter(date=day).update(
+            total_queries=total,
+            successful_queries=F('successful_queries') + delta.successful,
+            failed_queries=F('failed_queries') + delta.failed,
+            total_tokens_used=F('total_tokens_used') + delta.tokens,
+            cache_hits=F('cache_hits') + delta.cache_hits,
+            # Every F() reads the pre-update row, so this is the merged running mean
+            avg_response_time=(
+                (F('avg_response_time') * F('total_queries') + Value(delta.response_time_sum)) / total
+            ),
+            cache_hit_rate=Round((F('cache_hits') + delta.cache_hits) * Value(100.0) / total, 2),
+        )
+
+    @staticmethod
+    def _merge_histogram(day: date, query_type: str, metric: str, histogram: LatencyHistogram):
+        row, _ = RAGLatencyHistogram.objects.select_for_update().get_or_create(
+            date=day, query_type=query_type, metric=metric
+        )
+        merged = LatencyHistogram.from_dict(row.histogram).merge(histogram) if row.histogram else histogram
+        row.histogram = merged.to_dict()
+        row.sample_count = merged.count
+        row.save(update_fields=['histogram', 'sample_count', 'updated_at'])
+
+    def _requeue(self, chats, counters, histograms):
+        with self._lock:
+            # Drop the oldest chats rather than grow without bound while the DB is down
+            self._chats = (chats + self._chats)[-self.max_buffer * 10:]
+            for day, delta in counters.items():
+                self._counters.setdefault(day, _DailyCounters()).add(delta)
+            for key, histogram in histograms.items():
+                if key in self._histograms:
+                    histogram.merge(self._histograms[key])
+                self._histograms[key] = histogram
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='rag-metrics-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Metrics flusher error: {e}")
+            finally:
+                # The flusher thread gets its own DB connection; don't leave it open
+                from django.db import connection
+                connection.close()
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_metrics_recorder() -> MetricsRecorder:
+    """Process-wide recorder; flushed at interpreter exit"""
+    global _recorder
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = MetricsRecorder()
+                atexit.register(_recorder.stop)
+    return _recorder
+
+
+def flush_metrics():
+    """Flush buffered metrics, e.g. from a worker or engine shutdown hook"""
+    if _recorder is not None:
+        _recorder.flush()
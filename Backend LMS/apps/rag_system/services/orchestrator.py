@@ -262,11 +262,22 @@
 # File: apps/rag_system/services/orchestrator.py
 # ============================================
 
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional, Tuple
 from enum import Enum
+import functools
+import time
+from asgiref.sync import sync_to_async
 from .rag_service import VectorStoreRAGService
 from .groq_service import GroqService
 from .database_connector import DatabaseConnector
+from .table_stats import table_stats
+from .retrieval_filters import build_where_filter, detect_entities
+from .query_matcher import match_query, query_matcher
+from .stage_timer import ensure_timer, stage
+from .single_flight import SingleFlight, data_version
+from .template_query import TemplateQueryEngine
+from ..conf import rag_setting
+from ..utils import normalize_query, create_query_hash
 
 
 class QueryType(Enum):
@@ -282,79 +293,202 @@ class QueryType(Enum):
 class VectorStoreOrchestrator:
     """Enhanced Orchestrator for Vector Store + PostgreSQL RAG"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        rag_service: VectorStoreRAGService = None,
+        groq_service: GroqService = None,
+        db_connector: DatabaseConnector = None,
+        single_flight: SingleFlight = None,
+        template_engine: TemplateQueryEngine = None
+    ):
         print("🚀 Initializing Enhanced Orchestrator...")
-        self.rag_service = VectorStoreRAGService()
-        self.groq_service = GroqService()
-        self.db_connector = DatabaseConnector()
+        self.rag_service = rag_service or VectorStoreRAGService()
+        self.groq_service = groq_service or self.rag_service.groq_service
+        self.db_connector = db_connector or self.rag_service.db_connector
+        self.single_flight = single_flight or SingleFlight()
+        self.template_engine = template_engine
+        if self.template_engine is None and rag_setting('TEMPLATE_QUERY_ENABLED'):
+            self.template_engine = TemplateQueryEngine(self.db_connector)
         print("✅ Enhanced Orchestrator ready!")
     
-    def process_intelligent_query(self, query: str, user_context: Dict) -> Dict:
+    def process_intelligent_query(self, query: str, user_context: Dict, use_cache: bool = True) -> Dict:
         """Intelligently process query using vector store + database"""
-        
-        # Step 1: Classify query type
-        query_type = self._classify_query(query)
-        print(f"🔍 Query '{query}' classified as: {query_type.value}")
-        
-        # Step 2: Route to appropriate handler
+        started = time.perf_counter()
+        with ensure_timer() as timer:
+            # Step 1: Classify query type
+            with stage("classification"):
+                query_type = self._classify_query(query)
+            print(f"🔍 Query '{query}' classified as: {query_type.value}")
+            
+            # Step 2: Route to appropriate handler, sharing the work of identical in-flight queries
+            handle = functools.partial(self._route_query, query, query_type, user_context, use_cache)
+            if use_cache:
+                result, shared = self.single_flight.do(self._coalesce_key(query, query_type, user_context), handle)
+            else:
+                result, shared = handle(), False
+        
+        return self._annotate_result(self._own_copy(result, shared), query_type, timer.as_ms(), started)
+    
+    def _route_query(self, query: str, query_type: QueryType, user_context: Dict, use_cache: bool) -> Dict:
+        """Run a classified query through its handler"""
         if query_type == QueryType.CONVERSATIONAL:
             return self._handle_conversational_query(query, user_context)
-        elif query_type == QueryType.DATABASE_QUERY:
-            return self._handle_database_query(query, user_context)
-        else:
-            # All other queries use the enhanced RAG service
-            return self.rag_service.process_query(query, user_context, use_cache=True)
+        if query_type == QueryType.DATABASE_QUERY:
+            return self._handle_database_query(query, user_context, use_cache)
+        # All other queries use the enhanced RAG service
+        return self.rag_service.process_query(
+            query, user_context, use_cache=use_cache, query_type=query_type.value
+        )
+    
+    async def aprocess_intelligent_query(self, query: str, user_context: Dict, use_cache: bool = True) -> Dict:
+        """Async variant of process_intelligent_query"""
+        started = time.perf_counter()
+        with ensure_timer() as timer:
+            with stage("classification"):
+                query_type = self._classify_query(query)
+            print(f"🔍 Query '{query}' classified as: {query_type.value} (async)")
+            
+            handle = functools.partial(self._aroute_query, query, query_type, user_context, use_cache)
+            if use_cache:
+                result, shared = await self.single_flight.ado(
+                    self._coalesce_key(query, query_type, user_context), handle
+                )
+            else:
+                result, shared = await handle(), False
+        
+        return self._annotate_result(self._own_copy(result, shared), query_type, timer.as_ms(), started)
+    
+    async def _aroute_query(self, query: str, query_type: QueryType, user_context: Dict, use_cache: bool) -> Dict:
+        """Async variant of _route_query"""
+        if query_type == QueryType.DATABASE_QUERY:
+            result = await sync_to_async(self._answer_from_template)(query, user_context)
+            if result is not None:
+                return result
+        
+        if query_type != QueryType.CONVERSATIONAL:
+            return await self.rag_service.aprocess_query(
+                query, user_context, use_cache=use_cache, query_type=query_type.value
+            )
+        
+        with stage("llm"):
+            response = await self.groq_service.agenerate_response(
+                query, [], self._conversational_prompt(user_context)
+            )
+        
+        return {
+            "query": query,
+            "response": response['response'],
+            "query_type": "conversational",
+            "tokens_used": response.get('tokens_used', 0),
+            "success": response.get('success', False),
+            "context_sources": {"response_method": "conversational"},
+            "response_time": 0.0
+        }
+    
+    @staticmethod
+    def _own_copy(result: Dict, shared: bool) -> Dict:
+        """Per-request copy of a possibly shared result"""
+        result = dict(result, coalesced=shared)
+        if shared:
+            # The LLM tokens are already accounted for by the request that computed it
+            result["tokens_used"] = 0
+        return result
+    
+    @staticmethod
+    def _coalesce_key(query: str, query_type: QueryType, user_context: Dict) -> str:
+        """
+        In-flight key: normalized query, role (as for the answer cache) and
+        data version; conversational replies also greet the user by name.
+        """
+        user_context = user_context or {}
+        scope = user_context.get('user_type', 'user')
+        if query_type == QueryType.CONVERSATIONAL:
+            scope += f":{user_context.get('username', '')}"
+        return create_query_hash(normalize_query(query), scope=f"{scope}@v{data_version()}")
+    
+    def stream_intelligent_query(self, query: str, user_context: Dict, use_cache: bool = True) -> Iterator[Tuple[str, Dict]]:
+        """
+        Streaming variant of process_intelligent_query (yields SSE-ready events).
+        
+        Only the total time is reported for streamed answers: a generator
+        may be resumed in a different context per chunk, so stage timers
+        are not carried across yields.
+        """
+        started = time.perf_counter()
+        query_type = self._classify_query(query)
+        print(f"🔍 Query '{query}' classified as: {query_type.value} (streaming)")
+        
+        if query_type == QueryType.DATABASE_QUERY:
+            result = self._answer_from_template(query, user_context)
+            if result is not None:
+                yield "metadata", {"query": query, "context_sources": result["context_sources"], "cached": False}
+                yield "token", {"content": result["response"]}
+                yield "done", self._annotate_result(result, query_type, {}, started)
+                return
+        
+        if query_type != QueryType.CONVERSATIONAL:
+            for event, data in self.rag_service.stream_query(
+                query, user_context, use_cache=use_cache, query_type=query_type.value
+            ):
+                if event == "done":
+                    data = self._annotate_result(data, query_type, {}, started)
+                yield event, data
+            return
+        
+        context_sources = {"response_method": "conversational"}
+        yield "metadata", {"query": query, "context_sources": context_sources, "cached": False}
+        
+        parts = []
+        final = {"success": False, "tokens_used": 0}
+        for chunk in self.groq_service.generate_response_stream(query, [], self._conversational_prompt(user_context)):
+            if chunk["type"] == "token":
+                parts.append(chunk["content"])
+                yield "token", {"content": chunk["content"]}
+            else:
+                final = chunk
+        
+        yield "done", self._annotate_result({
+            "query": query,
+            "response": "".join(parts) or final.get("response", ""),
+            "query_type": "conversational",
+            "tokens_used": final.get("tokens_used", 0),
+            "success": final.get("success", False),
+            "context_sources": context_sources,
+            "response_time": 0.0
+        }, query_type, {}, started)
+    
+    @staticmethod
+    def _annotate_result(result: Dict, query_type: QueryType, timings_ms: Dict, started: float) -> Dict:
+        """Attach the routed query type and per-stage timings (ms) for metrics"""
+        result.setdefault("query_type", query_type.value)
+        result["stage_timings_ms"] = {**timings_ms, "total": round((time.perf_counter() - started) * 1000, 3)}
+        return result
     
     def _classify_query(self, query: str) -> QueryType:
-        """Classify query type using keywords"""
-        query_lower = query.lower()
-        
-        # Conversational queries
-        conversational_keywords = [
-            'hello', 'hi', 'hey', 'thanks', 'thank you',
-            'good morning', 'good afternoon', 'what can you do',
-            'help', 'who are you', 'how are you'
-        ]
-        if any(kw in query_lower for kw in conversational_keywords):
-            return QueryType.CONVERSATIONAL
-        
-        # Database-specific queries
-        database_keywords = [
-            'how many', 'count', 'total', 'number of',
-            'show', 'list', 'display', 'get', 'find'
-        ]
-        lms_entities = [
-            'user', 'student', 'teacher', 'parent', 'role',
-            'class', 'subject', 'exam', 'fee', 'attendance',
-            'vehicle', 'route', 'employee', 'assignment', 'leave'
-        ]
-        
-        has_database_keyword = any(kw in query_lower for kw in database_keywords)
-        has_entity = any(entity in query_lower for entity in lms_entities)
-        
-        if has_database_keyword and has_entity:
-            return QueryType.DATABASE_QUERY
-        
-        # Column-specific queries
-        if any(word in query_lower for word in ['with', 'where', 'having', 'by']):
-            return QueryType.COLUMN_QUERY
-        
-        # Analytical queries
-        if any(word in query_lower for word in ['how many', 'count', 'total', 'average']):
-            return QueryType.ANALYTICAL
-        
-        # Procedural queries
-        if any(kw in query_lower for kw in ['how to', 'how do i', 'steps', 'guide']):
-            return QueryType.PROCEDURAL
-        
-        # Default: Factual query
-        return QueryType.FACTUAL
+        """Classify query type using keywords (precompiled matcher, cached per query)"""
+        return QueryType(match_query(query).intent)
     
     def _handle_conversational_query(self, query: str, user_context: Dict) -> Dict:
         """Handle general conversation"""
         print(f"💬 Handling conversational query")
         
-        system_prompt = f"""You are a helpful LMS assistant.
+        system_prompt = self._conversational_prompt(user_context)
+        with stage("llm"):
+            response = self.groq_service.generate_response(query, [], system_prompt)
+        
+        return {
+            "query": query,
+            "response": response['response'],
+            "query_type": "conversational",
+            "tokens_used": response.get('tokens_used', 0),
+            "success": response.get('success', False),
+            "context_sources": {"response_method": "conversational"},
+            "response_time": 0.0
+        }
+    
+    def _conversational_prompt(self, user_context: Dict) -> str:
+        """System prompt for greetings and general chat"""
+        return f"""You are a helpful LMS assistant.
 User: {user_context.get('username', 'User')} ({user_context.get('user_type', 'user')})
 
 CAPABILITIES:
@@ -368,25 +502,28 @@ Example responses:
 - "Hello! I can help you find information about the LMS system. Try asking questions like 'How many students?' or 'Show all teachers'"
 - "I can help you with queries about users, students, teachers, classes, exams, fees, and more!"
 """
-        
-        response = self.groq_service.generate_response(query, [], system_prompt)
-        
-        return {
-            "query": query,
-            "response": response['response'],
-            "query_type": "conversational",
-            "tokens_used": response.get('tokens_used', 0),
-            "success": response.get('success', False),
-            "context_sources": {"response_method": "conversational"},
-            "response_time": 0.0
-        }
     
-    def _handle_database_query(self, query: str, user_context: Dict) -> Dict:
+    def _handle_database_query(self, query: str, user_context: Dict, use_cache: bool = True) -> Dict:
         """Handle database-specific queries"""
         print(f"🗄️ Handling database query")
         
-        # Use the enhanced RAG service which has database integration
-        return self.rag_service.process_query(query, user_context, use_cache=False)
+        # Counts, listings and top-N come straight from SQL when a template fits
+        result = self._answer_from_template(query, user_context)
+        if result is not None:
+            return result
+        
+        # Use the enhanced RAG service which has database integration;
+        # cached counts go stale after QUERY_CACHE_TTL at the latest
+        return self.rag_service.process_query(
+            query, user_context, use_cache=use_cache, query_type=QueryType.DATABASE_QUERY.value
+        )
+    
+    def _answer_from_template(self, query: str, user_context: Dict = None) -> Optional[Dict]:
+        """Exact answer from an SQL template, or None when the question needs the LLM"""
+        if self.template_engine is None:
+            return None
+        with stage("template_sql"):
+            return self.template_engine.answer(query, user_context)
     
     def diagnose_query(self, query: str) -> Dict:
         """Diagnose how a query will be processed"""
@@ -394,19 +531,37 @@ Example responses:
         
         # Get database context
         relevant_tables = self.db_connector.discover_relevant_tables(query)
+        snapshot = self.db_connector.get_schema_snapshot()
+        table_details = {
+            table: {
+                "columns": snapshot.columns(table)[:15],
+                "row_estimate": snapshot.row_estimate(table),
+                "foreign_keys": snapshot.foreign_keys(table),
+                "related_tables": snapshot.related_tables(table)[:5]
+            }
+            for table in relevant_tables if snapshot.has_table(table)
+        }
         
         # Get enhancement suggestions
         enhancements = self._get_query_enhancements(query)
         
+        template = None
+        if query_type == QueryType.DATABASE_QUERY and self.template_engine is not None:
+            template = self.template_engine.plan(query)
+        
         return {
             "query": query,
             "query_type": query_type.value,
             "description": self._get_query_type_description(query_type),
-            "processing_method": "vector_store_with_database",
+            "processing_method": "sql_template" if template else "vector_store_with_database",
+            "sql_template": {"intent": template.intent, "sql": template.sql, "params": template.params} if template else None,
+            "query_match": match_query(query).as_dict(),
             "relevant_tables": relevant_tables,
+            "table_details": table_details,
+            "retrieval_filter": build_where_filter(query_type.value, detect_entities(query)),
             "recommended_enhancements": enhancements,
-            "will_use_vector_store": True,
-            "will_use_database": query_type in [QueryType.DATABASE_QUERY, QueryType.ANALYTICAL]
+            "will_use_vector_store": template is None,
+            "will_use_database": template is not None or query_type in [QueryType.DATABASE_QUERY, QueryType.ANALYTICAL]
         }
     
     def _get_query_type_description(self, query_type: QueryType) -> str:
@@ -423,24 +578,24 @@ Example responses:
     
     def _get_query_enhancements(self, query: str) -> List[str]:
         """Get recommended query enhancements"""
-        query_lower = query.lower()
+        terms = match_query(query).terms
         enhancements = []
         
-        if "how many" in query_lower or "count" in query_lower:
+        if "how many" in terms or "count" in terms:
             enhancements.extend([
                 "Add specific entity: 'How many [users/students/teachers]?'",
                 "Add time filter: 'How many users created this month?'",
                 "Add status filter: 'How many active students?'"
             ])
         
-        if "show" in query_lower or "list" in query_lower:
+        if "show" in terms or "list" in terms:
             enhancements.extend([
                 "Be specific: 'Show [all/active/recent] [entity]s'",
                 "Add sorting: 'List users by name'",
                 "Add limit: 'Show top 10 students'"
             ])
         
-        if "with" in query_lower or "where" in query_lower:
+        if "with" in terms or "where" in terms:
             enhancements.extend([
                 "Specify exact values: 'Users with email containing @gmail'",
                 "Use comparisons: 'Students with attendance > 90%'",
@@ -454,14 +609,25 @@ Example responses:
         try:
             # Vector store status
             vectorstore_stats = self.rag_service.vectorstore.stats()
+            vectorstore_stats["query_cache"] = self.rag_service.query_cache.stats()
+            if self.rag_service.semantic_cache is not None:
+                vectorstore_stats["semantic_cache"] = self.rag_service.semantic_cache.stats()
+            vectorstore_stats["request_coalescing"] = self.single_flight.stats()
+            vectorstore_stats["query_matcher"] = query_matcher().stats()
             
             # Database status
             db_summary = self.rag_service.get_database_summary()
+            db_summary["table_stats"] = table_stats.stats()
+            if self.template_engine is not None:
+                db_summary["sql_templates"] = self.template_engine.stats()
+            if self.rag_service.text_to_sql is not None:
+                db_summary["text_to_sql"] = self.rag_service.text_to_sql.stats()
             
             return {
                 "status": "operational",
                 "vector_store": vectorstore_stats,
                 "database": db_summary,
+                "llm": self.groq_service.stats(),
                 "capabilities": {
                     "conversational": True,
                     "database_queries": True,
@@ -4,8 +4,10 @@
 # ============================================
 
 import PyPDF2
+import codecs
+import csv
 import os
-from typing import Optional, Dict
+from typing import Optional, Dict, Iterator, List, Tuple
 
 try:
     from docx import Document
@@ -15,10 +17,22 @@ except ImportError:
     print("⚠️ python-docx not installed. DOCX reading will not be available.")
 
 
+def _latin1_fallback(error: UnicodeDecodeError):
+    """Decode bytes that are not valid UTF-8 as latin-1, which accepts every byte"""
+    return error.object[error.start:error.end].decode('latin-1'), error.end
+
+
+codecs.register_error('latin1_fallback', _latin1_fallback)
+
+
 class DocumentReader:
     """Enhanced document reader with better error handling"""
     
     SUPPORTED_FORMATS = ['pdf', 'docx', 'txt', 'csv', 'md']
+    # Part of the extracted-text cache key; bump when extraction or cleaning changes
+    EXTRACTOR_VERSION = 1
+    # Bytes read to pick a text file's encoding
+    ENCODING_SNIFF_BYTES = 64 * 1024
     
     @staticmethod
     def read_pdf(file_path: str) -> str:
@@ -64,6 +78,44 @@ class DocumentReader:
             print(f"❌ Error reading PDF {file_path}: {e}")
             return ""
     
+    @staticmethod
+    def count_pdf_pages(file_path: str) -> int:
+        """Number of pages in a PDF (0 if it cannot be opened)"""
+        try:
+            with open(file_path, 'rb') as file:
+                return len(PyPDF2.PdfReader(file).pages)
+        except Exception as e:
+            print(f"❌ Error opening PDF {file_path}: {e}")
+            return 0
+    
+    @staticmethod
+    def read_pdf_pages(file_path: str, start: int = 0, end: Optional[int] = None) -> List[Tuple[int, str]]:
+        """
+        Extract text from a range of PDF pages
+        
+        Args:
+            file_path: Path to PDF file
+            start: First page index (0-based)
+            end: Page index to stop before, or None for the last page
+            
+        Returns:
+            List of (page_number, text) for non-empty pages, 1-based page numbers
+        """
+        pages = []
+        with open(file_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            end = len(pdf_reader.pages) if end is None else min(end, len(pdf_reader.pages))
+            
+            for index in range(start, end):
+                try:
+                    page_text = (pdf_reader.pages[index].extract_text() or "").strip()
+                    if page_text:
+                        pages.append((index + 1, page_text))
+                except Exception as e:
+                    print(f"⚠️ Error reading page {index + 1}: {e}")
+        
+        return pages
+    
     @staticmethod
     def read_docx(file_path: str) -> str:
         """
@@ -109,49 +161,125 @@ class DocumentReader:
             print(f"❌ Error reading DOCX {file_path}: {e}")
             return ""
     
-    @staticmethod
-    def read_txt(file_path: str) -> str:
+    @classmethod
+    def detect_encoding(cls, file_path: str) -> str:
         """
-        Read plain text file with multiple encoding support
+        Pick the text encoding for a file from its first bytes
+        
+        Only ENCODING_SNIFF_BYTES are read: a prefix that is not valid
+        UTF-8 means latin-1. Readers open the file with the
+        'latin1_fallback' error handler, so non-UTF-8 bytes past the
+        prefix are decoded as latin-1 while streaming instead of failing.
+        """
+        with open(file_path, 'rb') as file:
+            prefix = file.read(cls.ENCODING_SNIFF_BYTES)
+        try:
+            # Not final: the prefix may end inside a multi-byte character
+            codecs.getincrementaldecoder('utf-8')().decode(prefix)
+            return 'utf-8'
+        except UnicodeDecodeError:
+            return 'latin-1'
+    
+    @classmethod
+    def iter_txt_batches(cls, file_path: str, max_chars: int = 20000) -> Iterator[str]:
+        """
+        Stream a text file as batches of whole lines
         
         Args:
             file_path: Path to text file
+            max_chars: Soft limit on characters per batch
             
-        Returns:
-            File content or empty string on error
+        Yields:
+            Text batches of roughly max_chars characters
         """
-        try:
-            if not os.path.exists(file_path):
-                print(f"❌ Text file not found: {file_path}")
-                return ""
+        if not os.path.exists(file_path):
+            print(f"❌ Text file not found: {file_path}")
+            return
+        
+        encoding = cls.detect_encoding(file_path)
+        lines, size = [], 0
+        
+        with open(file_path, 'r', encoding=encoding, errors='latin1_fallback') as file:
+            for line in file:
+                lines.append(line)
+                size += len(line)
+                if size >= max_chars:
+                    batch = "".join(lines).strip()
+                    if batch:
+                        yield batch
+                    lines, size = [], 0
+        
+        batch = "".join(lines).strip()
+        if batch:
+            yield batch
+    
+    @classmethod
+    def iter_csv_batches(cls, file_path: str, max_chars: int = 1000, max_rows: int = 200) -> Iterator[str]:
+        """
+        Stream a CSV file as batches of rows, each starting with the header
+        
+        Batches are kept under max_chars so each one embeds as a single
+        chunk and every chunk knows what its columns mean.
+        
+        Args:
+            file_path: Path to CSV file
+            max_chars: Character limit per batch (header included)
+            max_rows: Row limit per batch
             
-            # Try multiple encodings
-            encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
+        Yields:
+            "HEADERS: ..." followed by "Row i: ..." lines
+        """
+        if not os.path.exists(file_path):
+            print(f"❌ CSV file not found: {file_path}")
+            return
+        
+        encoding = cls.detect_encoding(file_path)
+        
+        with open(file_path, 'r', encoding=encoding, errors='latin1_fallback', newline='') as file:
+            reader = csv.reader(file)
+            header = next(reader, None)
+            if header is None:
+                return
             
-            for encoding in encodings:
-                try:
-                    with open(file_path, 'r', encoding=encoding) as file:
-                        text = file.read().strip()
-                        print(f"✅ Read {len(text)} characters from TXT (encoding: {encoding})")
-                        return text
-                except UnicodeDecodeError:
-                    continue
+            header_line = f"HEADERS: {','.join(header)}"
+            rows, size = [], len(header_line)
             
-            # If all encodings fail, try binary mode
-            print("⚠️ All text encodings failed, trying binary mode")
-            with open(file_path, 'rb') as file:
-                content = file.read()
-                # Try to decode as UTF-8, replacing errors
-                text = content.decode('utf-8', errors='replace').strip()
-                print(f"✅ Read {len(text)} characters from TXT (binary mode)")
-                return text
+            for i, row in enumerate(reader, 1):
+                if not any(cell.strip() for cell in row):
+                    continue
+                row_line = f"Row {i}: {','.join(row)}"
                 
+                if rows and (size + len(row_line) + 1 > max_chars or len(rows) >= max_rows):
+                    yield "\n".join([header_line] + rows)
+                    rows, size = [], len(header_line)
+                
+                rows.append(row_line)
+                size += len(row_line) + 1
+            
+            if rows:
+                yield "\n".join([header_line] + rows)
+    
+    @classmethod
+    def read_txt(cls, file_path: str) -> str:
+        """
+        Read plain text file with multiple encoding support
+        
+        Args:
+            file_path: Path to text file
+            
+        Returns:
+            File content or empty string on error
+        """
+        try:
+            text = "\n".join(cls.iter_txt_batches(file_path))
+            print(f"✅ Read {len(text)} characters from TXT")
+            return text
         except Exception as e:
             print(f"❌ Error reading TXT {file_path}: {e}")
             return ""
     
-    @staticmethod
-    def read_csv(file_path: str) -> str:
+    @classmethod
+    def read_csv(cls, file_path: str) -> str:
         """
         Read CSV file and convert to text format
         
@@ -162,27 +290,15 @@ class DocumentReader:
             CSV content as formatted text
         """
         try:
-            if not os.path.exists(file_path):
-                print(f"❌ CSV file not found: {file_path}")
-                return ""
-            
-            with open(file_path, 'r', encoding='utf-8') as file:
-                lines = file.readlines()
-                
-                # Format CSV as readable text
-                text_lines = []
-                for i, line in enumerate(lines):
-                    line = line.strip()
-                    if line:
-                        if i == 0:
-                            text_lines.append(f"HEADERS: {line}")
-                        else:
-                            text_lines.append(f"Row {i}: {line}")
-                
-                full_text = "\n".join(text_lines)
-                print(f"✅ Read {len(lines)} rows from CSV")
-                return full_text
-                
+            batches = cls.iter_csv_batches(file_path, max_chars=1024 * 1024, max_rows=10000)
+            lines = []
+            for index, batch in enumerate(batches):
+                # Only the first batch keeps its header line
+                lines.extend(batch.split("\n")[0 if index == 0 else 1:])
+            
+            full_text = "\n".join(lines)
+            print(f"✅ Read {max(len(lines) - 1, 0)} rows from CSV")
+            return full_text
         except Exception as e:
             print(f"❌ Error reading CSV {file_path}: {e}")
             return ""
@@ -202,13 +318,14 @@ class DocumentReader:
         return DocumentReader.read_txt(file_path)
     
     @classmethod
-    def read_document(cls, file_path: str, doc_type: str = None) -> str:
+    def read_document(cls, file_path: str, doc_type: str = None, use_cache: bool = True) -> str:
         """
         Read document based on type with auto-detection
         
         Args:
             file_path: Path to document
             doc_type: Document type (pdf, docx, txt, csv, md) or None for auto-detect
+            use_cache: Reuse text extracted earlier from a file with the same bytes
             
         Returns:
             Extracted text or empty string on error
@@ -224,26 +341,52 @@ class DocumentReader:
             print(f"\n📖 Reading document: {os.path.basename(file_path)}")
             print(f"   Type: {doc_type}")
             
+            cache = cls._text_cache() if use_cache and os.path.exists(file_path) else None
+            if cache is not None:
+                key = cache.cache_key(file_path, doc_type, cls.EXTRACTOR_VERSION)
+                cached = cache.get(key)
+                if cached is not None:
+                    print(f"⚡ Extracted text cache hit ({len(cached['text'])} characters)")
+                    return cached["text"]
+            
             # Route to appropriate reader
             if doc_type == 'pdf':
-                return cls.read_pdf(file_path)
+                pages = cls.read_pdf_pages(file_path)
+                if cache is not None and pages:
+                    cache.set_pages(key, pages)
+                text = "\n\n".join(page_text for _, page_text in pages)
+                print(f"✅ Extracted {len(text)} characters from PDF")
+                return text
             elif doc_type == 'docx' or doc_type == 'doc':
-                return cls.read_docx(file_path)
+                text = cls.read_docx(file_path)
             elif doc_type == 'txt':
-                return cls.read_txt(file_path)
+                text = cls.read_txt(file_path)
             elif doc_type == 'csv':
-                return cls.read_csv(file_path)
+                text = cls.read_csv(file_path)
             elif doc_type == 'md' or doc_type == 'markdown':
-                return cls.read_markdown(file_path)
+                text = cls.read_markdown(file_path)
             else:
                 print(f"❌ Unsupported document type: {doc_type}")
                 print(f"   Supported formats: {', '.join(cls.SUPPORTED_FORMATS)}")
                 return ""
+            
+            if cache is not None and text:
+                cache.set(key, text)
+            return text
                 
         except Exception as e:
             print(f"❌ Error in read_document: {e}")
             return ""
     
+    @staticmethod
+    def _text_cache():
+        """Shared extracted-text cache (needs Django settings; None outside the app)"""
+        try:
+            from .text_cache import get_text_cache
+            return get_text_cache()
+        except Exception:
+            return None
+    
     @classmethod
     def get_document_info(cls, file_path: str) -> Dict:
         """
@@ -293,8 +436,8 @@ class DocumentReader:
             # Get line count for text files
             elif doc_type in ['txt', 'csv', 'md']:
                 try:
-                    with open(file_path, 'r', encoding='utf-8') as file:
-                        info["line_count"] = len(file.readlines())
+                    with open(file_path, 'rb') as file:
+                        info["line_count"] = sum(1 for _ in file)
                 except:
                     pass
             
@@ -0,0 +1,214 @@
+# ============================================
+# QUERY RESULT CACHE
+# File: apps/rag_system/services/query_cache.py
+# ============================================
+
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, Optional
+
+from django.db.models import F
+from django.utils import timezone
+
+from ..conf import rag_setting
+from ..models import QueryCache
+from ..utils import normalize_query, create_query_hash
+
+
+class QueryResultCache:
+    """
+    Two-tier cache for final RAG answers.
+
+    L1 is a small in-process dict with LFU eviction (lowest hit count,
+    then least recently used). L2 is the rag_query_cache table, shared by
+    all workers and trimmed the same way. Keys are the normalized query
+    text scoped by user role, so different roles never share answers.
+    """
+
+    HIT_FLUSH_EVERY = 10
+
+    def __init__(self, ttl: int = None, l1_size: int = None, l1_ttl: int = None, max_entries: int = None):
+        self.ttl = ttl or rag_setting('QUERY_CACHE_TTL')
+        self.l1_size = l1_size or rag_setting('QUERY_CACHE_L1_SIZE')
+        # L1 entries expire sooner so a cache clear in another worker propagates
+        self.l1_ttl = min(l1_ttl or rag_setting('QUERY_CACHE_L1_TTL'), self.ttl)
+        self.max_entries = max_entries or rag_setting('QUERY_CACHE_MAX_ENTRIES')
+
+        self._l1: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._writes_since_trim = 0
+
+        self.hits = 0
+        self.l1_hits = 0
+        self.misses = 0
+
+    def make_key(self, query: str, user_role: str = '') -> str:
+        """Cache key for a query as asked by a given role"""
+        return create_query_hash(normalize_query(query), scope=user_role or '')
+
+    def get(self, query: str, user_role: str = '') -> Optional[Dict]:
+        """Return a cached result dict or None"""
+        key = self.make_key(query, user_role)
+        now = time.time()
+
+        flush = 0
+        result = None
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry and entry["expires_at"] > now:
+                entry["hits"] += 1
+                entry["pending_hits"] += 1
+                entry["last_used"] = now
+                self.hits += 1
+                self.l1_hits += 1
+                # Push L1 hits to the shared row in batches, not per request
+                if entry["pending_hits"] >= self.HIT_FLUSH_EVERY:
+                    flush, entry["pending_hits"] = entry["pending_hits"], 0
+                result = dict(entry["result"])
+            elif entry:
+                del self._l1[key]
+
+        if result is not None:
+            if flush:
+                self._touch_db(key, flush)
+            return result
+
+        try:
+            row = QueryCache.objects.filter(query_hash=key).first()
+        except Exception as e:
+            print(f"⚠️ Query cache lookup failed: {e}")
+            row = None
+
+        if row is None or row.created_at < timezone.now() - timedelta(seconds=self.ttl):
+            if row is not None:
+                QueryCache.objects.filter(pk=row.pk).delete()
+            with self._lock:
+                self.misses += 1
+            return None
+
+        self._touch_db(key)
+        result = self._row_to_result(row)
+        remaining = self.ttl - (timezone.now() - row.created_at).total_seconds()
+
+        with self._lock:
+            self.hits += 1
+            self._store_l1(key, result, min(self.l1_ttl, remaining), hits=row.hit_count + 1)
+
+        return dict(result)
+
+    def set(self, query: str, user_role: str, result: Dict):
+        """Store a successful result in both tiers"""
+        if not result.get("success") or result.get("cached"):
+            return
+
+        key = self.make_key(query, user_role)
+        cached_result = {
+            "query": result.get("query", query),
+            "response": result.get("response", ""),
+            "context_sources": result.get("context_sources", {}),
+            "query_type": result.get("query_type"),
+        }
+
+        with self._lock:
+            self._store_l1(key, cached_result, self.l1_ttl)
+            self._writes_since_trim += 1
+            should_trim = self._writes_since_trim >= 50
+            if should_trim:
+                self._writes_since_trim = 0
+
+        try:
+            QueryCache.objects.update_or_create(
+                query_hash=key,
+                defaults={
+                    "query_text": normalize_query(query),
+                    "user_role": user_role or '',
+                    "response": cached_result["response"],
+                    "context": {
+                        "context_sources": cached_result["context_sources"],
+                        "query_type": cached_result["query_type"],
+                    },
+                    "hit_count": 0,
+                    "created_at": timezone.now(),
+                }
+            )
+            if should_trim:
+                self.trim()
+        except Exception as e:
+            print(f"⚠️ Query cache write failed: {e}")
+
+    def clear(self) -> int:
+        """Clear both tiers; returns number of database rows removed"""
+        with self._lock:
+            self._l1.clear()
+        return QueryCache.objects.all().delete()[0]
+
+    def clear_local(self):
+        """Clear only this process's L1"""
+        with self._lock:
+            self._l1.clear()
+
+    def evict_expired(self) -> int:
+        """Delete database entries older than the TTL"""
+        cutoff = timezone.now() - timedelta(seconds=self.ttl)
+        return QueryCache.objects.filter(created_at__lt=cutoff).delete()[0]
+
+    def trim(self) -> int:
+        """LFU eviction of the database tier down to max_entries"""
+        excess = QueryCache.objects.count() - self.max_entries
+        if excess <= 0:
+            return 0
+        victims = list(
+            QueryCache.objects.order_by('hit_count', 'last_used').values_list('pk', flat=True)[:excess]
+        )
+        return QueryCache.objects.filter(pk__in=victims).delete()[0]
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "l1_hits": self.l1_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups * 100, 2) if lookups else 0.0,
+            "l1_entries": len(self._l1),
+            "ttl_seconds": self.ttl,
+        }
+
+    def _store_l1(self, key: str, result: Dict, ttl: float, hits: int = 0):
+        """Insert into L1, evicting the least frequently used entry if full"""
+        now = time.time()
+        if key not in self._l1 and len(self._l1) >= self.l1_size:
+            expired = [k for k, e in self._l1.items() if e["expires_at"] <= now]
+            for k in expired:
+                del self._l1[k]
+            if len(self._l1) >= self.l1_size:
+                victim = min(self._l1, key=lambda k: (self._l1[k]["hits"], self._l1[k]["last_used"]))
+                del self._l1[victim]
+
+        self._l1[key] = {
+            "result": result,
+            "expires_at": now + ttl,
+            "hits": hits,
+            "pending_hits": 0,
+            "last_used": now,
+        }
+
+    def _touch_db(self, key: str, hits: int = 1):
+        """Record hits on the shared row (drives LFU trimming)"""
+        try:
+            QueryCache.objects.filter(query_hash=key).update(
+                hit_count=F('hit_count') + hits,
+                last_used=timezone.now()
+            )
+        except Exception as e:
+            print(f"⚠️ Query cache hit update failed: {e}")
+
+    @staticmethod
+    def _row_to_result(row: QueryCache) -> Dict:
+        context = row.context or {}
+        return {
+            "query": row.query_text,
+            "response": row.response,
+            "context_sources": context.get("context_sources", {}),
+            "query_type": context.get("query_type"),
+        }
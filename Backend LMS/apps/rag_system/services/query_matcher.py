@@ -0,0 +1,428 @@
+# ============================================
+# PRECOMPILED QUERY MATCHER
+# File: apps/rag_system/services/query_matcher.py
+# ============================================
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from ..conf import rag_setting
+
+
+# Intent keywords, checked in this order by QueryMatch.intent (QueryType values)
+CONVERSATIONAL_KEYWORDS = [
+    'hello', 'hi', 'hey', 'thanks', 'thank you',
+    'good morning', 'good afternoon', 'what can you do',
+    'help', 'who are you', 'how are you'
+]
+DATABASE_KEYWORDS = [
+    'how many', 'count', 'total', 'number of',
+    'show', 'list', 'display', 'get', 'find'
+]
+LMS_ENTITIES = [
+    'user', 'student', 'teacher', 'parent', 'role',
+    'class', 'subject', 'exam', 'fee', 'attendance',
+    'vehicle', 'route', 'employee', 'assignment', 'leave'
+]
+COLUMN_KEYWORDS = ['with', 'where', 'having', 'by']
+ANALYTICAL_KEYWORDS = ['how many', 'count', 'total', 'average']
+PROCEDURAL_KEYWORDS = ['how to', 'how do i', 'steps', 'guide']
+
+# Answer shape reported in context sources, first match wins
+QUERY_SHAPES = {
+    "counting": ["how many", "count", "total", "number of"],
+    "listing": ["show", "list", "display", "get all"],
+    "details": ["details", "information", "tell me about"],
+    "filtering": ["with", "where", "having", "by", "for"],
+}
+
+# Entity metadata values used by the knowledge builder, with the words
+# a question might use for them (vector search filters)
+ENTITY_KEYWORDS = {
+    "user": ["user", "account", "profile"],
+    "student": ["student", "pupil", "learner"],
+    "teacher": ["teacher", "instructor", "faculty"],
+    "parent": ["parent", "guardian"],
+    "role": ["role", "permission"],
+    "class": ["class", "grade", "section"],
+    "subject": ["subject", "course"],  # table docs tag course tables as "subject"
+    "course": ["course"],
+    "exam": ["exam", "test", "assessment", "result"],
+    "fee": ["fee", "payment", "invoice", "billing"],
+    "attendance": ["attendance", "present", "absent"],
+    "vehicle": ["vehicle", "bus", "transport"],
+    "route": ["route"],
+    "employee": ["employee", "staff"],
+    "assignment": ["assignment", "homework"],
+    "leave": ["leave", "vacation"],
+    "department": ["department"],
+    "quiz": ["quiz"],
+    "certificate": ["certificate"],
+    "timetable": ["timetable", "schedule"],
+    "message": ["message", "notification", "announcement"],
+}
+
+# Rewrites for vector search query expansion (entity -> synonyms)
+QUERY_SYNONYMS = {
+    "user": ["account", "profile"],
+    "student": ["pupil", "learner"],
+    "teacher": ["instructor", "faculty"],
+    "class": ["grade", "section"],
+    "exam": ["test", "assessment"],
+    "fee": ["payment", "invoice"]
+}
+
+# Words that point table discovery at an entity (broader than the filters)
+TABLE_KEYWORDS = {
+    'user': ['user', 'account', 'profile', 'auth'],
+    'student': ['student', 'pupil', 'learner'],
+    'teacher': ['teacher', 'instructor', 'faculty', 'staff'],
+    'parent': ['parent', 'guardian'],
+    'class': ['class', 'grade', 'section'],
+    'subject': ['subject', 'course', 'discipline'],
+    'exam': ['exam', 'test', 'assessment', 'result'],
+    'fee': ['fee', 'payment', 'invoice', 'billing'],
+    'attendance': ['attendance', 'present', 'absent'],
+    'vehicle': ['vehicle', 'bus', 'transport'],
+    'route': ['route', 'path'],
+    'assignment': ['assignment', 'homework', 'submission'],
+    'leave': ['leave', 'absence', 'vacation'],
+    'employee': ['employee', 'staff', 'worker'],
+    'department': ['department', 'division'],
+    'quiz': ['quiz', 'test', 'question'],
+    'certificate': ['certificate', 'credential'],
+    'timetable': ['timetable', 'schedule', 'time_slot'],
+    'message': ['message', 'notification', 'announcement'],
+}
+
+# Likely tables per entity word, most likely first (DatabaseConnector
+# uses the first one that exists)
+ENTITY_TABLES = {
+    # User-related
+    'user': ['users_user', 'auth_user'],
+    'users': ['users_user', 'auth_user'],
+
+    # Student-related
+    'student': ['students', 'student_behavior', 'student_discounts'],
+    'students': ['students', 'student_behavior', 'student_discounts'],
+
+    # Teacher-related
+    'teacher': ['teachers', 'teachers_teacher'],
+    'teachers': ['teachers', 'teachers_teacher'],
+
+    # Role-related
+    'role': ['users_role', 'users_role_permissions', 'auth_group'],
+    'roles': ['users_role', 'users_role_permissions', 'auth_group'],
+
+    # Parent-related
+    'parent': ['parents', 'parents_students'],
+    'parents': ['parents', 'parents_students'],
+
+    # Class-related
+    'class': ['classes', 'class_subjects'],
+    'classes': ['classes', 'class_subjects'],
+
+    # Subject-related
+    'subject': ['subjects', 'class_subjects'],
+    'subjects': ['subjects', 'class_subjects'],
+
+    # Vehicle-related
+    'vehicle': ['vehicles'],
+    'vehicles': ['vehicles'],
+
+    # Route-related
+    'route': ['routes'],
+    'routes': ['routes'],
+
+    # Exam-related
+    'exam': ['exams', 'exam_results', 'exam_schedules', 'exam_types'],
+    'exams': ['exams', 'exam_results', 'exam_schedules', 'exam_types'],
+
+    # Fee-related
+    'fee': ['fee_invoices', 'fee_payments', 'fee_structures', 'fee_types'],
+    'fees': ['fee_invoices', 'fee_payments', 'fee_structures', 'fee_types'],
+
+    # Attendance-related
+    'attendance': ['daily_attendance', 'attendance_summary', 'attendance_configuration'],
+
+    # Book/Library-related
+    'book': ['images_images', 'images_categories'],
+    'books': ['images_images', 'images_categories'],
+
+    # Employee-related
+    'employee': ['users_employee'],
+    'employees': ['users_employee'],
+
+    # Permission-related
+    'permission': ['users_permission', 'auth_permission'],
+    'permissions': ['users_permission', 'auth_permission'],
+
+    # Assignment-related
+    'assignment': ['assignments', 'assignment_submissions'],
+    'assignments': ['assignments', 'assignment_submissions'],
+
+    # Leave-related
+    'leave': ['leave_applications', 'leave_balances', 'leave_types'],
+    'leaves': ['leave_applications', 'leave_balances', 'leave_types'],
+
+    # Message-related
+    'message': ['messages'],
+    'messages': ['messages'],
+
+    # Notification-related
+    'notification': ['notifications'],
+    'notifications': ['notifications'],
+
+    # Department-related
+    'department': ['departments'],
+    'departments': ['departments'],
+
+    # Course-related
+    'course': ['courses', 'course_enrollments'],
+    'courses': ['courses', 'course_enrollments'],
+
+    # Quiz-related
+    'quiz': ['quizzes', 'quiz_answers', 'quiz_attempts'],
+    'quizzes': ['quizzes', 'quiz_answers', 'quiz_attempts'],
+
+    # Timetable-related
+    'timetable': ['timetables', 'time_slots'],
+    'timetables': ['timetables', 'time_slots'],
+
+    # Certificate-related
+    'certificate': ['certificates', 'certificate_templates'],
+    'certificates': ['certificates', 'certificate_templates'],
+}
+
+# Substrings of a table name that identify its entity, first entity wins
+TABLE_NAME_ENTITIES = {
+    "user": ["user", "account"],
+    "student": ["student", "pupil"],
+    "teacher": ["teacher", "instructor"],
+    "role": ["role", "permission"],
+    "class": ["class", "grade", "section"],
+    "subject": ["subject", "course"],
+    "exam": ["exam", "test", "result"],
+    "fee": ["fee", "payment", "invoice"],
+    "attendance": ["attendance"],
+    "vehicle": ["vehicle", "transport"],
+    "route": ["route"],
+    "parent": ["parent", "guardian"],
+    "employee": ["employee", "staff"],
+    "assignment": ["assignment"],
+    "leave": ["leave"],
+    "department": ["department"],
+    "quiz": ["quiz"],
+    "certificate": ["certificate"],
+}
+JUNCTION_TABLE_MARKERS = [
+    '_permissions', '_groups_', 'permission', 'token',
+    'blacklist', 'log', 'migration', 'session', 'admin'
+]
+# Framework tables: left out of the schema context and never queried for users
+SYSTEM_TABLE_PREFIXES = ('django_', 'auth_', 'token_blacklist')
+# Columns never shown, filtered on or sent to the LLM, whatever the question
+SENSITIVE_COLUMN_PATTERN = re.compile(
+    r"password|token|secret|hash|salt|otp|api_key|session|(?:^|_)keys?(?:_|$)|(?:^|_)pin$"
+)
+
+
+class QueryMatch:
+    """Everything the keyword vocabularies say about one query"""
+
+    __slots__ = ("terms", "intent", "shape", "entities", "table_entities", "candidate_tables")
+
+    def __init__(self, terms: frozenset, intent: str, shape: str, entities: Tuple[str, ...],
+                 table_entities: Tuple[str, ...], candidate_tables: Tuple[str, ...]):
+        self.terms = terms
+        self.intent = intent
+        self.shape = shape
+        self.entities = entities
+        self.table_entities = table_entities
+        self.candidate_tables = candidate_tables
+
+    def as_dict(self) -> Dict:
+        return {
+            "intent": self.intent,
+            "shape": self.shape,
+            "entities": list(self.entities),
+            "table_entities": list(self.table_entities),
+            "candidate_tables": list(self.candidate_tables),
+        }
+
+
+class QueryMatcher:
+    """
+    All keyword vocabularies compiled into one alternation regex.
+
+    One pass over the query finds every vocabulary term (whole words,
+    longest phrase first, with a plural/-ed/-ing ending except for
+    greetings, so "hi" no longer matches "this"). The terms give the
+    intent (QueryType value), the answer shape, the entities for vector
+    filters, and the entities and candidate tables for table discovery.
+    Results are cached per normalized query.
+    """
+
+    def __init__(self, cache_size: int = None):
+        self.cache_size = cache_size or rag_setting('QUERY_MATCHER_CACHE_SIZE')
+        self._tags: Dict[str, List[Tuple[str, str]]] = {}
+        self._exact = set(CONVERSATIONAL_KEYWORDS)
+
+        self._tag(CONVERSATIONAL_KEYWORDS, "conversational")
+        self._tag(DATABASE_KEYWORDS, "database")
+        self._tag(LMS_ENTITIES, "lms_entity")
+        self._tag(COLUMN_KEYWORDS, "column")
+        self._tag(ANALYTICAL_KEYWORDS, "analytical")
+        self._tag(PROCEDURAL_KEYWORDS, "procedural")
+        for shape, keywords in QUERY_SHAPES.items():
+            self._tag(keywords, "shape", shape)
+        for entity, keywords in ENTITY_KEYWORDS.items():
+            self._tag(keywords, "entity", entity)
+        for entity, keywords in TABLE_KEYWORDS.items():
+            self._tag(keywords, "table_entity", entity)
+
+        # Only the longest term is reported where several start at the same
+        # word ("get all" / "get"), so a phrase carries the terms inside it and their tags
+        self._inner: Dict[str, List[str]] = {}
+        for term in self._tags:
+            self._inner[term] = [
+                other for other in self._tags
+                if other == term or re.search(r"\b" + re.escape(other) + r"\b", term)
+            ]
+        self._tags = {
+            term: list(dict.fromkeys(tag for inner in self._inner[term] for tag in self._tags[inner]))
+            for term in self._tags
+        }
+
+        self._pattern = re.compile(
+            r"\b(" + "|".join(sorted(map(re.escape, self._tags), key=len, reverse=True)) + r")(es|s|ed|ing)?\b"
+        )
+        self._shape_order = {shape: i for i, shape in enumerate(QUERY_SHAPES)}
+        self._table_order = {entity: i for i, entity in enumerate(TABLE_KEYWORDS)}
+
+        self._cache: "OrderedDict[str, QueryMatch]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def match(self, query: str) -> QueryMatch:
+        key = " ".join((query or "").lower().split())
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        result = self._match(key)
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "terms": len(self._tags),
+            "cached_queries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups * 100, 2) if lookups else 0.0,
+        }
+
+    def _tag(self, keywords: List[str], category: str, value: str = ""):
+        for keyword in keywords:
+            tags = self._tags.setdefault(keyword, [])
+            if (category, value) not in tags:
+                tags.append((category, value))
+
+    def _match(self, text: str) -> QueryMatch:
+        terms = []
+        found: Dict[str, List[str]] = {}
+        for hit in self._pattern.finditer(text):
+            term, ending = hit.group(1), hit.group(2)
+            if ending and term in self._exact:
+                continue
+            terms.extend(self._inner[term])
+            for category, value in self._tags[term]:
+                found.setdefault(category, []).append(value)
+
+        if "conversational" in found:
+            intent = "conversational"
+        elif "database" in found and "lms_entity" in found:
+            intent = "database_query"
+        elif "column" in found:
+            intent = "column_query"
+        elif "analytical" in found:
+            intent = "analytical"
+        elif "procedural" in found:
+            intent = "procedural"
+        else:
+            intent = "factual"
+
+        shapes = found.get("shape")
+        table_entities = sorted(set(found.get("table_entity", [])), key=self._table_order.get)
+        candidate_tables = [table for entity in table_entities for table in ENTITY_TABLES.get(entity, [])]
+        return QueryMatch(
+            terms=frozenset(terms),
+            intent=intent,
+            shape=min(shapes, key=self._shape_order.get) if shapes else "general",
+            entities=tuple(dict.fromkeys(found.get("entity", []))),
+            table_entities=tuple(table_entities),
+            candidate_tables=tuple(dict.fromkeys(candidate_tables)),
+        )
+
+
+def _substring_pattern(keywords: List[str]) -> "re.Pattern":
+    # Lookahead: every (possibly overlapping) occurrence in one scan
+    return re.compile("(?=(" + "|".join(sorted(map(re.escape, keywords), key=len, reverse=True)) + "))")
+
+
+_TABLE_NAME_TO_ENTITY = {}
+for _entity, _keywords in TABLE_NAME_ENTITIES.items():
+    for _keyword in _keywords:
+        _TABLE_NAME_TO_ENTITY.setdefault(_keyword, _entity)
+_TABLE_NAME_PATTERN = _substring_pattern(list(_TABLE_NAME_TO_ENTITY))
+_TABLE_ENTITY_ORDER = {entity: i for i, entity in enumerate(TABLE_NAME_ENTITIES)}
+_JUNCTION_PATTERN = re.compile("|".join(map(re.escape, JUNCTION_TABLE_MARKERS)))
+
+_matcher: Optional[QueryMatcher] = None
+_matcher_lock = threading.Lock()
+
+
+def query_matcher() -> QueryMatcher:
+    """Process-wide matcher, compiled on first use"""
+    global _matcher
+    if _matcher is None:
+        with _matcher_lock:
+            if _matcher is None:
+                _matcher = QueryMatcher()
+    return _matcher
+
+
+def match_query(query: str) -> QueryMatch:
+    return query_matcher().match(query)
+
+
+def table_entity(table_name: str) -> str:
+    """Entity a table name belongs to ("unknown" if none)"""
+    entities = [_TABLE_NAME_TO_ENTITY[hit.group(1)] for hit in _TABLE_NAME_PATTERN.finditer(table_name.lower())]
+    return min(entities, key=_TABLE_ENTITY_ORDER.get) if entities else "unknown"
+
+
+def is_junction_table(table_name: str) -> bool:
+    """Whether a table name looks like a junction, log or framework table"""
+    return _JUNCTION_PATTERN.search(table_name.lower()) is not None
+
+
+def is_system_table(table_name: str) -> bool:
+    """Framework, auth or junction table: never exposed through generated SQL"""
+    return table_name.lower().startswith(SYSTEM_TABLE_PREFIXES) or is_junction_table(table_name)
+
+
+def is_sensitive_column(column_name: str) -> bool:
+    return SENSITIVE_COLUMN_PATTERN.search(column_name.lower()) is not None
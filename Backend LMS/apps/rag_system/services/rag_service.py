@@ -199,21 +199,52 @@
 # File: apps/rag_system/services/rag_service.py
 # ============================================
 
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional, Tuple
+import asyncio
 import time
+from asgiref.sync import sync_to_async
 from .groq_service import GroqService
 from .vectorstore_service import VectorStoreService
 from .database_connector import DatabaseConnector
+from .query_cache import QueryResultCache
+from .semantic_cache import SemanticAnswerCache
+from .retrieval_filters import build_where_filter, detect_entities
+from .query_matcher import match_query
+from .stage_timer import stage, timed
+from .context_packer import ContextPacker, PackedContext
+from .text_to_sql import TextToSQLEngine
+from ..conf import rag_setting
+
+
+# Query types (orchestrator QueryType values) answered with rows from generated SQL
+SQL_QUERY_TYPES = ("database_query", "analytical")
 
 
 class VectorStoreRAGService:
     """Enhanced RAG Service with PostgreSQL + Vector Store"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        groq_service: GroqService = None,
+        vectorstore: VectorStoreService = None,
+        db_connector: DatabaseConnector = None,
+        query_cache: QueryResultCache = None,
+        semantic_cache: SemanticAnswerCache = None,
+        context_packer: ContextPacker = None,
+        text_to_sql: TextToSQLEngine = None
+    ):
         print("🚀 Initializing Enhanced RAG Service...")
-        self.groq_service = GroqService()
-        self.vectorstore = VectorStoreService()
-        self.db_connector = DatabaseConnector()
+        self.groq_service = groq_service or GroqService()
+        self.db_connector = db_connector or DatabaseConnector()
+        self.vectorstore = vectorstore or VectorStoreService(db_connector=self.db_connector)
+        self.query_cache = query_cache or QueryResultCache()
+        self.context_packer = context_packer or ContextPacker()
+        self.semantic_cache = semantic_cache
+        if self.semantic_cache is None and rag_setting('SEMANTIC_CACHE_ENABLED'):
+            self.semantic_cache = SemanticAnswerCache(self.vectorstore.embeddings)
+        self.text_to_sql = text_to_sql
+        if self.text_to_sql is None and rag_setting('TEXT_TO_SQL_ENABLED'):
+            self.text_to_sql = TextToSQLEngine(self.groq_service, self.db_connector)
         
         # Initialize vector store with database knowledge
         self._initialize_knowledge_base()
@@ -227,107 +258,383 @@ class VectorStoreRAGService:
         except Exception as e:
             print(f"⚠️ Error initializing knowledge base: {e}")
     
-    def process_query(self, query: str, user_context: Dict = None, use_cache: bool = True) -> Dict:
-        """Process query using Vector Store + Database"""
+    def process_query(self, query: str, user_context: Dict = None, use_cache: bool = True,
+                      query_type: str = None) -> Dict:
+        """
+        Process query using Vector Store + Database.
+        
+        query_type is the orchestrator's classification (a QueryType value);
+        with detected entities it narrows the vector search.
+        """
         start_time = time.time()
+        user_role = (user_context or {}).get('user_type', 'user')
         
         print(f"\n🔍 Processing query: '{query}'")
         
+        query_embedding = None
+        if use_cache:
+            cached, query_embedding = self._lookup_cache(query, user_role, start_time)
+            if cached:
+                return cached
+        
         try:
-            # Step 1: Search vector store for relevant knowledge
-            print("📚 Searching vector store...")
-            search_results = self.vectorstore.search(query, k=10)
+            retrieval = self._retrieve(query, query_type)
             
-            # Step 2: Extract database context
-            db_context = self._extract_database_context(query, search_results)
+            # Generate response with GROQ
+            print("🤖 Generating response with GROQ...")
+            with stage("llm"):
+                response_data = self.groq_service.generate_response(
+                    query=query,
+                    context=retrieval["context"],
+                    system_prompt=retrieval["system_prompt"]
+                )
             
-            # Step 3: Build enhanced context
-            context = self._build_context(query, search_results, db_context)
+            result = self._build_result(query, retrieval, response_data, start_time)
             
-            # Step 4: Create system prompt
-            system_prompt = self._create_system_prompt(query, search_results, db_context)
+            if use_cache:
+                self._store_cache(query, user_role, result, query_embedding)
             
-            # Step 5: Generate response with GROQ
-            print("🤖 Generating response with GROQ...")
-            response_data = self.groq_service.generate_response(
+            print(f"✅ Query processed in {result['response_time']:.2f}s")
+            return result
+        
+        except Exception as e:
+            print(f"❌ Error processing query: {e}")
+            import traceback
+            traceback.print_exc()
+            return self._error_result(query, e, start_time)
+    
+    def stream_query(self, query: str, user_context: Dict = None, use_cache: bool = True,
+                     query_type: str = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        Streaming variant of process_query.
+        
+        Yields ("metadata", ...) once retrieval is done, then ("token", ...)
+        for each piece of the GROQ completion, then ("done", result) with
+        the same result dict process_query would have returned.
+        """
+        start_time = time.time()
+        user_role = (user_context or {}).get('user_type', 'user')
+        
+        query_embedding = None
+        if use_cache:
+            cached, query_embedding = self._lookup_cache(query, user_role, start_time)
+            if cached:
+                yield "metadata", {"query": query, "context_sources": cached["context_sources"], "cached": True}
+                yield "token", {"content": cached["response"]}
+                yield "done", cached
+                return
+        
+        try:
+            retrieval = self._retrieve(query, query_type)
+            yield "metadata", {
+                "query": query,
+                "context_sources": self._context_sources(query, retrieval),
+                "cached": False
+            }
+            
+            parts = []
+            response_data = {"success": False, "tokens_used": 0}
+            for chunk in self.groq_service.generate_response_stream(
                 query=query,
-                context=context,
-                system_prompt=system_prompt
+                context=retrieval["context"],
+                system_prompt=retrieval["system_prompt"]
+            ):
+                if chunk["type"] == "token":
+                    parts.append(chunk["content"])
+                    yield "token", {"content": chunk["content"]}
+                else:
+                    response_data = chunk
+            
+            if parts:
+                response_data["response"] = "".join(parts)
+            result = self._build_result(query, retrieval, response_data, start_time)
+            if result.get("degraded") and not parts:
+                yield "token", {"content": result["response"]}
+            
+            if use_cache:
+                self._store_cache(query, user_role, result, query_embedding)
+            
+            yield "done", result
+        
+        except Exception as e:
+            print(f"❌ Error streaming query: {e}")
+            yield "done", self._error_result(query, e, start_time)
+    
+    async def aprocess_query(self, query: str, user_context: Dict = None, use_cache: bool = True,
+                             query_type: str = None) -> Dict:
+        """
+        Async variant of process_query for ASGI deployments.
+        
+        Vector search (CPU, no Django DB access) runs in a worker thread
+        while query-based database context is fetched on Django's DB thread,
+        so the two overlap; the GROQ call is awaited on the event loop and
+        holds no thread at all.
+        """
+        start_time = time.time()
+        user_role = (user_context or {}).get('user_type', 'user')
+        
+        query_embedding = None
+        if use_cache:
+            cached, query_embedding = await sync_to_async(self._lookup_cache)(query, user_role, start_time)
+            if cached:
+                return cached
+        
+        try:
+            where = self._retrieval_filter(query, query_type)
+            search_results, db_context = await asyncio.gather(
+                sync_to_async(self.vectorstore.search, thread_sensitive=False)(query, k=10, where=where),
+                sync_to_async(timed("db_context", self._discover_database_context))(query)
             )
+            with stage("db_context"):
+                db_context = await sync_to_async(self._merge_search_context)(db_context, search_results)
+            sql_result = await sync_to_async(self._query_database)(query, query_type, db_context)
             
-            response_time = time.time() - start_time
+            with stage("prompt_build"):
+                packed = self._build_context(query, search_results, db_context, sql_result)
+                retrieval = {
+                    "search_results": search_results,
+                    "retrieval_filter": where,
+                    "db_context": db_context,
+                    "sql_result": sql_result,
+                    "context": packed.context,
+                    "context_stats": packed.stats(),
+                    "system_prompt": self._create_system_prompt(query, search_results, db_context)
+                }
             
-            # Prepare result
-            result = {
-                "query": query,
-                "response": response_data.get("response", "No response generated"),
-                "context_sources": {
-                    "vector_store_results": len(search_results),
-                    "database_tables_used": db_context.get("tables_used", []),
-                    "response_method": "vector_store_with_database",
-                    "query_type": self._classify_query(query),
-                    "top_sources": [
-                        {
-                            "type": r.get("metadata", {}).get("type", "unknown"),
-                            "entity": r.get("metadata", {}).get("entity", "unknown"),
-                            "score": round(r.get("score", 0), 3)
-                        }
-                        for r in search_results[:3]
-                    ]
-                },
-                "tokens_used": response_data.get("tokens_used", 0),
-                "response_time": round(response_time, 2),
-                "success": response_data.get("success", True),
-                "cached": False
-            }
+            with stage("llm"):
+                response_data = await self.groq_service.agenerate_response(
+                    query=query,
+                    context=retrieval["context"],
+                    system_prompt=retrieval["system_prompt"]
+                )
             
-            print(f"✅ Query processed in {response_time:.2f}s")
+            result = self._build_result(query, retrieval, response_data, start_time)
+            
+            if use_cache:
+                await sync_to_async(self._store_cache)(query, user_role, result, query_embedding)
+            
+            print(f"✅ Async query processed in {result['response_time']:.2f}s")
             return result
             
         except Exception as e:
-            print(f"❌ Error processing query: {e}")
-            import traceback
-            traceback.print_exc()
+            print(f"❌ Error processing async query: {e}")
+            return self._error_result(query, e, start_time)
+    
+    def _lookup_cache(self, query: str, user_role: str, start_time: float):
+        """Exact then semantic cache lookup; returns (result or None, query embedding)"""
+        cached = self.query_cache.get(query, user_role)
+        if cached:
+            print("⚡ Answer served from query cache")
+            return self._cached_result(query, cached, start_time), None
+        
+        if self.semantic_cache is None:
+            return None, None
+        
+        query_embedding = None
+        try:
+            query_embedding = self.semantic_cache.embed(query)
+            cached = self.semantic_cache.lookup(query, user_role, query_embedding)
+        except Exception as e:
+            print(f"⚠️ Semantic cache lookup failed: {e}")
+            cached = None
+        
+        if not cached:
+            return None, query_embedding
+        
+        print(f"⚡ Answer served from semantic cache (matched '{cached['matched_query']}')")
+        result = self._cached_result(query, cached, start_time)
+        result["context_sources"] = {
+            **result["context_sources"],
+            "cache": "semantic",
+            "matched_query": cached["matched_query"],
+            "similarity": cached["similarity"]
+        }
+        return result, query_embedding
+    
+    def _store_cache(self, query: str, user_role: str, result: Dict, query_embedding=None):
+        """Remember a fresh answer in the exact and semantic caches"""
+        self.query_cache.set(query, user_role, result)
+        if self.semantic_cache is not None and query_embedding is not None:
+            self.semantic_cache.add(query, user_role, result, query_embedding)
+    
+    def _retrieve(self, query: str, query_type: str = None) -> Dict:
+        """Vector search, database context and prompt construction"""
+        # Step 1: Search vector store for relevant knowledge
+        print("📚 Searching vector store...")
+        where = self._retrieval_filter(query, query_type)
+        search_results = self.vectorstore.search(query, k=10, where=where)
+        
+        # Step 2: Extract database context
+        with stage("db_context"):
+            db_context = self._extract_database_context(query, search_results)
+        
+        # Step 3: Exact rows from generated (or cached) SQL for database questions
+        sql_result = self._query_database(query, query_type, db_context)
+        
+        with stage("prompt_build"):
+            # Step 4: Pack the most relevant context into the token budget
+            packed = self._build_context(query, search_results, db_context, sql_result)
             
-            return {
-                "query": query,
-                "response": f"I encountered an error processing your request: {str(e)[:200]}",
-                "context_sources": {},
-                "tokens_used": 0,
-                "response_time": time.time() - start_time,
-                "success": False,
-                "error": str(e)
-            }
+            # Step 5: Create system prompt
+            system_prompt = self._create_system_prompt(query, search_results, db_context)
+        
+        return {
+            "search_results": search_results,
+            "retrieval_filter": where,
+            "db_context": db_context,
+            "sql_result": sql_result,
+            "context": packed.context,
+            "context_stats": packed.stats(),
+            "system_prompt": system_prompt
+        }
+    
+    def _retrieval_filter(self, query: str, query_type: str = None) -> Optional[Dict]:
+        """Chroma where filter from the query type and the entities the query mentions"""
+        if not query_type:
+            return None
+        return build_where_filter(query_type, detect_entities(query))
     
+    def _context_sources(self, query: str, retrieval: Dict) -> Dict:
+        """Describe where the answer's context came from"""
+        search_results = retrieval["search_results"]
+        return {
+            "vector_store_results": len(search_results),
+            "database_tables_used": retrieval["db_context"].get("tables_used", []),
+            "response_method": "vector_store_with_database",
+            "query_type": self._classify_query(query),
+            "retrieval_filter": retrieval.get("retrieval_filter"),
+            "context_tokens": retrieval.get("context_stats"),
+            "sql_query": self._sql_source(retrieval.get("sql_result")),
+            "top_sources": [
+                {
+                    "type": r.get("metadata", {}).get("type", "unknown"),
+                    "entity": r.get("metadata", {}).get("entity", "unknown"),
+                    "score": round(r.get("score", 0), 3)
+                }
+                for r in search_results[:3]
+            ]
+        }
+    
+    def _build_result(self, query: str, retrieval: Dict, response_data: Dict, start_time: float) -> Dict:
+        """Assemble the API result for a generated answer"""
+        response = response_data.get("response", "No response generated")
+        context_sources = self._context_sources(query, retrieval)
+        if response_data.get("degraded"):
+            # GROQ is down or its circuit is open: answer with what retrieval found
+            response = self._degraded_answer(response, retrieval)
+            context_sources["response_method"] = "degraded"
+        
+        result = {
+            "query": query,
+            "response": response,
+            "context_sources": context_sources,
+            "tokens_used": response_data.get("tokens_used", 0),
+            "response_time": round(time.time() - start_time, 2),
+            "success": response_data.get("success", True),
+            "cached": False
+        }
+        if response_data.get("degraded"):
+            result["degraded"] = True
+        return result
+    
+    def _degraded_answer(self, notice: str, retrieval: Dict) -> str:
+        """LLM-free answer: the database facts and the best source found for the query"""
+        lines = [notice]
+        
+        schema_info = retrieval["db_context"].get("schema_info", {})
+        if schema_info:
+            lines += ["", "Here is what I found in the database:"]
+            lines += [
+                f"• {table}: {info.get('row_count', 0)} records ({info.get('entity_type', 'unknown')})"
+                for table, info in schema_info.items()
+            ]
+        
+        sql_result = retrieval.get("sql_result")
+        if sql_result:
+            lines += ["", self._format_sql_result(sql_result)]
+        
+        search_results = retrieval["search_results"]
+        if search_results:
+            lines += ["", "Most relevant reference:", search_results[0].get("content", "")[:500]]
+        
+        return "\n".join(lines)
+    
+    def _error_result(self, query: str, error: Exception, start_time: float) -> Dict:
+        """Result returned when the pipeline raises"""
+        return {
+            "query": query,
+            "response": f"I encountered an error processing your request: {str(error)[:200]}",
+            "context_sources": {},
+            "tokens_used": 0,
+            "response_time": time.time() - start_time,
+            "success": False,
+            "error": str(error)
+        }
+    
+    def _cached_result(self, query: str, cached: Dict, start_time: float) -> Dict:
+        """Shape a cache entry like a freshly generated result"""
+        return {
+            "query": query,
+            "response": cached.get("response", ""),
+            "context_sources": cached.get("context_sources", {}),
+            "tokens_used": 0,
+            "response_time": round(time.time() - start_time, 2),
+            "success": True,
+            "cached": True
+        }
+
     def _extract_database_context(self, query: str, search_results: List[Dict]) -> Dict:
         """Extract database context from search results"""
         print("🗄️ Extracting database context...")
+        db_context = self._discover_database_context(query)
+        return self._merge_search_context(db_context, search_results)
+    
+    def _discover_database_context(self, query: str) -> Dict:
+        """Database context derived from the query alone (no search results needed)"""
+        discovered_tables = self.db_connector.discover_relevant_tables(query)
         
-        # Find relevant tables from search results
-        tables_mentioned = set()
-        entity_types = set()
+        return {
+            "tables_used": list(discovered_tables),
+            "entity_types": [],
+            "schema_info": self._schema_info_for(discovered_tables[:3]),
+            "discovered_tables": discovered_tables
+        }
+    
+    def _merge_search_context(self, db_context: Dict, search_results: List[Dict]) -> Dict:
+        """Add tables and entities referenced by the top search results"""
+        tables_mentioned = list(db_context["tables_used"])
+        entity_types = list(db_context["entity_types"])
         
         for result in search_results[:5]:
             metadata = result.get("metadata", {})
             
             # Extract table names
-            if "table_name" in metadata:
-                tables_mentioned.add(metadata["table_name"])
-            
-            if "main_table" in metadata:
-                tables_mentioned.add(metadata["main_table"])
+            for key in ("table_name", "main_table"):
+                table = metadata.get(key)
+                if table and table not in tables_mentioned:
+                    tables_mentioned.append(table)
             
             # Extract entity types
-            if "entity" in metadata:
-                entity_types.add(metadata["entity"])
+            entity = metadata.get("entity")
+            if entity and entity not in entity_types:
+                entity_types.append(entity)
         
-        # Also discover tables directly from query
-        discovered_tables = self.db_connector.discover_relevant_tables(query)
-        tables_mentioned.update(discovered_tables)
+        # Get schema info for mentioned tables (top 3 overall)
+        schema_info = dict(db_context["schema_info"])
+        missing = [t for t in tables_mentioned[:3] if t not in schema_info]
+        schema_info.update(self._schema_info_for(missing))
         
-        # Get schema info for mentioned tables
+        return {
+            "tables_used": tables_mentioned,
+            "entity_types": entity_types,
+            "schema_info": schema_info,
+            "discovered_tables": db_context["discovered_tables"]
+        }
+    
+    def _schema_info_for(self, tables: List[str]) -> Dict:
+        """Compact schema summary for each table"""
         schema_info = {}
-        for table in list(tables_mentioned)[:3]:  # Top 3 tables
+        for table in tables:
             try:
                 info = self.db_connector.get_table_schema_info(table)
                 schema_info[table] = {
@@ -337,43 +644,59 @@ class VectorStoreRAGService:
                 }
             except Exception as e:
                 print(f"⚠️ Error getting schema for {table}: {e}")
-        
+        return schema_info
+    
+    def _query_database(self, query: str, query_type: Optional[str], db_context: Dict) -> Optional[Dict]:
+        """Rows answering a database question via text-to-SQL, or None"""
+        if self.text_to_sql is None or query_type not in SQL_QUERY_TYPES:
+            return None
+        tables = db_context.get("discovered_tables") or db_context.get("tables_used")
+        if not tables:
+            return None
+        try:
+            return self.text_to_sql.run(query, tables[0])
+        except Exception as e:
+            print(f"⚠️ Text-to-SQL failed: {e}")
+            return None
+    
+    @staticmethod
+    def _format_sql_result(sql_result: Dict) -> str:
+        """Compact rows block for the prompt (and the degraded answer)"""
+        rows = sql_result["rows"]
+        lines = [f"[Database Query Results - exact, from {sql_result['table']}]"]
+        if not rows:
+            lines.append("No matching rows.")
+        for row in rows:
+            lines.append("• " + ", ".join(f"{column}: {value}" for column, value in row.items()))
+        if sql_result["truncated"]:
+            lines.append(f"(only the first {len(rows)} rows are shown)")
+        return "\n".join(lines)
+    
+    @staticmethod
+    def _sql_source(sql_result: Optional[Dict]) -> Optional[Dict]:
+        if not sql_result:
+            return None
         return {
-            "tables_used": list(tables_mentioned),
-            "entity_types": list(entity_types),
-            "schema_info": schema_info,
-            "discovered_tables": discovered_tables
+            "table": sql_result["table"],
+            "sql": sql_result["sql"],
+            "rows_returned": len(sql_result["rows"]),
+            "truncated": sql_result["truncated"],
+            "sql_cached": sql_result["sql_cached"],
         }
     
-    def _build_context(self, query: str, search_results: List[Dict], db_context: Dict) -> List[str]:
-        """Build context list for GROQ"""
-        context = []
-        
-        # Add top search results
-        for i, result in enumerate(search_results[:5], 1):
-            content = result.get("content", "")
-            if content and len(content) > 50:
-                # Truncate long content
-                if len(content) > 800:
-                    content = content[:800] + "..."
-                
-                metadata = result.get("metadata", {})
-                context_type = metadata.get("type", "unknown")
-                
-                context.append(f"[Source {i} - {context_type}]\n{content}")
-        
-        # Add database context
-        if db_context.get("schema_info"):
-            db_info = ["[Database Schema Information]"]
-            for table, info in db_context["schema_info"].items():
-                db_info.append(f"• Table: {table}")
-                db_info.append(f"  Columns: {', '.join(info['columns'][:8])}")
-                db_info.append(f"  Records: {info['row_count']}")
-                db_info.append(f"  Entity: {info['entity_type']}")
-            
-            context.append("\n".join(db_info))
-        
-        return context
+    def _build_context(self, query: str, search_results: List[Dict], db_context: Dict,
+                       sql_result: Optional[Dict] = None) -> PackedContext:
+        """Build context list for GROQ within CONTEXT_TOKEN_BUDGET"""
+        packed = self.context_packer.pack(
+            search_results,
+            db_context.get("schema_info"),
+            facts=self._format_sql_result(sql_result) if sql_result else None
+        )
+        print(
+            f"🧮 Context: {packed.tokens_used}/{packed.budget} tokens "
+            f"({packed.tokens_saved} saved, {packed.duplicates_removed} duplicates removed)"
+        )
+        return packed
     
     def _create_system_prompt(self, query: str, search_results: List[Dict], db_context: Dict) -> str:
         """Create enhanced system prompt"""
@@ -413,18 +736,7 @@ class VectorStoreRAGService:
     
     def _classify_query(self, query: str) -> str:
         """Classify query type"""
-        query_lower = query.lower()
-        
-        if any(word in query_lower for word in ["how many", "count", "total", "number of"]):
-            return "counting"
-        elif any(word in query_lower for word in ["show", "list", "display", "get all"]):
-            return "listing"
-        elif any(word in query_lower for word in ["details", "information", "tell me about"]):
-            return "details"
-        elif any(word in query_lower for word in ["with", "where", "having", "by", "for"]):
-            return "filtering"
-        else:
-            return "general"
+        return match_query(query).shape
     
     def get_database_summary(self) -> Dict:
         """Get summary of database structure"""
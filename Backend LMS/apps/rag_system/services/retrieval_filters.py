@@ -0,0 +1,73 @@
+# ============================================
+# RETRIEVAL FILTERS
+# File: apps/rag_system/services/retrieval_filters.py
+# ============================================
+
+from typing import Dict, List, Optional
+
+from .query_matcher import match_query
+
+
+# Query types (QueryType values) answered from database knowledge
+DATABASE_QUERY_TYPES = {"database_query", "analytical", "column_query"}
+DATABASE_KNOWLEDGE_TYPES = ["entity_knowledge", "table_specific", "query_pattern", "system_overview"]
+
+
+def detect_entities(query: str) -> List[str]:
+    """LMS entities mentioned in a query, in order of first mention"""
+    return list(match_query(query).entities)
+
+
+def build_where_filter(query_type: Optional[str], entities: List[str] = None) -> Optional[Dict]:
+    """
+    Chroma `where` filter for a classified query, or None for no filter.
+
+    Database-style questions only need generated database knowledge;
+    if entities were detected, entity docs are narrowed to those entities
+    while query patterns and the system overview (which have no entity)
+    stay eligible. Other query types may need uploaded documents, so they
+    are not filtered.
+    """
+    if query_type not in DATABASE_QUERY_TYPES:
+        return None
+
+    type_filter = {"type": {"$in": DATABASE_KNOWLEDGE_TYPES}}
+    if not entities:
+        return type_filter
+
+    return {
+        "$and": [
+            type_filter,
+            {"$or": [
+                {"entity": {"$in": list(entities)}},
+                {"type": {"$in": ["query_pattern", "system_overview"]}},
+            ]},
+        ]
+    }
+
+
+def metadata_matches(metadata: Dict, where: Optional[Dict]) -> bool:
+    """Evaluate the subset of Chroma's where syntax used above against a metadata dict"""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(metadata_matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(metadata_matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, operand in condition.items():
+                if operator == "$in" and value not in operand:
+                    return False
+                if operator == "$nin" and value in operand:
+                    return False
+                if operator == "$eq" and value != operand:
+                    return False
+                if operator == "$ne" and value == operand:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
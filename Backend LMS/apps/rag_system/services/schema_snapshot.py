@@ -0,0 +1,130 @@
+# ============================================
+# SCHEMA SNAPSHOT
+# File: apps/rag_system/services/schema_snapshot.py
+# ============================================
+
+import time
+from typing import Dict, List, Optional
+
+from django.db import connection
+
+
+class SchemaSnapshot:
+    """
+    In-memory picture of the public schema: tables, columns, foreign keys
+    and planner row estimates.
+
+    Built by load_schema_snapshot() in three catalog queries no matter how
+    many tables exist, so knowledge building, table discovery and query
+    diagnosis can read everything without per-table round-trips.
+    """
+
+    def __init__(self, tables: Dict[str, Dict], built_at: float = None):
+        # table -> {"columns": [...], "foreign_keys": [...], "row_estimate": int}
+        self.tables = tables
+        self.built_at = built_at or time.time()
+
+    @property
+    def table_names(self) -> List[str]:
+        return sorted(self.tables)
+
+    def has_table(self, table_name: str) -> bool:
+        return table_name in self.tables
+
+    def column_details(self, table_name: str) -> List[Dict]:
+        return self.tables.get(table_name, {}).get("columns", [])
+
+    def columns(self, table_name: str) -> List[str]:
+        return [col["name"] for col in self.column_details(table_name)]
+
+    def foreign_keys(self, table_name: str) -> List[Dict]:
+        """[{"column", "references_table", "references_column"}, ...]"""
+        return self.tables.get(table_name, {}).get("foreign_keys", [])
+
+    def related_tables(self, table_name: str) -> List[str]:
+        """Tables this one references or is referenced by"""
+        related = [fk["references_table"] for fk in self.foreign_keys(table_name)]
+        for other, info in self.tables.items():
+            if other != table_name and any(fk["references_table"] == table_name for fk in info["foreign_keys"]):
+                related.append(other)
+        return list(dict.fromkeys(t for t in related if t != table_name))
+
+    def row_estimate(self, table_name: str) -> Optional[int]:
+        """Planner estimate, or None if the table was never analyzed"""
+        estimate = self.tables.get(table_name, {}).get("row_estimate")
+        return estimate if estimate is not None and estimate >= 0 else None
+
+    def stats(self) -> Dict:
+        return {
+            "tables": len(self.tables),
+            "columns": sum(len(info["columns"]) for info in self.tables.values()),
+            "foreign_keys": sum(len(info["foreign_keys"]) for info in self.tables.values()),
+            "age_seconds": round(time.time() - self.built_at, 1),
+        }
+
+
+def load_schema_snapshot(schema: str = 'public') -> SchemaSnapshot:
+    """Introspect every table of a schema in one pass"""
+    tables: Dict[str, Dict] = {}
+
+    with connection.cursor() as cursor:
+        # 1. Tables with row estimates
+        cursor.execute("""
+            SELECT c.relname, c.reltuples::bigint
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = %s
+            AND c.relkind IN ('r', 'p')
+            ORDER BY c.relname;
+        """, [schema])
+        for name, estimate in cursor.fetchall():
+            tables[name] = {"columns": [], "foreign_keys": [], "row_estimate": int(estimate)}
+
+        # 2. Columns of every table
+        cursor.execute("""
+            SELECT
+                table_name,
+                column_name,
+                data_type,
+                is_nullable,
+                column_default
+            FROM information_schema.columns
+            WHERE table_schema = %s
+            ORDER BY table_name, ordinal_position;
+        """, [schema])
+        for table, name, data_type, nullable, default in cursor.fetchall():
+            if table in tables:
+                tables[table]["columns"].append({
+                    "name": name,
+                    "type": data_type,
+                    "nullable": nullable == 'YES',
+                    "default": default
+                })
+
+        # 3. Foreign keys (single and multi-column)
+        cursor.execute("""
+            SELECT
+                src.relname,
+                src_col.attname,
+                dst.relname,
+                dst_col.attname
+            FROM pg_constraint con
+            JOIN pg_class src ON src.oid = con.conrelid
+            JOIN pg_namespace n ON n.oid = src.relnamespace
+            JOIN pg_class dst ON dst.oid = con.confrelid
+            CROSS JOIN LATERAL unnest(con.conkey, con.confkey) AS k(src_attnum, dst_attnum)
+            JOIN pg_attribute src_col ON src_col.attrelid = con.conrelid AND src_col.attnum = k.src_attnum
+            JOIN pg_attribute dst_col ON dst_col.attrelid = con.confrelid AND dst_col.attnum = k.dst_attnum
+            WHERE con.contype = 'f'
+            AND n.nspname = %s
+            ORDER BY src.relname, con.conname;
+        """, [schema])
+        for table, column, ref_table, ref_column in cursor.fetchall():
+            if table in tables:
+                tables[table]["foreign_keys"].append({
+                    "column": column,
+                    "references_table": ref_table,
+                    "references_column": ref_column
+                })
+
+    return SchemaSnapshot(tables)
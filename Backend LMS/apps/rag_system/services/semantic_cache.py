@@ -0,0 +1,129 @@
+# ============================================
+# SEMANTIC ANSWER CACHE
+# File: apps/rag_system/services/semantic_cache.py
+# ============================================
+
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ..conf import rag_setting
+
+
+class SemanticAnswerCache:
+    """
+    In-memory cache that matches questions by embedding similarity.
+
+    "count of pupils" and "how many learners" hash differently but embed
+    close together. Each role gets its own matrix of normalized question
+    embeddings; a lookup is a single matrix-vector product. Questions that
+    differ only in a number or quoted value embed almost identically, so
+    those literals must match exactly before a hit is accepted.
+    """
+
+    LITERAL_PATTERN = re.compile(r"\d+(?:\.\d+)?|'[^']*'|\"[^\"]*\"")
+
+    def __init__(self, embeddings, threshold: float = None, max_entries: int = None, ttl: int = None):
+        self.embeddings = embeddings
+        self.threshold = threshold or rag_setting('SEMANTIC_CACHE_THRESHOLD')
+        self.max_entries = max_entries or rag_setting('SEMANTIC_CACHE_SIZE')
+        self.ttl = ttl or rag_setting('QUERY_CACHE_TTL')
+
+        # role -> {"entries": [...], "matrix": ndarray or None}
+        self._partitions: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, query: str) -> np.ndarray:
+        """Unit-length embedding for a question"""
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, query: str, user_role: str = '', embedding: np.ndarray = None) -> Optional[Dict]:
+        """Return the cached result of the most similar question above threshold"""
+        with self._lock:
+            partition = self._partitions.get(user_role or '')
+            if not partition or not partition["entries"]:
+                self.misses += 1
+                return None
+
+        if embedding is None:
+            embedding = self.embed(query)
+        literals = self._literals(query)
+        now = time.time()
+
+        with self._lock:
+            entries = partition["entries"]
+            if partition["matrix"] is None:
+                partition["matrix"] = np.vstack([e["embedding"] for e in entries])
+            similarities = partition["matrix"] @ embedding
+
+            for index in np.argsort(similarities)[::-1]:
+                similarity = float(similarities[index])
+                if similarity < self.threshold:
+                    break
+                entry = entries[index]
+                if entry["expires_at"] <= now or entry["literals"] != literals:
+                    continue
+                entry["last_used"] = now
+                self.hits += 1
+                return {
+                    **entry["result"],
+                    "matched_query": entry["query"],
+                    "similarity": round(similarity, 4),
+                }
+
+            self.misses += 1
+            return None
+
+    def add(self, query: str, user_role: str, result: Dict, embedding: np.ndarray = None):
+        """Remember a successful answer for future near-duplicate questions"""
+        if not result.get("success") or result.get("cached"):
+            return
+        if embedding is None:
+            embedding = self.embed(query)
+
+        now = time.time()
+        entry = {
+            "query": query,
+            "literals": self._literals(query),
+            "embedding": embedding,
+            "result": {
+                "response": result.get("response", ""),
+                "context_sources": result.get("context_sources", {}),
+            },
+            "expires_at": now + self.ttl,
+            "last_used": now,
+        }
+
+        with self._lock:
+            partition = self._partitions.setdefault(user_role or '', {"entries": [], "matrix": None})
+            entries: List[Dict] = partition["entries"]
+            entries[:] = [e for e in entries if e["expires_at"] > now]
+            if len(entries) >= self.max_entries:
+                entries.remove(min(entries, key=lambda e: e["last_used"]))
+            entries.append(entry)
+            partition["matrix"] = None
+
+    def clear(self):
+        with self._lock:
+            self._partitions.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups * 100, 2) if lookups else 0.0,
+            "entries": sum(len(p["entries"]) for p in self._partitions.values()),
+            "threshold": self.threshold,
+        }
+
+    def _literals(self, query: str) -> tuple:
+        return tuple(self.LITERAL_PATTERN.findall(query.lower()))
@@ -0,0 +1,151 @@
+# ============================================
+# IN-FLIGHT REQUEST COALESCING
+# File: apps/rag_system/services/single_flight.py
+# ============================================
+
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, Tuple
+
+from ..conf import rag_setting
+from .stage_timer import stage
+
+
+# Bumped whenever the knowledge behind answers changes (vector store sync,
+# schema/table stats invalidation, answer cache clear), so a request that
+# arrives after a change never joins a computation started before it
+_data_version = 0
+_version_lock = threading.Lock()
+
+
+def data_version() -> int:
+    return _data_version
+
+
+def bump_data_version() -> int:
+    global _data_version
+    with _version_lock:
+        _data_version += 1
+        return _data_version
+
+
+class _Call:
+    """One in-progress computation and the requests waiting on it"""
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time.
+
+    The first request for a key (the leader) runs it; identical requests
+    that arrive while it is in flight wait for its result instead of
+    running their own retrieval and LLM call. A waiter that has not been
+    answered within COALESCE_TIMEOUT seconds gives up and computes on its
+    own, so a stuck leader only delays its followers by the timeout. An
+    exception in the leader is raised in every waiter. Nothing is kept
+    once the leader finishes; repeat queries are the answer cache's job.
+
+    Threads (sync views) and the event loop (async views) coalesce
+    separately: sync callers use do(), async callers use ado().
+    """
+
+    def __init__(self, timeout: float = None, enabled: bool = None):
+        self.timeout = timeout or rag_setting('COALESCE_TIMEOUT')
+        self.enabled = rag_setting('COALESCE_ENABLED') if enabled is None else enabled
+
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._tasks: Dict[Tuple[int, str], asyncio.Future] = {}
+
+        self.leaders = 0
+        self.followers = 0
+        self.timeouts = 0
+
+    def do(self, key: str, func: Callable[[], Dict]) -> Tuple[Dict, bool]:
+        """Return (result, shared); shared is True when another request computed it"""
+        if not self.enabled:
+            return func(), False
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+            else:
+                leader = False
+
+        if leader:
+            try:
+                call.result = func()
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+            return call.result, False
+
+        with stage("coalesce_wait"):
+            answered = call.done.wait(self.timeout)
+        if not answered:
+            with self._lock:
+                self.timeouts += 1
+            print(f"⚠️ Coalesced request waited {self.timeout}s, computing it separately")
+            return func(), False
+
+        with self._lock:
+            self.followers += 1
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    async def ado(self, key: str, func: Callable[[], Awaitable[Dict]]) -> Tuple[Dict, bool]:
+        """Async variant of do() for requests served on the same event loop"""
+        if not self.enabled:
+            return await func(), False
+
+        task_key = (id(asyncio.get_running_loop()), key)
+        task = self._tasks.get(task_key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._tasks[task_key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(task_key, None))
+            self.leaders += 1
+            # A leader whose client disconnects must not cancel the followers' answer
+            return await asyncio.shield(task), False
+
+        try:
+            # shield(): a waiter timing out must not cancel the leader's work
+            with stage("coalesce_wait"):
+                result = await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            print(f"⚠️ Coalesced request waited {self.timeout}s, computing it separately")
+            return await func(), False
+
+        self.followers += 1
+        return result, True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            in_flight = len(self._calls) + len(self._tasks)
+        requests = self.leaders + self.followers
+        return {
+            "enabled": self.enabled,
+            "in_flight": in_flight,
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "coalesced_rate": round(self.followers / requests * 100, 2) if requests else 0.0,
+            "timeouts": self.timeouts,
+            "timeout_seconds": self.timeout,
+            "data_version": data_version(),
+        }
@@ -0,0 +1,154 @@
+# ============================================
+# BOUNDED SQL EXECUTION
+# File: apps/rag_system/services/sql_executor.py
+# ============================================
+
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from django.db import OperationalError, connection as default_connection, transaction
+
+from ..conf import rag_setting
+from ..utils import sanitize_sql_query, validate_sql_query
+
+
+class SQLRejected(Exception):
+    """SQL that is not a single SELECT, is too expensive, or ran out of time"""
+
+
+class SQLResult:
+    """Rows of one bounded query"""
+
+    def __init__(self, sql: str, columns: List[str], rows: List[Tuple], truncated: bool,
+                 cost: Optional[float], elapsed_ms: float):
+        self.sql = sql
+        self.columns = columns
+        self.rows = rows
+        self.truncated = truncated
+        self.cost = cost
+        self.elapsed_ms = elapsed_ms
+
+    def as_dicts(self) -> List[Dict]:
+        return [dict(zip(self.columns, row)) for row in self.rows]
+
+
+class SafeSQLExecutor:
+    """
+    Runs SELECTs that were not written by hand (SQL templates, LLM output).
+
+    The statement must be a single SELECT. It is wrapped in an outer
+    LIMIT (one row over max_rows, to detect truncation), costed with
+    EXPLAIN and rejected above SQL_MAX_COST, then run in a read-only
+    transaction with SET LOCAL statement_timeout. Rows are read from a
+    server-side cursor in SQL_FETCH_SIZE batches, so a wide result is
+    never materialized in one fetchall(). On non-PostgreSQL backends
+    only validation and the LIMIT apply.
+    """
+
+    def __init__(self, connection=None, max_rows: int = None, timeout_ms: int = None,
+                 max_cost: float = None, fetch_size: int = None):
+        self.connection = connection or default_connection
+        self.max_rows = max_rows or rag_setting('SQL_MAX_ROWS')
+        self.timeout_ms = timeout_ms or rag_setting('SQL_STATEMENT_TIMEOUT_MS')
+        self.max_cost = max_cost or rag_setting('SQL_MAX_COST')
+        self.fetch_size = fetch_size or rag_setting('SQL_FETCH_SIZE')
+
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def execute(self, sql: str, params: Sequence = None, max_rows: int = None) -> SQLResult:
+        """Run one bounded SELECT; raises SQLRejected, or the database error"""
+        limit = max_rows or self.max_rows
+        try:
+            bounded = self.bound(sql, limit)
+        except SQLRejected:
+            self._count("rejected")
+            raise
+
+        postgres = self.connection.vendor == "postgresql"
+        started = time.perf_counter()
+        cost = None
+        try:
+            # Inside an outer transaction (e.g. a test case) queries have already
+            # run, so only the timeout and the cost check can still be applied
+            read_only = postgres and not self.connection.in_atomic_block
+            with transaction.atomic(using=self.connection.alias):
+                if postgres:
+                    with self.connection.cursor() as cursor:
+                        if read_only:
+                            cursor.execute("SET TRANSACTION READ ONLY")
+                        cursor.execute(f"SET LOCAL statement_timeout = {int(self.timeout_ms)}")
+                        cost = self._cost(cursor, bounded, params)
+                    if cost > self.max_cost:
+                        self._count("rejected")
+                        raise SQLRejected(f"estimated cost {cost:.0f} exceeds SQL_MAX_COST ({self.max_cost})")
+                columns, rows = self._fetch(bounded, params, limit + 1)
+        except OperationalError as e:
+            if "statement timeout" not in str(e):
+                raise
+            self._count("timeouts")
+            raise SQLRejected(f"query cancelled after {self.timeout_ms}ms") from e
+
+        self._count("executed")
+        return SQLResult(
+            sql=bounded,
+            columns=columns,
+            rows=rows[:limit],
+            truncated=len(rows) > limit,
+            cost=cost,
+            elapsed_ms=round((time.perf_counter() - started) * 1000, 1),
+        )
+
+    @staticmethod
+    def bound(sql: str, limit: int) -> str:
+        """The statement as a single SELECT under an outer LIMIT"""
+        sql = sanitize_sql_query(sql or "")
+        if ";" in sql or not validate_sql_query(sql):
+            raise SQLRejected(f"only a single SELECT statement may run: {sql[:120]}")
+        return f"SELECT * FROM ({sql}) AS bounded_query LIMIT {int(limit) + 1}"
+
+    def stats(self) -> Dict:
+        return {
+            "executed": self.executed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "max_rows": self.max_rows,
+            "statement_timeout_ms": self.timeout_ms,
+            "max_cost": self.max_cost,
+        }
+
+    @staticmethod
+    def _cost(cursor, sql: str, params: Sequence = None) -> float:
+        """Planner's total cost estimate for the statement"""
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return float(plan[0]["Plan"]["Total Cost"])
+
+    def _fetch(self, sql: str, params: Sequence, max_rows: int) -> Tuple[List[str], List[Tuple]]:
+        # chunked_cursor() is a named (server-side) cursor on PostgreSQL
+        cursor = self.connection.chunked_cursor()
+        try:
+            cursor.execute(sql, params)
+            rows = []
+            columns = None
+            while len(rows) < max_rows:
+                batch = cursor.fetchmany(min(self.fetch_size, max_rows - len(rows)))
+                if columns is None:
+                    # A named cursor only has a description after the first fetch
+                    columns = [col[0] for col in cursor.description]
+                if not batch:
+                    break
+                rows.extend(batch)
+            return columns or [], rows
+        finally:
+            cursor.close()
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
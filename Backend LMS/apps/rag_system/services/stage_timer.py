@@ -0,0 +1,85 @@
+# ============================================
+# PER-STAGE TIMING
+# File: apps/rag_system/services/stage_timer.py
+# ============================================
+
+import contextvars
+import functools
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+
+# Stage names, in pipeline order
+STAGES = ["classification", "coalesce_wait", "template_sql", "embedding", "vector_search", "db_context", "text_to_sql", "prompt_build", "llm"]
+
+_active_timer: contextvars.ContextVar = contextvars.ContextVar('rag_stage_timer', default=None)
+
+
+class StageTimer:
+    """
+    Collects wall-clock seconds per pipeline stage for one query.
+
+    Used as a context manager around a query; the pipeline wraps its
+    stages in `stage(name)`, which records into the active timer and is
+    a no-op when none is active. The timer lives in a ContextVar, so it
+    follows the query into sync_to_async worker threads. A stage entered
+    several times (e.g. two embedding calls) is summed.
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self._token = None
+
+    def __enter__(self) -> "StageTimer":
+        self._token = _active_timer.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _active_timer.reset(self._token)
+        self._token = None
+        return False
+
+    def add(self, name: str, seconds: float):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def as_ms(self) -> Dict[str, float]:
+        return {name: round(seconds * 1000, 3) for name, seconds in self.timings.items()}
+
+
+def current_timer() -> Optional[StageTimer]:
+    return _active_timer.get()
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block into the active StageTimer, if any"""
+    timer = _active_timer.get()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - started)
+
+
+@contextmanager
+def ensure_timer():
+    """Yield the active StageTimer, starting one if none is active"""
+    timer = _active_timer.get()
+    if timer is not None:
+        yield timer
+        return
+    with StageTimer() as timer:
+        yield timer
+
+
+def timed(name: str, func: Callable) -> Callable:
+    """Wrap a callable so each call is timed as stage `name`"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with stage(name):
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,186 @@
+# ============================================
+# TABLE STATISTICS CACHE
+# File: apps/rag_system/services/table_stats.py
+# ============================================
+
+import threading
+import time
+from typing import Dict, List, Optional
+
+from django.db import connection
+
+from ..conf import rag_setting
+from .schema_snapshot import SchemaSnapshot, load_schema_snapshot
+from .single_flight import bump_data_version
+
+
+class TableStatsCache:
+    """
+    Process-wide cache of the schema snapshot, columns and row counts.
+    
+    Row counts come from pg_class.reltuples (kept current by
+    ANALYZE/autovacuum) via the SchemaSnapshot, which loads every table in
+    one pass. An exact COUNT(*) only runs when a caller asks for it, or
+    when a table has never been analyzed. Entries expire after
+    TABLE_STATS_TTL seconds; a migration in this process clears them at once.
+    """
+    
+    def __init__(self, ttl: int = None):
+        self.ttl = ttl or rag_setting('TABLE_STATS_TTL')
+        
+        self._snapshot: Optional[SchemaSnapshot] = None
+        self._snapshot_expires_at = 0.0
+        self._columns: Dict[str, Dict] = {}
+        self._exact: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.exact_counts = 0
+        self.snapshot_builds = 0
+    
+    def get_snapshot(self) -> SchemaSnapshot:
+        """Current schema snapshot, rebuilt at most once per TTL"""
+        snapshot = self._fresh_snapshot()
+        if snapshot is not None:
+            return snapshot
+        
+        # One thread rebuilds; the others wait and reuse its result
+        with self._build_lock:
+            snapshot = self._fresh_snapshot()
+            if snapshot is not None:
+                return snapshot
+            
+            started = time.monotonic()
+            try:
+                snapshot = load_schema_snapshot()
+            except Exception as e:
+                print(f"⚠️ Schema snapshot failed: {e}")
+                snapshot = SchemaSnapshot({})
+            print(f"🗂️ Schema snapshot: {len(snapshot.tables)} tables in {time.monotonic() - started:.2f}s")
+            
+            with self._lock:
+                self._snapshot = snapshot
+                self._snapshot_expires_at = time.monotonic() + self.ttl
+                self.snapshot_builds += 1
+            return snapshot
+    
+    def get_columns(self, table_name: str) -> List[Dict]:
+        """Columns for a table, cached"""
+        snapshot = self.get_snapshot()
+        if snapshot.has_table(table_name):
+            with self._lock:
+                self.hits += 1
+            return snapshot.column_details(table_name)
+        
+        # Tables outside the snapshot (other schemas, created since the last build)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._columns.get(table_name)
+            if entry and entry["expires_at"] > now:
+                self.hits += 1
+                return entry["columns"]
+            self.misses += 1
+        
+        columns = self._fetch_columns(table_name)
+        with self._lock:
+            self._columns[table_name] = {"columns": columns, "expires_at": now + self.ttl}
+        return columns
+    
+    def get_row_count(self, table_name: str, exact: bool = False) -> Dict:
+        """
+        Row count for a table.
+        
+        Returns {"row_count": int, "estimated": bool}. Estimates are used
+        unless exact=True or PostgreSQL has no statistics for the table yet.
+        """
+        if exact:
+            return self._exact_count(table_name, force=True)
+        
+        estimate = self.get_snapshot().row_estimate(table_name)
+        if estimate is None:
+            # Never analyzed (reltuples = -1) or not a PostgreSQL table
+            return self._exact_count(table_name)
+        return {"row_count": estimate, "estimated": True}
+    
+    def invalidate(self, table_name: Optional[str] = None):
+        """Drop cached data for one table, or everything"""
+        bump_data_version()
+        with self._lock:
+            if table_name is None:
+                self._snapshot = None
+                self._snapshot_expires_at = 0.0
+                self._columns.clear()
+                self._exact.clear()
+            else:
+                self._columns.pop(table_name, None)
+                self._exact.pop(table_name, None)
+    
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups * 100, 2) if lookups else 0.0,
+            "snapshot": self._snapshot.stats() if self._snapshot is not None else None,
+            "snapshot_builds": self.snapshot_builds,
+            "cached_tables": len(self._columns),
+            "exact_counts": self.exact_counts,
+            "ttl_seconds": self.ttl,
+        }
+    
+    def _fresh_snapshot(self) -> Optional[SchemaSnapshot]:
+        with self._lock:
+            if self._snapshot is not None and self._snapshot_expires_at > time.monotonic():
+                return self._snapshot
+        return None
+    
+    def _exact_count(self, table_name: str, force: bool = False) -> Dict:
+        now = time.monotonic()
+        if not force:
+            with self._lock:
+                entry = self._exact.get(table_name)
+                if entry and entry["expires_at"] > now:
+                    return {"row_count": entry["row_count"], "estimated": False}
+        
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {connection.ops.quote_name(table_name)}")
+            row_count = cursor.fetchone()[0]
+        
+        with self._lock:
+            self.exact_counts += 1
+            self._exact[table_name] = {"row_count": row_count, "expires_at": now + self.ttl}
+        return {"row_count": row_count, "estimated": False}
+    
+    @staticmethod
+    def _fetch_columns(table_name: str) -> List[Dict]:
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT
+                    column_name,
+                    data_type,
+                    is_nullable,
+                    column_default
+                FROM information_schema.columns
+                WHERE table_name = %s
+                ORDER BY ordinal_position;
+            """, [table_name])
+            
+            return [
+                {
+                    "name": row[0],
+                    "type": row[1],
+                    "nullable": row[2] == 'YES',
+                    "default": row[3]
+                }
+                for row in cursor.fetchall()
+            ]
+
+
+table_stats = TableStatsCache()
+
+
+def invalidate_table_stats(**kwargs):
+    """post_migrate receiver: schema or data may have changed"""
+    table_stats.invalidate()
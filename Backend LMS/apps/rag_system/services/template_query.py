@@ -0,0 +1,352 @@
+# ============================================
+# LLM-FREE SQL TEMPLATES
+# File: apps/rag_system/services/template_query.py
+# ============================================
+
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from ..conf import rag_setting
+from ..utils import normalize_query
+from .database_connector import DatabaseConnector
+from .query_matcher import is_sensitive_column, is_system_table
+from .sql_executor import SafeSQLExecutor
+
+
+_TOP = re.compile(
+    r"^(?:(?:show|list|get|give|display)\s+)?(?:me\s+)?(?:the\s+)?"
+    r"(?P<direction>top|first|latest|newest|recent|oldest|last|bottom)\s+(?P<n>\d+)\s+(?P<rest>.+)$"
+)
+_COUNT = re.compile(r"^(?:how many|total number of|number of|count(?:\s+(?:of|the|all))?)\s+(?P<rest>.+)$")
+_LIST = re.compile(r"^(?:show|list|display|get|give)(?:\s+me)?(?:\s+(?:all|the|every))*\s+(?P<rest>.+)$")
+
+_ENTITY = re.compile(r"^(?P<entity>[a-z]+)(?P<tail>.*)$")
+_FILTER = re.compile(
+    r"\s+(?:with|where|whose|having)\s+(?:the\s+|a\s+)?(?P<column>[a-z_ ]+?)\s+"
+    r"(?P<op>is not|is|=|!=|equals?|>=|<=|>|<|above|below|over|under|greater than|less than|more than|at least|at most)"
+    r"\s+(?P<value>.+)$"
+)
+_ORDER_BY = re.compile(r"\s+by\s+(?P<column>[a-z_ ]+)$")
+# Words that may follow the entity without changing the question
+_FILLER = re.compile(
+    r"^(?:\s+(?:are|is|there|do|does|we|have|in|the|system|school|total|registered|enrolled|exist|available|records?|all))*\s*$"
+)
+
+_OPERATORS = {
+    "is": "=", "=": "=", "equals": "=", "equal": "=",
+    "is not": "<>", "!=": "<>",
+    ">": ">", "above": ">", "over": ">", "greater than": ">", "more than": ">",
+    "<": "<", "below": "<", "under": "<", "less than": "<",
+    ">=": ">=", "at least": ">=",
+    "<=": "<=", "at most": "<=",
+}
+_DESCENDING = {"top", "latest", "newest", "recent", "last"}
+_RECENCY_COLUMNS = ["created_at", "date_joined", "created", "updated_at", "id"]
+
+_NUMERIC_TYPES = ("integer", "bigint", "smallint", "numeric", "real", "double precision", "decimal")
+_DATE_TYPES = ("date", "timestamp")
+_NUMBER = re.compile(r"^-?\d+(?:\.\d+)?$")
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_BOOLEANS = {"true": True, "yes": True, "active": True, "false": False, "no": False, "inactive": False}
+
+_DISPLAY_COLUMNS = ["name", "full_name", "first_name", "last_name", "username", "title", "email", "code", "roll_number", "status"]
+
+
+class TemplatePlan:
+    """A question matched to one SQL template"""
+
+    def __init__(self, intent: str, entity: str, table: str, sql: str, params: List, columns: List[str] = None,
+                 description: str = ""):
+        self.intent = intent
+        self.entity = entity
+        self.table = table
+        self.sql = sql
+        self.params = params
+        self.columns = columns or []
+        self.description = description
+
+
+class TemplateQueryEngine:
+    """
+    Answers common database questions with one SQL query and no LLM.
+
+    Handles counts ("how many students"), listings ("show all teachers"),
+    a single column filter ("students with status is active") and top-N
+    ("latest 5 notifications", "top 10 exam results by marks"). The
+    entity is resolved with DatabaseConnector.get_actual_table_name and
+    every identifier is checked against the schema snapshot and quoted;
+    values are always query parameters. Soft-deleted rows are excluded.
+    Queries run through SafeSQLExecutor (read-only, time and cost bounded).
+    Anything not fully understood returns None and takes the RAG path.
+    Counts are open to everyone; listings and top-N return row data, so
+    they are answered only for TEMPLATE_QUERY_ROW_ROLES.
+    """
+
+    def __init__(self, db_connector: DatabaseConnector = None, max_rows: int = None,
+                 executor: SafeSQLExecutor = None, row_roles: List[str] = None):
+        self.db_connector = db_connector or DatabaseConnector()
+        self.max_rows = max_rows or rag_setting('TEMPLATE_QUERY_MAX_ROWS')
+        self.executor = executor or SafeSQLExecutor(self.db_connector.connection)
+        self.row_roles = set(row_roles if row_roles is not None else rag_setting('TEMPLATE_QUERY_ROW_ROLES'))
+
+        self.answered = 0
+        self.skipped = 0
+        self.restricted = 0
+
+    def answer(self, query: str, user_context: Dict = None) -> Optional[Dict]:
+        """Result dict for a templated question, or None to fall through to the LLM"""
+        start_time = time.time()
+        plan = self.plan(query)
+        if plan is None:
+            self.skipped += 1
+            return None
+
+        role = (user_context or {}).get('user_type', 'user')
+        if plan.intent != "count" and role not in self.row_roles:
+            # Refuse here rather than fall through: the RAG path would list the rows too
+            self.restricted += 1
+            print(f"🔒 Row listing on {plan.table} not allowed for role '{role}'")
+            return self._result(query, plan, f"Listing individual {plan.entity} is not available for your "
+                                             f"account. You can ask how many {plan.entity} there are.", [], start_time)
+
+        try:
+            rows = self._execute(plan)
+        except Exception as e:
+            print(f"⚠️ Template query failed, falling back to RAG: {e}")
+            self.skipped += 1
+            return None
+
+        self.answered += 1
+        print(f"⚡ Answered from SQL template ({plan.intent} on {plan.table})")
+        return self._result(query, plan, self._format(plan, rows), rows, start_time)
+
+    def plan(self, query: str) -> Optional[TemplatePlan]:
+        """Match a question to a template; None unless every part of it is understood"""
+        text = normalize_query(query)
+
+        match = _TOP.match(text)
+        if match:
+            return self._plan_top(match.group("direction"), int(match.group("n")), match.group("rest"), query)
+
+        match = _COUNT.match(text)
+        if match:
+            return self._plan_rows("count", match.group("rest"), query)
+
+        match = _LIST.match(text)
+        if match:
+            return self._plan_rows("list", match.group("rest"), query)
+
+        return None
+
+    def stats(self) -> Dict:
+        return {
+            "answered": self.answered,
+            "skipped": self.skipped,
+            "restricted": self.restricted,
+            "executor": self.executor.stats()
+        }
+
+    @staticmethod
+    def _result(query: str, plan: TemplatePlan, response: str, rows: List[Tuple], start_time: float) -> Dict:
+        return {
+            "query": query,
+            "response": response,
+            "query_type": "database_query",
+            "context_sources": {
+                "response_method": "sql_template",
+                "intent": plan.intent,
+                "database_tables_used": [plan.table],
+                "sql": plan.sql,
+                "rows_returned": len(rows),
+            },
+            "tokens_used": 0,
+            "response_time": round(time.time() - start_time, 2),
+            "success": True,
+            "cached": False
+        }
+
+    def _plan_rows(self, intent: str, rest: str, query: str) -> Optional[TemplatePlan]:
+        target = self._resolve_entity(rest, query)
+        if target is None:
+            return None
+        entity, table, tail, columns = target
+
+        conditions, params, description = self._soft_delete(columns), [], ""
+        filter_match = _FILTER.search(tail)
+        if filter_match:
+            condition = self._condition(filter_match, columns)
+            if condition is None:
+                return None
+            conditions.append(condition[0])
+            params.append(condition[1])
+            description = condition[2]
+            tail = tail[:filter_match.start()]
+        if not _FILLER.match(tail):
+            return None
+
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        if intent == "count":
+            sql = f"SELECT COUNT(*) AS count FROM {self._quote(table)}{where}"
+            return TemplatePlan(intent, entity, table, sql, params, description=description)
+
+        display = self._display_columns(columns)
+        order = " ORDER BY " + self._quote("id") if "id" in columns else ""
+        sql = (
+            f"SELECT {', '.join(self._quote(c) for c in display)} FROM {self._quote(table)}"
+            f"{where}{order} LIMIT %s"
+        )
+        return TemplatePlan(intent, entity, table, sql, params + [self.max_rows], display, description)
+
+    def _plan_top(self, direction: str, n: int, rest: str, query: str) -> Optional[TemplatePlan]:
+        target = self._resolve_entity(rest, query)
+        if target is None:
+            return None
+        entity, table, tail, columns = target
+
+        order_match = _ORDER_BY.search(tail)
+        if order_match:
+            order_column = self._resolve_column(order_match.group("column"), columns)
+            tail = tail[:order_match.start()]
+        elif direction in ("top", "bottom"):
+            return None  # "top 5 students" by what? Let the LLM ask.
+        else:
+            order_column = next((c for c in _RECENCY_COLUMNS if c in columns), None)
+        if order_column is None or not _FILLER.match(tail):
+            return None
+
+        display = self._display_columns(columns)
+        if order_column not in display:
+            display.append(order_column)
+        conditions = self._soft_delete(columns)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        sort = "DESC" if direction in _DESCENDING else "ASC"
+        sql = (
+            f"SELECT {', '.join(self._quote(c) for c in display)} FROM {self._quote(table)}{where}"
+            f" ORDER BY {self._quote(order_column)} {sort} NULLS LAST LIMIT %s"
+        )
+        return TemplatePlan(
+            "top_n", entity, table, sql, [min(n, self.max_rows)], display,
+            description=f"by {order_column} ({'highest' if sort == 'DESC' else 'lowest'} first)"
+        )
+
+    def _resolve_entity(self, rest: str, query: str) -> Optional[Tuple[str, str, str, Dict[str, str]]]:
+        """(entity word, table, text after the entity, {column: type}) or None"""
+        match = _ENTITY.match(rest)
+        if match is None:
+            return None
+        entity = match.group("entity")
+
+        table = self.db_connector.get_actual_table_name(entity, query)
+        # get_actual_table_name falls back to substring matches ("are" ->
+        # "parents"); only trust tables with the entity as a name part
+        singular = self._singular(entity)
+        if not table or singular not in (self._singular(part) for part in table.lower().split("_")):
+            return None
+        # Only domain tables: never sessions, auth or token tables ("show session")
+        if is_system_table(table):
+            return None
+
+        columns = {c["name"]: (c.get("type") or "").lower() for c in self.db_connector.get_table_columns(table)}
+        if not columns:
+            return None
+        return entity, table, match.group("tail"), columns
+
+    def _condition(self, match, columns: Dict[str, str]) -> Optional[Tuple[str, object, str]]:
+        """(SQL condition, parameter, description) for a filter clause"""
+        column = self._resolve_column(match.group("column"), columns)
+        if column is None:
+            return None
+        operator = _OPERATORS[match.group("op")]
+        raw = match.group("value").strip().strip("'\"")
+        column_type = columns[column]
+        quoted = self._quote(column)
+        description = f"with {column} {match.group('op')} {raw}"
+
+        if column_type == "boolean":
+            if raw not in _BOOLEANS or operator not in ("=", "<>"):
+                return None
+            return f"{quoted} {operator} %s", _BOOLEANS[raw], description
+        if column_type.startswith(_NUMERIC_TYPES):
+            if not _NUMBER.match(raw):
+                return None
+            value = float(raw) if "." in raw else int(raw)
+            return f"{quoted} {operator} %s", value, description
+        if column_type.startswith(_DATE_TYPES):
+            if not _ISO_DATE.match(raw):
+                return None
+            return f"{quoted} {operator} %s", raw, description
+        if operator in ("=", "<>"):
+            return f"LOWER(CAST({quoted} AS TEXT)) {operator} LOWER(%s)", raw, description
+        return None
+
+    @staticmethod
+    def _resolve_column(words: str, columns: Dict[str, str]) -> Optional[str]:
+        """Column named by the user: exact, or the only column with that word as a prefix/suffix"""
+        candidate = "_".join(words.split())
+        if candidate in columns:
+            column = candidate
+        else:
+            matches = [
+                c for c in columns
+                if c.endswith("_" + candidate) or c.startswith(candidate + "_")
+            ]
+            if len(matches) != 1:
+                return None
+            column = matches[0]
+        return None if is_sensitive_column(column) else column
+
+    def _soft_delete(self, columns: Dict[str, str]) -> List[str]:
+        return [
+            f"({self._quote(c)} = FALSE OR {self._quote(c)} IS NULL)"
+            for c in ("deleted", "is_deleted") if columns.get(c) == "boolean"
+        ]
+
+    @staticmethod
+    def _display_columns(columns: Dict[str, str]) -> List[str]:
+        safe = [c for c in columns if not is_sensitive_column(c)]
+        preferred = [c for c in _DISPLAY_COLUMNS if c in columns][:4]
+        if preferred:
+            return (["id"] if "id" in columns else []) + preferred
+        return safe[:5]
+
+    def _quote(self, identifier: str) -> str:
+        return self.db_connector.connection.ops.quote_name(identifier)
+
+    @staticmethod
+    def _singular(word: str) -> str:
+        if word.endswith("ies"):
+            return word[:-3] + "y"
+        if word.endswith(("sses", "shes", "ches", "xes", "zzes")):
+            return word[:-2]
+        if word.endswith("s") and not word.endswith("ss"):
+            return word[:-1]
+        return word
+
+    def _execute(self, plan: TemplatePlan) -> List[Tuple]:
+        return self.executor.execute(plan.sql, plan.params, max_rows=self.max_rows).rows
+
+    def _format(self, plan: TemplatePlan, rows: List[Tuple]) -> str:
+        entity = plan.entity
+        description = f" {plan.description}" if plan.description else ""
+
+        if plan.intent == "count":
+            count = rows[0][0] if rows else 0
+            verb = "is" if count == 1 else "are"
+            return f"There {verb} {count} {entity}{description}."
+
+        if not rows:
+            return f"No {entity}{description} found."
+
+        if plan.intent == "top_n":
+            header = f"{len(rows)} {entity} {plan.description}:"
+        elif len(rows) >= self.max_rows:
+            header = f"Showing the first {len(rows)} {entity}{description}:"
+        else:
+            header = f"Found {len(rows)} {entity}{description}:"
+
+        lines = [header]
+        for row in rows:
+            values = [f"{column}: {value}" for column, value in zip(plan.columns, row) if value not in (None, "")]
+            lines.append("• " + ", ".join(values))
+        return "\n".join(lines)
@@ -0,0 +1,153 @@
+# ============================================
+# EXTRACTED TEXT CACHE
+# File: apps/rag_system/services/text_cache.py
+# ============================================
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from ..conf import rag_setting
+
+
+class ExtractedTextCache:
+    """
+    Content-addressed store of text extracted from uploaded files.
+
+    Keys combine the document type, the extractor version and the SHA-256
+    of the file bytes (see cache_key), so the same syllabus uploaded twice,
+    or re-indexed after an embedding-model change, skips PDF/DOCX parsing
+    entirely, while the same bytes read as another type or by a newer
+    extractor do not. Each entry keeps the cleaned text (zlib-compressed)
+    and the character offset where every page starts. Bumping VERSION
+    invalidates every entry when the storage format changes.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+
+        self.hits = 0
+        self.misses = 0
+
+        self._open(path)
+
+    @staticmethod
+    def file_hash(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @classmethod
+    def cache_key(cls, file_path: str, doc_type: str, extractor_version: int) -> str:
+        return f"{doc_type.lower()}:v{extractor_version}:{cls.file_hash(file_path)}"
+
+    def get(self, key: str) -> Optional[Dict]:
+        """{"text": str, "page_offsets": [[page_number, start], ...]} or None"""
+        if self._db is None:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT text, page_offsets FROM extracted_text WHERE key = ? AND version = ?",
+                (key, self.VERSION)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return {"text": zlib.decompress(row[0]).decode('utf-8'), "page_offsets": json.loads(row[1])}
+
+    def set(self, key: str, text: str, page_offsets: List[List[int]] = None):
+        if self._db is None:
+            return
+        try:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO extracted_text (key, version, text, page_offsets) VALUES (?, ?, ?, ?)",
+                    (key, self.VERSION, zlib.compress(text.encode('utf-8')), json.dumps(page_offsets or [[1, 0]]))
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ Extracted text cache write failed: {e}")
+
+    def set_pages(self, key: str, pages: List[Tuple[int, str]], separator: str = "\n\n"):
+        """Store per-page text as one string plus page offsets"""
+        offsets, parts, position = [], [], 0
+        for page_number, page_text in pages:
+            offsets.append([page_number, position])
+            parts.append(page_text)
+            position += len(page_text) + len(separator)
+        self.set(key, separator.join(parts), offsets)
+
+    @staticmethod
+    def split_pages(entry: Dict, separator: str = "\n\n") -> List[Tuple[int, str]]:
+        """Rebuild [(page_number, text), ...] from a cache entry"""
+        text, offsets = entry["text"], entry["page_offsets"]
+        pages = []
+        for i, (page_number, start) in enumerate(offsets):
+            end = offsets[i + 1][1] - len(separator) if i + 1 < len(offsets) else len(text)
+            pages.append((page_number, text[start:end]))
+        return pages
+
+    def clear(self):
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute("DELETE FROM extracted_text")
+            self._db.commit()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups * 100, 2) if lookups else 0.0,
+            "path": self.path,
+        }
+
+    def _open(self, path: str):
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS extracted_text (
+                    key TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    text BLOB NOT NULL,
+                    page_offsets TEXT NOT NULL
+                )
+            """)
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ Extracted text cache unavailable ({path}): {e}")
+            self._db = None
+
+
+_text_cache = None
+_text_cache_lock = threading.Lock()
+
+
+def get_text_cache() -> Optional[ExtractedTextCache]:
+    """Process-wide cache, or None when TEXT_CACHE_ENABLED is off"""
+    global _text_cache
+    if not rag_setting('TEXT_CACHE_ENABLED'):
+        return None
+    if _text_cache is None:
+        with _text_cache_lock:
+            if _text_cache is None:
+                path = rag_setting('TEXT_CACHE_PATH') or os.path.join(
+                    os.path.dirname(os.path.abspath(str(rag_setting('VECTOR_STORE_PATH')))),
+                    'extracted_text.sqlite3'
+                )
+                _text_cache = ExtractedTextCache(str(path))
+    return _text_cache
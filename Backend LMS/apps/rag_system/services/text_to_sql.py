@@ -0,0 +1,279 @@
+# ============================================
+# TEXT-TO-SQL WITH A GENERATED-SQL CACHE
+# File: apps/rag_system/services/text_to_sql.py
+# ============================================
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from django.db import DatabaseError
+
+from ..conf import rag_setting
+from ..utils import extract_sql_from_response, normalize_query
+from .database_connector import DatabaseConnector
+from .groq_service import GroqService
+from .query_matcher import is_sensitive_column, is_system_table
+from .sql_executor import SafeSQLExecutor, SQLRejected
+from .stage_timer import stage
+
+
+# Values in a question: quoted strings and bare numbers
+_QUESTION_LITERAL = re.compile(r"'([^']*)'|\"([^\"]*)\"|(?<![\w.])(\d+(?:\.\d+)?)(?![\w.])")
+# Values in SQL: string literals and numbers outside identifiers
+_SQL_LITERAL = re.compile(r"'((?:[^']|'')*)'|(?<![\w.\"])(\d+(?:\.\d+)?)(?![\w.\"])")
+# Functions whose arguments use FROM without naming a relation
+_FROM_ARGUMENT = re.compile(r"\b(?:extract|substring|trim|overlay|position)\s*\([^()]*\)", re.IGNORECASE)
+# A FROM list (up to the next clause) or a JOIN target
+_FROM_LIST = re.compile(
+    r"\bfrom\b(?P<items>.*?)(?=\b(?:where|group|order|limit|offset|having|union|intersect|except|join|"
+    r"inner|left|right|full|cross|natural|on|using|window|fetch|select|from)\b|\)|$)",
+    re.IGNORECASE | re.DOTALL
+)
+_JOIN_TARGET = re.compile(r"\bjoin\s+(?P<items>(?:\"[^\"]+\"|\w+)(?:\s*\.\s*(?:\"[^\"]+\"|\w+))?)", re.IGNORECASE)
+_IDENTIFIER = re.compile(r'"([^"]+)"|\b([a-z_]\w*)\b', re.IGNORECASE)
+
+
+class GeneratedSQLCache:
+    """
+    LLM-generated SQL, reusable by every question of the same shape.
+
+    The key is the normalized question with its literals (quoted strings,
+    numbers) replaced by placeholders, plus the table and its columns, so
+    a schema change never reuses stale SQL. Literals of the question that
+    appear in the SQL are turned into query parameters: "students older
+    than 12" and "students older than 15" share one entry, and the second
+    question's 15 is bound into it. SQL that does not use every literal
+    of its question (or a question repeating a literal) is not cached,
+    since its parameters could not be bound unambiguously.
+    """
+
+    def __init__(self, max_size: int = None):
+        self.max_size = max_size or rag_setting('SQL_CACHE_SIZE')
+        self._entries: "OrderedDict[str, Tuple[str, List[Tuple[int, str]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def template(question: str) -> Tuple[str, List[str]]:
+        """(question with placeholders for its literals, the literals in order)"""
+        literals = []
+
+        def placeholder(match):
+            if match.group(3) is not None:
+                literals.append(match.group(3))
+                return "#"
+            literals.append(match.group(1) if match.group(1) is not None else match.group(2))
+            return "'#'"
+
+        return normalize_query(_QUESTION_LITERAL.sub(placeholder, question)), literals
+
+    def get(self, question: str, scope: str = "") -> Optional[Tuple[str, Optional[List]]]:
+        """(sql, params) for a question of a known shape, or None"""
+        template, literals = self.template(question)
+        with self._lock:
+            entry = self._entries.get(f"{scope}|{template}")
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(f"{scope}|{template}")
+            self.hits += 1
+
+        sql, slots = entry
+        if not slots:
+            return sql, None
+        try:
+            return sql, [self._bind(literals[index], kind) for index, kind in slots]
+        except ValueError:
+            return None
+
+    def put(self, question: str, sql: str, scope: str = "") -> bool:
+        """Remember SQL generated for a question; False if it cannot be reused"""
+        template, literals = self.template(question)
+        parametrized = self.parametrize(sql, literals)
+        if parametrized is None:
+            return False
+        with self._lock:
+            self._entries[f"{scope}|{template}"] = parametrized
+            self._entries.move_to_end(f"{scope}|{template}")
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return True
+
+    def discard(self, question: str, scope: str = ""):
+        template, _ = self.template(question)
+        with self._lock:
+            self._entries.pop(f"{scope}|{template}", None)
+
+    @staticmethod
+    def parametrize(sql: str, literals: List[str]) -> Optional[Tuple[str, List[Tuple[int, str]]]]:
+        """(sql with %s for the question's literals, [(literal index, 'str'|'num')]) or None"""
+        if not literals:
+            return sql, []
+        lowered = [literal.lower() for literal in literals]
+        if len(set(lowered)) < len(lowered):
+            return None
+
+        slots = []
+        pieces = []
+        position = 0
+        for match in _SQL_LITERAL.finditer(sql):
+            pieces.append(sql[position:match.start()].replace("%", "%%"))
+            position = match.end()
+            if match.group(2) is not None:
+                value, kind = match.group(2), "num"
+            else:
+                value, kind = match.group(1).replace("''", "'"), "str"
+            if value.lower() in lowered:
+                slots.append((lowered.index(value.lower()), kind))
+                pieces.append("%s")
+            else:
+                pieces.append(match.group(0).replace("%", "%%"))
+        pieces.append(sql[position:].replace("%", "%%"))
+
+        if {index for index, _ in slots} != set(range(len(literals))):
+            return None
+        return "".join(pieces), slots
+
+    @staticmethod
+    def _bind(literal: str, kind: str):
+        if kind == "str":
+            return literal
+        return float(literal) if "." in literal else int(literal)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups * 100, 2) if lookups else 0.0,
+        }
+
+
+class TextToSQLEngine:
+    """
+    Exact rows for a database question, from SQL the LLM writes once.
+
+    The question's table (from database context discovery) and its
+    columns go to GroqService.generate_intelligent_sql; the SQL is run
+    through SafeSQLExecutor and, when it succeeds, cached per question
+    template. A repeat question (or the same question with different
+    values) skips SQL generation and only runs the cached statement.
+    The SQL may only read table_name: every FROM/JOIN relation is checked,
+    and any identifier that looks sensitive (passwords, tokens, keys,
+    sessions) rejects the statement, aliased or not. Sensitive columns
+    are also left out of the schema sent to the LLM and dropped from the
+    returned rows in case of SELECT *. System tables are never queried.
+    Anything that fails returns None and the answer relies on retrieval.
+    """
+
+    def __init__(self, groq_service: GroqService = None, db_connector: DatabaseConnector = None,
+                 executor: SafeSQLExecutor = None, cache: GeneratedSQLCache = None):
+        self.groq_service = groq_service or GroqService()
+        self.db_connector = db_connector or DatabaseConnector()
+        self.executor = executor or SafeSQLExecutor(self.db_connector.connection)
+        self.cache = cache or GeneratedSQLCache()
+
+        self.generated = 0
+        self.failed = 0
+
+    def run(self, query: str, table_name: str) -> Optional[Dict]:
+        if is_system_table(table_name):
+            return None
+        columns = [
+            c["name"] for c in self.db_connector.get_table_columns(table_name) if not is_sensitive_column(c["name"])
+        ]
+        if not columns:
+            return None
+        scope = f"{table_name}({','.join(columns)})"
+
+        with stage("text_to_sql"):
+            cached = self.cache.get(query, scope)
+            if cached is not None:
+                sql, params = cached
+            else:
+                sql, params = self._generate(query, table_name, columns), None
+            if not sql or not self.reads_only(sql, table_name):
+                print(f"⚠️ Generated SQL not used: it must read only {table_name}, without sensitive columns")
+                self.failed += 1
+                if cached is not None:
+                    self.cache.discard(query, scope)
+                return None
+
+            try:
+                result = self.executor.execute(sql, params)
+            except (SQLRejected, DatabaseError) as e:
+                print(f"⚠️ Generated SQL not used: {e}")
+                self.failed += 1
+                if cached is not None:
+                    self.cache.discard(query, scope)
+                return None
+
+        if cached is None:
+            self.cache.put(query, sql, scope)
+        print(f"🧾 SQL on {table_name}: {len(result.rows)} rows ({'cached SQL' if cached else 'generated'})")
+        visible = [column for column in result.columns if not is_sensitive_column(column)]
+        return {
+            "table": table_name,
+            "sql": sql,
+            "params": params,
+            "columns": visible,
+            "rows": [{column: row[column] for column in visible} for row in result.as_dicts()],
+            "truncated": result.truncated,
+            "cost": result.cost,
+            "sql_cached": cached is not None,
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "generated": self.generated,
+            "failed": self.failed,
+            "cache": self.cache.stats(),
+            "executor": self.executor.stats(),
+        }
+
+    def _generate(self, query: str, table_name: str, columns: List[str]) -> Optional[str]:
+        self.generated += 1
+        response = self.groq_service.generate_intelligent_sql(
+            query,
+            {
+                "table_name": table_name,
+                "columns": columns,
+                "entity_type": self.db_connector._guess_entity_type(table_name, columns),
+            },
+            fallback=False,
+        )
+        return extract_sql_from_response(response) if response else None
+
+    @staticmethod
+    def relations(sql: str) -> List[str]:
+        """Tables a SELECT reads (FROM lists, JOINs, subqueries), lowercased and unquoted"""
+        text = _FROM_ARGUMENT.sub(" ", _SQL_LITERAL.sub(" ", sql))
+        found = []
+        for pattern in (_FROM_LIST, _JOIN_TARGET):
+            for match in pattern.finditer(text):
+                for item in match.group("items").split(","):
+                    item = item.strip()
+                    if not item or item.startswith("("):
+                        continue  # A subquery; its own FROM is matched separately
+                    name = re.match(r'(?:"[^"]+"|\w+)(?:\s*\.\s*(?:"[^"]+"|\w+))?', item)
+                    found.append(re.sub(r'\s+', "", name.group(0) if name else item).replace('"', "").lower())
+        return found
+
+    @classmethod
+    def reads_only(cls, sql: str, table_name: str) -> bool:
+        """Whether SQL reads table_name alone and names no sensitive identifier"""
+        allowed = {table_name.lower(), f"public.{table_name.lower()}"}
+        relations = cls.relations(sql)
+        if not relations or any(r not in allowed or is_system_table(r.split(".")[-1]) for r in relations):
+            return False
+        for quoted, bare in _IDENTIFIER.findall(_SQL_LITERAL.sub(" ", sql)):
+            identifier = (quoted or bare).lower()
+            if identifier not in allowed and is_sensitive_column(identifier):
+                return False
+        return True
@@ -735,69 +735,180 @@ from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from typing import List, Dict, Optional
 from .database_connector import DatabaseConnector
+from .embedding_cache import CachedEmbeddings
+from .bm25_index import BM25Index
+from .retrieval_filters import metadata_matches
+from .query_matcher import QUERY_SYNONYMS, match_query
+from .stage_timer import stage
+from .single_flight import bump_data_version
+from .schema_snapshot import SchemaSnapshot
+from ..conf import rag_setting
+import hashlib
+import logging
 import os
 import json
+import threading
+import time
+
+
+logger = logging.getLogger('rag_system')
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[tuple]:
+    """
+    Fuse several ranked id lists into one ranking.
+    
+    Each id scores sum(1 / (k + rank)) over the lists it appears in, so
+    documents ranked well by several queries rise to the top regardless
+    of the raw distance scale of each query.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def hnsw_metadata(space: str = None, m: int = None, construction_ef: int = None, search_ef: int = None) -> Dict:
+    """Chroma collection metadata for the HNSW index; unset values come from RAG_SETTINGS"""
+    return {
+        "hnsw:space": space or rag_setting('HNSW_SPACE'),
+        "hnsw:M": m or rag_setting('HNSW_M'),
+        "hnsw:construction_ef": construction_ef or rag_setting('HNSW_CONSTRUCTION_EF'),
+        "hnsw:search_ef": search_ef or rag_setting('HNSW_SEARCH_EF'),
+    }
+
+
+def chunk_id(text: str, metadata: Dict = None) -> str:
+    """Deterministic ID for a chunk: hash of its text and metadata"""
+    payload = json.dumps(metadata or {}, sort_keys=True, default=str) + "\x00" + text
+    return hashlib.sha256(payload.encode()).hexdigest()
 
 
 class VectorStoreService:
     """Enhanced Vector Store with PostgreSQL integration"""
     
-    def __init__(self, persist_directory: str = "./data/vectorstore"):
+    # Metadata "type" of the generated database knowledge documents
+    KNOWLEDGE_TYPES = ["entity_knowledge", "table_specific", "query_pattern", "system_overview"]
+    UPSERT_BATCH_SIZE = 256
+    CHUNK_SIZE = 1000
+    CHUNK_OVERLAP = 200
+    COLLECTION_NAME = "lms_knowledge"
+    
+    def __init__(self, persist_directory: str = "./data/vectorstore", db_connector: DatabaseConnector = None):
         self.persist_directory = persist_directory
         os.makedirs(persist_directory, exist_ok=True)
         
         print("🚀 Initializing Enhanced Vector Store...")
         
-        # Initialize embeddings
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
-            model_kwargs={'device': 'cpu'}
+        # Initialize embeddings behind an LRU (+ optional on-disk) cache
+        model_name = rag_setting('EMBEDDING_MODEL')
+        disk_path = None
+        if rag_setting('EMBEDDING_CACHE_DISK'):
+            disk_path = os.path.join(
+                os.path.dirname(os.path.abspath(persist_directory)), 'embedding_cache.sqlite3'
+            )
+        self.embeddings = CachedEmbeddings(
+            HuggingFaceEmbeddings(
+                model_name=model_name,
+                model_kwargs={'device': 'cpu'}
+            ),
+            model_name=model_name,
+            max_entries=rag_setting('EMBEDDING_CACHE_SIZE'),
+            disk_path=disk_path,
+            max_disk_entries=rag_setting('EMBEDDING_CACHE_DISK_SIZE')
         )
         
         # Initialize ChromaDB
         self.vectorstore = Chroma(
             persist_directory=persist_directory,
             embedding_function=self.embeddings,
-            collection_name="lms_knowledge"
+            collection_name=self.COLLECTION_NAME,
+            collection_metadata=hnsw_metadata()
         )
+        self._check_hnsw_settings()
+        
+        # Keyword index over the same chunks, fused with vector hits in search()
+        self.keyword_index_path = os.path.join(persist_directory, 'bm25_index.json')
+        self._keyword_index_dirty = False
+        self._keyword_index_mtime = None
+        self._keyword_index_checked = time.monotonic()
+        self._keyword_index_lock = threading.Lock()
+        self.keyword_index = self._load_keyword_index() if rag_setting('HYBRID_SEARCH_ENABLED') else None
         
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
+            chunk_size=self.CHUNK_SIZE,
+            chunk_overlap=self.CHUNK_OVERLAP,
         )
         
         # Initialize database connector
-        self.db_connector = DatabaseConnector()
+        self.db_connector = db_connector or DatabaseConnector()
         
         print("✅ Enhanced Vector Store initialized!")
     
+    def _check_hnsw_settings(self):
+        """Warn when an existing collection was built with other HNSW settings"""
+        current = self.vectorstore._collection.metadata or {}
+        configured = hnsw_metadata()
+        # Chroma leaves unset keys out of the metadata, which means its defaults
+        defaults = {"hnsw:space": "l2", "hnsw:M": 16, "hnsw:construction_ef": 100, "hnsw:search_ef": 10}
+        mismatched = [
+            key for key, value in configured.items()
+            if current.get(key, defaults[key]) != value
+        ]
+        if mismatched:
+            print(
+                f"⚠️ Collection '{self.COLLECTION_NAME}' uses different HNSW settings for "
+                f"{', '.join(mismatched)}; rebuild the vector store to apply RAG_SETTINGS"
+            )
+    
     def initialize_with_database_knowledge(self, refresh: bool = False):
         """Initialize vector store with PostgreSQL database knowledge"""
         print("📚 Loading PostgreSQL database knowledge...")
         
-        # Get all tables from database
-        all_tables = self.db_connector.get_all_tables()
+        # One bulk introspection pass for all tables
+        snapshot = self.db_connector.get_schema_snapshot()
+        all_tables = snapshot.table_names or self.db_connector.get_all_tables()
         print(f"📊 Found {len(all_tables)} tables in PostgreSQL")
         
         # Check if already initialized
+        knowledge_scope = {"type": {"$in": self.KNOWLEDGE_TYPES}}
         if not refresh:
-            existing_count = self.vectorstore._collection.count()
-            if existing_count > 100:
-                print(f"✅ Vector store already initialized with {existing_count} documents")
+            existing_count = len(self.vectorstore._collection.get(where=knowledge_scope, include=[])["ids"])
+            if existing_count > 0:
+                print(f"✅ Vector store already initialized with {existing_count} knowledge chunks")
                 return
         
         # Create comprehensive documentation
-        documentation = self._create_comprehensive_docs(all_tables)
+        documentation = self._create_comprehensive_docs(all_tables, snapshot)
         
         texts = [doc["content"] for doc in documentation]
         metadatas = [doc["metadata"] for doc in documentation]
         
-        self.add_documents(texts, metadatas)
-        print(f"✅ Initialized with {len(documentation)} knowledge documents")
+        # Only new or changed chunks get embedded; chunks no longer generated are removed
+        result = self.upsert_documents(texts, metadatas, scope=knowledge_scope)
+        print(
+            f"✅ Knowledge refreshed from {len(documentation)} documents: "
+            f"{result['added']} added, {result['unchanged']} unchanged, {result['deleted']} removed"
+        )
+        return result
     
-    def _create_comprehensive_docs(self, tables: List[str]) -> List[Dict]:
+    def index_tables(self, tables: List[str]) -> Dict:
+        """Refresh the table_specific chunks of the given tables, removing their stale chunks"""
+        snapshot = self.db_connector.get_schema_snapshot()
+        docs = self._create_table_specific_docs(tables, snapshot)
+        # Chroma allows one field per filter dict, hence $and
+        scope = {"$and": [{"type": "table_specific"}, {"table_name": {"$in": list(tables)}}]}
+        return self.upsert_documents(
+            [doc["content"] for doc in docs],
+            [doc["metadata"] for doc in docs],
+            scope=scope
+        )
+    
+    def _create_comprehensive_docs(self, tables: List[str], snapshot: SchemaSnapshot = None) -> List[Dict]:
         """Create comprehensive knowledge documents for all tables"""
         docs = []
+        snapshot = snapshot or self.db_connector.get_schema_snapshot()
         
         # Filter system tables
         user_tables = [t for t in tables if not any(
@@ -813,7 +924,7 @@ class VectorStoreService:
         for entity_type, entity_tables in table_groups.items():
             if entity_tables:
                 try:
-                    doc = self._create_entity_doc(entity_type, entity_tables)
+                    doc = self._create_entity_doc(entity_type, entity_tables, snapshot)
                     docs.append(doc)
                 except Exception as e:
                     print(f"⚠️ Error creating doc for {entity_type}: {e}")
@@ -825,7 +936,7 @@ class VectorStoreService:
         docs.extend(self._create_general_knowledge_docs())
         
         # Add table-specific documentation
-        docs.extend(self._create_table_specific_docs(user_tables[:20]))  # Top 20 tables
+        docs.extend(self._create_table_specific_docs(user_tables[:20], snapshot))  # Top 20 tables
         
         return docs
     
@@ -858,12 +969,33 @@ class VectorStoreService:
         
         return groups
     
-    def _create_entity_doc(self, entity_type: str, tables: List[str]) -> Dict:
+    def _table_info(self, table: str, snapshot: SchemaSnapshot) -> Dict:
+        """Columns, row estimate and relationships for a table, from the snapshot if possible"""
+        if snapshot is not None and snapshot.has_table(table):
+            columns = snapshot.columns(table)
+            return {
+                "columns": columns,
+                "row_count": snapshot.row_estimate(table) or 0,
+                "entity_type": self.db_connector._guess_entity_type(table, columns),
+                "foreign_keys": snapshot.foreign_keys(table)
+            }
+        return self.db_connector.get_table_schema_info(table)
+    
+    def _format_relationships(self, foreign_keys: List[Dict]) -> str:
+        """Format foreign keys for display"""
+        if not foreign_keys:
+            return "  • None"
+        return "\n".join(
+            f"  • {fk['column']} → {fk['references_table']}.{fk['references_column']}"
+            for fk in foreign_keys[:10]
+        )
+    
+    def _create_entity_doc(self, entity_type: str, tables: List[str], snapshot: SchemaSnapshot = None) -> Dict:
         """Create documentation for an entity type"""
         main_table = tables[0]
         
         # Get actual schema from database
-        schema_info = self.db_connector.get_table_schema_info(main_table)
+        schema_info = self._table_info(main_table, snapshot)
         columns = schema_info.get("columns", [])
         row_count = schema_info.get("row_count", 0)
         
@@ -916,6 +1048,9 @@ TABLE STRUCTURE:
 The {main_table} table contains {len(columns)} columns including:
 {self._format_column_list(columns[:10])}
 
+RELATIONSHIPS:
+{self._format_relationships(schema_info.get("foreign_keys", []))}
+
 IMPORTANT NOTES:
 - Use table name: {main_table}
 - Total records: {row_count}
@@ -939,13 +1074,13 @@ IMPORTANT NOTES:
         """Format columns for display"""
         return "\n".join([f"  • {col}" for col in columns])
     
-    def _create_table_specific_docs(self, tables: List[str]) -> List[Dict]:
+    def _create_table_specific_docs(self, tables: List[str], snapshot: SchemaSnapshot = None) -> List[Dict]:
         """Create specific documentation for important tables"""
         docs = []
         
         for table in tables:
             try:
-                schema_info = self.db_connector.get_table_schema_info(table)
+                schema_info = self._table_info(table, snapshot)
                 
                 content = f"""
 TABLE: {table}
@@ -954,6 +1089,7 @@ TABLE: {table}
 COLUMNS: {', '.join(schema_info.get('columns', [])[:10])}
 RECORDS: {schema_info.get('row_count', 0)}
 ENTITY TYPE: {schema_info.get('entity_type', 'unknown')}
+REFERENCES: {', '.join(sorted({fk['references_table'] for fk in schema_info.get('foreign_keys', [])})) or 'None'}
 
 USAGE:
 - Direct table reference: {table}
@@ -1105,93 +1241,305 @@ QUERY GUIDELINES:
         
         return docs
     
-    def add_documents(self, texts: List[str], metadatas: List[Dict] = None):
-        """Add documents to vector store"""
-        if not texts:
-            return
+    def add_documents(self, texts: List[str], metadatas: List[Dict] = None) -> int:
+        """Add documents to vector store, skipping chunks it already holds"""
+        return self.upsert_documents(texts, metadatas)["added"]
+    
+    def upsert_documents(self, texts: List[str], metadatas: List[Dict] = None, scope: Dict = None) -> Dict:
+        """
+        Sync documents into the collection by content-hashed chunk ID.
+        
+        Chunks whose ID already exists are left alone (no re-embedding).
+        If scope (a Chroma where filter) is given, existing chunks matching
+        it that are not part of this batch are deleted as stale.
+        """
+        chunks = self._split_with_ids(texts, metadatas)
+        result = self.upsert_chunks(chunks, check_scope=scope)
+        result["deleted"] = self.prune(scope, keep_ids=chunks) if scope is not None else 0
+        
+        if result["added"] or result["deleted"]:
+            print(f"📚 Added {result['added']} chunks, removed {result['deleted']} stale chunks")
+        return result
+    
+    def upsert_chunks(self, chunks: Dict[str, tuple], check_scope: Dict = None) -> Dict:
+        """
+        Embed and add the chunks ({chunk_id: (text, metadata)}) not yet stored.
+        
+        check_scope lets callers that already sync a whole scope fetch the
+        existing IDs in one query instead of looking up each ID.
+        """
+        if not chunks:
+            return {"added": 0, "unchanged": 0}
         
-        chunks = []
-        chunk_metadatas = []
+        if check_scope is not None:
+            existing = set(self.vectorstore._collection.get(where=check_scope, include=[])["ids"])
+        else:
+            existing = set(self.vectorstore._collection.get(ids=list(chunks), include=[])["ids"])
+        
+        new_ids = [cid for cid in chunks if cid not in existing]
+        
+        for start in range(0, len(new_ids), self.UPSERT_BATCH_SIZE):
+            batch = new_ids[start:start + self.UPSERT_BATCH_SIZE]
+            self.vectorstore.add_texts(
+                texts=[chunks[cid][0] for cid in batch],
+                metadatas=[chunks[cid][1] for cid in batch],
+                ids=batch
+            )
         
-        for i, text in enumerate(texts):
+        if self.keyword_index is not None and new_ids:
+            self.keyword_index.add_many((cid, chunks[cid][0], chunks[cid][1]) for cid in new_ids)
+            self._keyword_index_dirty = True
+        if new_ids:
+            bump_data_version()
+        
+        return {"added": len(new_ids), "unchanged": len(chunks) - len(new_ids)}
+    
+    def prune(self, scope: Dict, keep_ids) -> int:
+        """Delete chunks matching scope whose ID is not in keep_ids"""
+        keep_ids = set(keep_ids)
+        existing = self.vectorstore._collection.get(where=scope, include=[])["ids"]
+        stale_ids = [cid for cid in existing if cid not in keep_ids]
+        
+        for start in range(0, len(stale_ids), self.UPSERT_BATCH_SIZE):
+            self.vectorstore._collection.delete(ids=stale_ids[start:start + self.UPSERT_BATCH_SIZE])
+        
+        if self.keyword_index is not None and stale_ids:
+            self.keyword_index.remove(stale_ids)
+            self._keyword_index_dirty = True
+        if stale_ids:
+            bump_data_version()
+        
+        # Every sync ends with a prune, so this is where the keyword index is persisted
+        self.save_keyword_index()
+        return len(stale_ids)
+    
+    def save_keyword_index(self):
+        """Persist the BM25 index next to the collection if it changed"""
+        if self.keyword_index is None or not self._keyword_index_dirty:
+            return
+        try:
+            self.keyword_index.save(self.keyword_index_path)
+            self._keyword_index_dirty = False
+            self._keyword_index_mtime = self._keyword_index_file_mtime()
+        except OSError as e:
+            print(f"⚠️ Could not save keyword index: {e}")
+    
+    def rebuild_keyword_index(self) -> int:
+        """Rebuild the BM25 index from every chunk in the collection"""
+        index = BM25Index(k1=rag_setting('BM25_K1'), b=rag_setting('BM25_B'))
+        offset = 0
+        while True:
+            page = self.vectorstore._collection.get(
+                include=["documents", "metadatas"], limit=1000, offset=offset
+            )
+            if not page["ids"]:
+                break
+            index.add_many(zip(page["ids"], page["documents"], page["metadatas"]))
+            offset += len(page["ids"])
+        
+        self.keyword_index = index
+        self._keyword_index_dirty = True
+        self.save_keyword_index()
+        print(f"🔤 Keyword index rebuilt with {len(index)} chunks")
+        return len(index)
+    
+    def _load_keyword_index(self) -> Optional[BM25Index]:
+        """Load the persisted BM25 index, rebuilding it if missing or out of sync"""
+        try:
+            if os.path.exists(self.keyword_index_path):
+                mtime = self._keyword_index_file_mtime()
+                index = BM25Index.load(self.keyword_index_path)
+                if len(index) == self.vectorstore._collection.count():
+                    self._keyword_index_mtime = mtime
+                    return index
+            self.rebuild_keyword_index()
+            return self.keyword_index
+        except Exception as e:
+            print(f"⚠️ Keyword index unavailable, using vector search only: {e}")
+            return None
+    
+    def refresh_keyword_index(self):
+        """
+        Pick up changes made to the collection by other processes.
+        
+        Each worker holds its own copy of the index. It is reloaded when
+        another process rewrote the index file, and rebuilt when its size
+        no longer matches the collection (e.g. chunks added by a Celery
+        worker that has not saved yet). Local unsaved changes are kept as
+        long as the collection agrees with them.
+        """
+        if self.keyword_index is None:
+            return
+        if time.monotonic() - self._keyword_index_checked < rag_setting('KEYWORD_INDEX_REFRESH_SECONDS'):
+            return
+        if not self._keyword_index_lock.acquire(blocking=False):
+            return  # Another thread is already refreshing
+        try:
+            mtime = self._keyword_index_file_mtime()
+            if mtime is not None and mtime != self._keyword_index_mtime and not self._keyword_index_dirty:
+                index = self._load_keyword_index()
+                if index is not None:
+                    self.keyword_index = index
+            elif len(self.keyword_index) != self.vectorstore._collection.count():
+                self.rebuild_keyword_index()
+        except Exception:
+            logger.exception("Keyword index refresh failed, keeping the current index")
+        finally:
+            self._keyword_index_checked = time.monotonic()
+            self._keyword_index_lock.release()
+    
+    def _keyword_index_file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.keyword_index_path).st_mtime_ns
+        except OSError:
+            return None
+    
+    def _split_with_ids(self, texts: List[str], metadatas: List[Dict] = None) -> Dict[str, tuple]:
+        """Split texts into chunks keyed by chunk ID (duplicates collapse)"""
+        chunks = {}
+        
+        for i, text in enumerate(texts or []):
             if not text or len(text.strip()) == 0:
                 continue
             
             metadata = metadatas[i] if metadatas and i < len(metadatas) else {}
             
             # Split into chunks
-            text_chunks = self.text_splitter.split_text(text)
-            chunks.extend(text_chunks)
-            chunk_metadatas.extend([metadata] * len(text_chunks))
+            for chunk in self.text_splitter.split_text(text):
+                chunks.setdefault(chunk_id(chunk, metadata), (chunk, metadata))
         
-        if chunks:
-            self.vectorstore.add_texts(
-                texts=chunks,
-                metadatas=chunk_metadatas
-            )
-            print(f"📚 Added {len(chunks)} chunks to vector store")
+        return chunks
     
-    def search(self, query: str, k: int = 10) -> List[Dict]:
-        """Search for relevant information with query expansion"""
+    def search(self, query: str, k: int = 10, where: Optional[Dict] = None) -> List[Dict]:
+        """
+        Hybrid search: vector hits and BM25 keyword hits fused by rank.
+        
+        `where` is a Chroma metadata filter (see retrieval_filters); if it
+        leaves too few hits, unfiltered results are appended after them.
+        """
+        self.refresh_keyword_index()
+        results = self._search(query, k, where)
+        if where is None or len(results) >= min(k, rag_setting('RETRIEVAL_FILTER_MIN_RESULTS')):
+            return results
+        
+        seen_contents = {hashlib.md5(result["content"].encode()).hexdigest() for result in results}
+        for result in self._search(query, k):
+            if len(results) >= k:
+                break
+            content_hash = hashlib.md5(result["content"].encode()).hexdigest()
+            if content_hash not in seen_contents:
+                seen_contents.add(content_hash)
+                results.append(result)
+        return results
+    
+    def _search(self, query: str, k: int, where: Optional[Dict] = None) -> List[Dict]:
         try:
-            # Expand query
-            expanded_queries = self._expand_query(query)
+            # Synonym expansion is optional now that exact terms come from BM25
+            if rag_setting('QUERY_EXPANSION_ENABLED'):
+                expanded_queries = self._expand_query(query)[:3]  # Top 3 expansions
+            else:
+                expanded_queries = [query]
             
-            all_results = []
-            seen_contents = set()
+            # One batched forward pass and one multi-embedding HNSW query
+            with stage("embedding"):
+                query_embeddings = self.embeddings.embed_documents(expanded_queries)
             
-            for expanded_query in expanded_queries[:3]:  # Top 3 expansions
-                results = self.vectorstore.similarity_search_with_score(
-                    expanded_query, 
-                    k=k
+            with stage("vector_search"):
+                query_kwargs = {"where": where} if where else {}
+                raw = self.vectorstore._collection.query(
+                    query_embeddings=query_embeddings,
+                    n_results=k,
+                    include=["documents", "metadatas", "distances"],
+                    **query_kwargs
                 )
                 
-                for doc, score in results:
-                    content_hash = hash(doc.page_content[:100])
-                    if content_hash not in seen_contents:
-                        seen_contents.add(content_hash)
-                        all_results.append({
-                            "content": doc.page_content,
-                            "metadata": doc.metadata,
-                            "score": float(1 - score),  # Convert to similarity
-                            "query": expanded_query
-                        })
-            
-            # Sort by score and return top k
-            all_results.sort(key=lambda x: x["score"], reverse=True)
-            return all_results[:k]
+                candidates = {}
+                rankings = []
+                for i, expanded_query in enumerate(expanded_queries):
+                    ranking = []
+                    for doc_id, content, metadata, distance in zip(
+                        raw["ids"][i], raw["documents"][i], raw["metadatas"][i], raw["distances"][i]
+                    ):
+                        ranking.append(doc_id)
+                        similarity = float(1 - distance)  # Convert to similarity
+                        if doc_id not in candidates or similarity > candidates[doc_id]["score"]:
+                            candidates[doc_id] = {
+                                "content": content,
+                                "metadata": metadata or {},
+                                "score": similarity,
+                                "query": expanded_query
+                            }
+                    rankings.append(ranking)
+                
+                # Keyword hits catch exact table/column names dense vectors miss
+                if self.keyword_index is not None:
+                    try:
+                        rankings.append(self._keyword_ranking(query, k, where, candidates))
+                    except Exception:
+                        logger.exception("Keyword search failed, using vector hits only")
+                
+                # Rank fusion, then drop chunks whose full content is a duplicate
+                results = []
+                seen_contents = set()
+                for doc_id, fused_score in reciprocal_rank_fusion(rankings):
+                    result = candidates[doc_id]
+                    content_hash = hashlib.md5(result["content"].encode()).hexdigest()
+                    if content_hash in seen_contents:
+                        continue
+                    seen_contents.add(content_hash)
+                    result["rrf_score"] = round(fused_score, 5)
+                    results.append(result)
+                    if len(results) >= k:
+                        break
+                
+                return results
             
-        except Exception as e:
-            print(f"❌ Search error: {e}")
-            return []
+        except Exception:
+            # Surface the failure: an empty result would read as "no relevant knowledge"
+            logger.exception("Vector search failed for query %r", query)
+            raise
+    
+    def _keyword_ranking(self, query: str, k: int, where: Optional[Dict], candidates: Dict) -> List[str]:
+        """BM25 hits matching `where`, adding keyword-only hits to candidates"""
+        ranking = []
+        # Over-fetch when filtering, since filtered-out hits are dropped here
+        for doc_id, bm25_score in self.keyword_index.search(query, k=k * 3 if where else k):
+            doc = self.keyword_index.get(doc_id)
+            if doc is None or not metadata_matches(doc["metadata"], where):
+                continue
+            if len(ranking) >= k:
+                break
+            ranking.append(doc_id)
+            if doc_id not in candidates:
+                candidates[doc_id] = {
+                    "content": doc["content"],
+                    "metadata": doc["metadata"] or {},
+                    "score": 0.0,
+                    "query": query
+                }
+            candidates[doc_id]["bm25_score"] = round(bm25_score, 3)
+        return ranking
     
     def _expand_query(self, query: str) -> List[str]:
         """Expand query with variations"""
         query_lower = query.lower()
+        terms = match_query(query).terms
         expansions = [query]
         
         # Entity synonyms
-        synonyms = {
-            "user": ["account", "profile"],
-            "student": ["pupil", "learner"],
-            "teacher": ["instructor", "faculty"],
-            "class": ["grade", "section"],
-            "exam": ["test", "assessment"],
-            "fee": ["payment", "invoice"]
-        }
-        
-        for entity, syns in synonyms.items():
-            if entity in query_lower:
+        for entity, syns in QUERY_SYNONYMS.items():
+            if entity in terms:
                 for syn in syns:
                     expansions.append(query_lower.replace(entity, syn))
         
         # Query type variations
-        if "how many" in query_lower:
+        if "how many" in terms:
             expansions.append(query_lower.replace("how many", "count"))
-        if "show" in query_lower:
+        if "show" in terms:
             expansions.append(query_lower.replace("show", "list"))
         
-        return list(set(expansions))
+        # De-duplicate while keeping the original query first
+        return list(dict.fromkeys(expansions))
     
     def stats(self) -> Dict:
         """Get vector store statistics"""
@@ -1200,7 +1548,13 @@ QUERY GUIDELINES:
             return {
                 "total_documents": count,
                 "status": "operational" if count > 0 else "empty",
-                "persist_directory": self.persist_directory
+                "persist_directory": self.persist_directory,
+                "embedding_cache": self.embeddings.stats(),
+                "hnsw": {
+                    key: value for key, value in (self.vectorstore._collection.metadata or {}).items()
+                    if key.startswith("hnsw:")
+                },
+                "keyword_index_documents": len(self.keyword_index) if self.keyword_index is not None else None
             }
         except:
             return {
@@ -5,33 +5,17 @@ from celery import shared_task
 def process_document_task(document_id: str):
     """Process document asynchronously"""
     from .models import DocumentStore
-    from .services.rag_service import RAGService
-    from .services.pdf_reader import DocumentReader
+    from .services.engine import get_rag_engine
+    from .services.ingestion import DocumentIngestionPipeline
     
     try:
         document = DocumentStore.objects.get(id=document_id)
         
-        # Read document
-        doc_reader = DocumentReader()
-        text = doc_reader.read_document(document.file.path, document.document_type)
+        pipeline = DocumentIngestionPipeline(get_rag_engine().vectorstore)
+        stats = pipeline.ingest(document)
         
-        if text:
-            # Add to vector store
-            rag_service = RAGService()
-            rag_service.vectorstore.add_documents(
-                texts=[text],
-                metadatas=[{
-                    'document_id': str(document.id),
-                    'title': document.title,
-                    'type': document.document_type
-                }]
-            )
-            
-            document.is_processed = True
-            document.vector_count = len(text.split('\n\n'))
-            document.save()
-            
-            return f"Document {document_id} processed successfully"
+        if document.status == 'completed':
+            return f"Document {document_id} processed successfully: {document.chunk_count} chunks in {stats['total_seconds']}s"
         else:
             return f"Could not extract text from document {document_id}"
             
@@ -42,10 +26,10 @@ def process_document_task(document_id: str):
 @shared_task
 def index_all_database_tables():
     """Index all important database tables"""
-    from .services.rag_service import RAGService
+    from .services.engine import get_rag_engine
     
-    rag_service = RAGService()
-    rag_service.index_database_tables()
+    vectorstore = get_rag_engine().vectorstore
+    vectorstore.initialize_with_database_knowledge(refresh=True)
     return "Database tables indexed successfully"
 
 
@@ -55,10 +39,16 @@ def cleanup_old_cache():
     from django.utils import timezone
     from datetime import timedelta
     from .models import QueryCache
+    from .services.query_cache import QueryResultCache
     
     thirty_days_ago = timezone.now() - timedelta(days=30)
     deleted_count = QueryCache.objects.filter(
         last_used__lt=thirty_days_ago
     ).delete()[0]
     
+    # Expired answers and LFU overflow
+    cache = QueryResultCache()
+    deleted_count += cache.evict_expired()
+    deleted_count += cache.trim()
+    
     return f"Deleted {deleted_count} old cache entries"
\ No newline at end of file
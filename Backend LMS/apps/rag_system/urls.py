@@ -7,7 +7,8 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     VectorStoreRAGChatViewSet, DocumentManagementViewSet,
-    initialize_vectorstore, rag_metrics, clear_cache, system_status
+    initialize_vectorstore, rag_metrics, clear_cache, system_status,
+    async_chat_query
 )
 
 router = DefaultRouter()
@@ -22,6 +23,7 @@ urlpatterns = [
     path('v1/metrics/', rag_metrics, name='metrics'),
     path('v1/clear/cache/', clear_cache, name='clear-cache'),
     path('v1/status/', system_status, name='system-status'),
+    path('v1/chat/query/async/', async_chat_query, name='async-chat-query'),
 ]
 
 """
@@ -32,6 +34,7 @@ BASE: /api/rag/
 
 CHAT ENDPOINTS (VectorStoreRAGChatViewSet):
 1. POST   /api/rag/chat/query/                  # Main chat query
+   POST   /api/rag/chat/query_stream/           # Main chat query (SSE stream)
 2. GET    /api/rag/chat/history/                # Get chat history  
 3. DELETE /api/rag/chat/clear_history/          # Clear history
 4. POST   /api/rag/chat/diagnose/               # Diagnose query
@@ -48,9 +51,10 @@ DOCUMENT ENDPOINTS (ModelViewSet):
 
 UTILITY ENDPOINTS (API Views):
 13. POST   /api/rag/v1/initialize/              # Initialize vector store
-14. GET    /api/rag/v1/metrics/                 # Get system metrics
+14. GET    /api/rag/v1/metrics/                 # Get system metrics (?days=7&query_type=...)
 15. DELETE /api/rag/v1/clear/cache/             # Clear cache
 16. GET    /api/rag/v1/status/                  # System status
+    POST   /api/rag/v1/chat/query/async/        # Main chat query (async, ASGI)
 
 TOTAL: 16 Endpoints
 """
\ No newline at end of file
@@ -9,9 +9,17 @@ from typing import Dict, Any, List
 from datetime import datetime
 
 
-def create_query_hash(query: str) -> str:
-    """Create hash for query caching"""
-    return hashlib.sha256(query.encode()).hexdigest()
+def normalize_query(query: str) -> str:
+    """Normalize query text so trivially different wordings share a cache key"""
+    query = query.lower().strip()
+    query = re.sub(r'\s+', ' ', query)
+    return query.rstrip('?!. ')
+
+
+def create_query_hash(query: str, scope: str = '') -> str:
+    """Create hash for query caching (scope separates e.g. user roles)"""
+    key = f"{scope}:{query}" if scope else query
+    return hashlib.sha256(key.encode()).hexdigest()
 
 
 def format_database_results(results: list) -> str:
@@ -60,13 +68,13 @@ def validate_sql_query(query: str) -> bool:
     if not query_upper.startswith("SELECT"):
         return False
     
-    # Block dangerous keywords
+    # Block dangerous keywords (whole words, so columns like updated_at pass)
     dangerous_keywords = [
         'DROP', 'DELETE', 'UPDATE', 'INSERT', 
         'ALTER', 'CREATE', 'TRUNCATE', 'EXEC',
         'EXECUTE', 'GRANT', 'REVOKE'
     ]
-    if any(keyword in query_upper for keyword in dangerous_keywords):
+    if re.search(r'\b(?:' + '|'.join(dangerous_keywords) + r')\b', query_upper):
         return False
     
     return True
@@ -167,11 +175,11 @@ def extract_entities_from_query(query: str) -> Dict[str, List[str]]:
     names = re.findall(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b', query)
     entities['names'] = names
     
-    # Extract keywords
+    # Extract keywords (imported here: the services package imports this module)
+    from .services.query_matcher import match_query
+    terms = match_query(query).terms
     keywords = ['student', 'teacher', 'class', 'fee', 'exam', 'attendance']
-    for keyword in keywords:
-        if keyword in query.lower():
-            entities['keywords'].append(keyword)
+    entities['keywords'] = [keyword for keyword in keywords if keyword in terms]
     
     return entities
 
@@ -442,45 +442,67 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import DocumentStore, ChatHistory, QueryCache, RAGMetrics
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+from utils.authenticate import CustomAuthentication
+from .models import DocumentStore, ChatHistory, QueryCache, RAGMetrics, RAGLatencyHistogram
 from .serializers import (
     DocumentStoreSerializer, ChatQuerySerializer, 
     ChatHistorySerializer, RAGMetricsSerializer
 )
-from .services.orchestrator import VectorStoreOrchestrator
-from .services.rag_service import VectorStoreRAGService
-from .services.vectorstore_service import VectorStoreService
-from .services.database_connector import DatabaseConnector
+from .services.engine import get_rag_engine
+from .services.latency_histogram import summarize_histograms
+from .services.metrics_recorder import get_metrics_recorder
+from .services.single_flight import bump_data_version
+from .conf import rag_setting
+from django.db import transaction
+import json
 import uuid
 
 
+class EventStreamRenderer(BaseRenderer):
+    """Lets clients send 'Accept: text/event-stream' to the streaming action"""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, default=str).encode(self.charset)
+
+
+def build_user_context(user) -> dict:
+    """Who is asking, as the orchestrator scopes answers; staff accounts count as 'admin'"""
+    if getattr(user, 'is_staff', False) or getattr(user, 'is_superuser', False):
+        user_type = 'admin'
+    else:
+        user_type = getattr(user, 'user_type', None) or getattr(user, 'type', None) or 'user'
+    return {'user_id': user.id, 'user_type': user_type, 'username': user.username}
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
 class VectorStoreRAGChatViewSet(viewsets.ViewSet):
     """Enhanced Vector Store + PostgreSQL RAG Chat API"""
     permission_classes = [IsAuthenticated]
     
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.orchestrator = None
-        self.vectorstore = None
-        self.db_connector = None
-    
+    # DRF builds a new viewset per request, so components come from the
+    # process-wide engine instead of being cached on the instance.
     def _get_orchestrator(self):
-        """Lazy initialization of orchestrator"""
-        if self.orchestrator is None:
-            self.orchestrator = VectorStoreOrchestrator()
-        return self.orchestrator
+        """Shared orchestrator for this worker process"""
+        return get_rag_engine().orchestrator
     
     def _get_vectorstore(self):
-        """Lazy initialization of vector store"""
-        if self.vectorstore is None:
-            self.vectorstore = VectorStoreService()
-        return self.vectorstore
+        """Shared vector store for this worker process"""
+        return get_rag_engine().vectorstore
     
     def _get_db_connector(self):
-        """Lazy initialization of database connector"""
-        if self.db_connector is None:
-            self.db_connector = DatabaseConnector()
-        return self.db_connector
+        """Shared database connector for this worker process"""
+        return get_rag_engine().db_connector
     
     @action(detail=False, methods=['post'])
     def query(self, request):
@@ -506,29 +528,13 @@ class VectorStoreRAGChatViewSet(viewsets.ViewSet):
         use_cache = serializer.validated_data.get('use_cache', True)
         
         # Build user context
-        user_context = {
-            'user_id': request.user.id,
-            'user_type': getattr(request.user, 'user_type', 'user'),
-            'username': request.user.username
-        }
+        user_context = build_user_context(request.user)
         
         try:
             orchestrator = self._get_orchestrator()
-            result = orchestrator.process_intelligent_query(query, user_context)
-            
-            # Save to chat history
-            ChatHistory.objects.create(
-                user=request.user,
-                session_id=session_id,
-                query=query,
-                response=result.get('response', ''),
-                context_used=result.get('context_sources', {}),
-                tokens_used=result.get('tokens_used', 0),
-                response_time=result.get('response_time', 0.0)
-            )
+            result = orchestrator.process_intelligent_query(query, user_context, use_cache=use_cache)
             
-            # Update metrics
-            self._update_metrics(result)
+            self._record_result(request.user, session_id, query, result)
             
             return Response(result, status=status.HTTP_200_OK)
             
@@ -545,6 +551,62 @@ class VectorStoreRAGChatViewSet(viewsets.ViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    @action(detail=False, methods=['post'], renderer_classes=[JSONRenderer, EventStreamRenderer])
+    def query_stream(self, request):
+        """
+        Process user query and stream the answer as server-sent events
+        
+        POST /api/rag/chat/query_stream/
+        Body: same as /api/rag/chat/query/
+        
+        Events: "metadata" (retrieval info, sent before generation starts),
+        "token" (answer text deltas), "done" (final result, same shape as
+        the non-streaming endpoint). History and metrics are written once
+        the stream completes.
+        """
+        serializer = ChatQuerySerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"error": "Invalid request", "details": serializer.errors}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        query = serializer.validated_data['query']
+        session_id = serializer.validated_data.get('session_id', str(uuid.uuid4()))
+        use_cache = serializer.validated_data.get('use_cache', True)
+        user = request.user
+        
+        user_context = build_user_context(user)
+        
+        orchestrator = self._get_orchestrator()
+        
+        def event_stream():
+            result = None
+            try:
+                for event, data in orchestrator.stream_intelligent_query(query, user_context, use_cache=use_cache):
+                    if event == "done":
+                        result = data
+                        data = dict(data, session_id=session_id)
+                    yield sse_event(event, data)
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                result = {
+                    "query": query,
+                    "response": "Sorry, I encountered an error processing your request.",
+                    "success": False,
+                    "error": str(e)
+                }
+                yield sse_event("error", result)
+            finally:
+                if result is not None:
+                    self._record_result(user, session_id, query, result)
+        
+        response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+        return response
+    
     @action(detail=False, methods=['get'])
     def history(self, request):
         """
@@ -555,6 +617,9 @@ class VectorStoreRAGChatViewSet(viewsets.ViewSet):
         session_id = request.query_params.get('session_id')
         limit = int(request.query_params.get('limit', 50))
         
+        # Include this worker's buffered chats, so the answer just given is listed
+        get_metrics_recorder().flush()
+        
         queryset = ChatHistory.objects.filter(user=request.user)
         
         if session_id:
@@ -570,6 +635,9 @@ class VectorStoreRAGChatViewSet(viewsets.ViewSet):
         """Clear chat history"""
         session_id = request.query_params.get('session_id')
         
+        # Buffered chats would otherwise be written after the delete and reappear
+        get_metrics_recorder().flush()
+        
         if session_id:
             count = ChatHistory.objects.filter(
                 user=request.user, 
@@ -635,10 +703,13 @@ class VectorStoreRAGChatViewSet(viewsets.ViewSet):
         """
         Get database summary
         
-        GET /api/rag/chat/database_summary/
+        GET /api/rag/chat/database_summary/?exact_counts=true
+        
+        Row counts are planner estimates unless exact_counts=true.
         """
         try:
             db_connector = self._get_db_connector()
+            exact_counts = str(request.query_params.get('exact_counts', '')).lower() in ('1', 'true', 'yes')
             
             all_tables = db_connector.get_all_tables()
             user_tables = [t for t in all_tables if not any(
@@ -649,10 +720,11 @@ class VectorStoreRAGChatViewSet(viewsets.ViewSet):
             sample_tables = {}
             for table in user_tables[:10]:
                 try:
-                    info = db_connector.get_table_schema_info(table)
+                    info = db_connector.get_table_schema_info(table, exact_count=exact_counts)
                     sample_tables[table] = {
                         "columns": info.get("columns", [])[:5],
                         "row_count": info.get("row_count", 0),
+                        "row_count_estimated": info.get("row_count_estimated", False),
                         "entity_type": info.get("entity_type", "unknown")
                     }
                 except:
@@ -715,27 +787,85 @@ class VectorStoreRAGChatViewSet(viewsets.ViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    def _record_result(self, user, session_id: str, query: str, result: dict):
+        """Save chat history and update metrics for a finished query"""
+        record_chat_result(user, session_id, query, result)
+    
     def _update_metrics(self, result: dict):
         """Update RAG metrics"""
-        from django.utils import timezone
+        update_rag_metrics(result)
+
+
+def record_chat_result(user, session_id: str, query: str, result: dict):
+    """Queue chat history and metrics for a finished query (written in batches)"""
+    get_metrics_recorder().record_chat(user, session_id, query, result)
+
+
+def update_rag_metrics(result: dict):
+    """Queue RAG metrics for a finished query (written in batches)"""
+    get_metrics_recorder().record_metrics(result)
+
+
+@csrf_exempt
+async def async_chat_query(request):
+    """
+    Async chat query for ASGI servers (uvicorn/daphne)
+    
+    POST /api/rag/v1/chat/query/async/
+    Body: same as /api/rag/chat/query/
+    
+    The worker is released while waiting on GROQ, so one process can keep
+    many slow LLM calls in flight. Under WSGI it still works, just without
+    that benefit.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+    
+    try:
+        auth = await sync_to_async(CustomAuthentication().authenticate)(request)
+    except Exception:
+        auth = None
+    if not auth:
+        return JsonResponse({"error": "Authentication credentials were not provided or are invalid."}, status=401)
+    user = auth[0]
+    
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+    
+    serializer = ChatQuerySerializer(data=payload)
+    if not serializer.is_valid():
+        return JsonResponse({"error": "Invalid request", "details": serializer.errors}, status=400)
+    
+    query = serializer.validated_data['query']
+    session_id = serializer.validated_data.get('session_id', str(uuid.uuid4()))
+    use_cache = serializer.validated_data.get('use_cache', True)
+    
+    user_context = build_user_context(user)
+    
+    try:
+        # Engine start-up (on first .orchestrator access) loads models and
+        # touches the DB, so keep it off the loop
+        orchestrator = await sync_to_async(lambda: get_rag_engine().orchestrator)()
+        result = await orchestrator.aprocess_intelligent_query(query, user_context, use_cache=use_cache)
         
-        today = timezone.now().date()
-        metrics, created = RAGMetrics.objects.get_or_create(date=today)
+        await sync_to_async(record_chat_result)(user, session_id, query, result)
         
-        metrics.total_queries += 1
-        if result.get('success'):
-            metrics.successful_queries += 1
-        else:
-            metrics.failed_queries += 1
+        return JsonResponse(result, status=200)
         
-        # Update average response time
-        total = metrics.total_queries
-        current_avg = metrics.avg_response_time
-        new_time = result.get('response_time', 0)
-        metrics.avg_response_time = ((current_avg * (total - 1)) + new_time) / total
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
         
-        metrics.total_tokens_used += result.get('tokens_used', 0)
-        metrics.save()
+        return JsonResponse(
+            {
+                "error": str(e),
+                "success": False,
+                "response": "Sorry, I encountered an error processing your request."
+            },
+            status=500
+        )
 
 
 @api_view(['POST'])
@@ -750,10 +880,12 @@ def initialize_vectorstore(request):
     try:
         refresh = request.data.get('refresh', False)
         
-        vectorstore = VectorStoreService()
-        vectorstore.initialize_with_database_knowledge(refresh=refresh)
+        vectorstore = get_rag_engine().vectorstore
+        sync_result = vectorstore.initialize_with_database_knowledge(refresh=refresh)
         
         stats = vectorstore.stats()
+        if sync_result:
+            stats["sync"] = sync_result
         
         return Response({
             "message": "Vector store initialized successfully",
@@ -779,15 +911,35 @@ def rag_metrics(request):
     days = int(request.query_params.get('days', 7))
     start_date = timezone.now().date() - timedelta(days=days)
     
+    # Include this worker's buffered queries (others flush within METRICS_FLUSH_INTERVAL)
+    get_metrics_recorder().flush()
+    
     metrics = RAGMetrics.objects.filter(date__gte=start_date).order_by('-date')
     serializer = RAGMetricsSerializer(metrics, many=True)
     
+    total_queries = sum(m.total_queries for m in metrics)
+    total_cache_hits = sum(m.cache_hits for m in metrics)
+    
+    # Per-stage percentiles (ms; "tokens" is a count), optionally for one query type
+    histograms = RAGLatencyHistogram.objects.filter(date__gte=start_date)
+    query_type = request.query_params.get('query_type')
+    if query_type:
+        histograms = histograms.filter(query_type=query_type)
+    
     total_data = {
-        'total_queries': sum(m.total_queries for m in metrics),
+        'total_queries': total_queries,
         'successful_queries': sum(m.successful_queries for m in metrics),
         'failed_queries': sum(m.failed_queries for m in metrics),
-        'avg_response_time': sum(m.avg_response_time for m in metrics) / len(metrics) if metrics else 0,
+        # Weighted by each day's query count, not a mean of daily means
+        'avg_response_time': (
+            sum(m.avg_response_time * m.total_queries for m in metrics) / total_queries if total_queries else 0
+        ),
         'total_tokens': sum(m.total_tokens_used for m in metrics),
+        'cache_hits': total_cache_hits,
+        'cache_hit_rate': round(total_cache_hits / total_queries * 100, 2) if total_queries else 0,
+        'latency_percentiles': summarize_histograms(
+            histograms.values_list('query_type', 'metric', 'histogram')
+        ),
         'daily_metrics': serializer.data
     }
     
@@ -799,6 +951,15 @@ def rag_metrics(request):
 def clear_cache(request):
     """Clear query cache"""
     count = QueryCache.objects.all().delete()[0]
+    bump_data_version()
+    
+    # Other workers drop their in-process copies within QUERY_CACHE_L1_TTL
+    engine = get_rag_engine()
+    if engine.is_started:
+        engine.rag_service.query_cache.clear_local()
+        if engine.rag_service.semantic_cache is not None:
+            engine.rag_service.semantic_cache.clear()
+    
     return Response(
         {"message": f"Cleared {count} cached queries"},
         status=status.HTTP_200_OK
@@ -810,13 +971,17 @@ def clear_cache(request):
 def system_status(request):
     """Get complete system status"""
     try:
-        orchestrator = VectorStoreOrchestrator()
-        status_info = orchestrator.get_system_status()
+        engine = get_rag_engine()
+        status_info = engine.orchestrator.get_system_status()
+        status_info["engine"] = engine.status()
+        status_info["metrics_recorder"] = get_metrics_recorder().stats()
         
         from django.utils import timezone
         status_info["timestamp"] = timezone.now().isoformat()
         status_info["endpoints"] = {
             "chat_query": "/api/rag/chat/query/",
+            "chat_query_stream": "/api/rag/chat/query_stream/",
+            "chat_query_async": "/api/rag/v1/chat/query/async/",
             "chat_history": "/api/rag/chat/history/",
             "diagnose_query": "/api/rag/chat/diagnose/",
             "vectorstore_stats": "/api/rag/chat/vectorstore_stats/",
@@ -854,5 +1019,46 @@ class DocumentManagementViewSet(viewsets.ModelViewSet):
         return DocumentStore.objects.filter(uploaded_by=self.request.user)
     
     def perform_create(self, serializer):
-        """Set uploaded_by to current user"""
-        serializer.save(uploaded_by=self.request.user)
\ No newline at end of file
+        """Set uploaded_by to current user and queue ingestion"""
+        document = serializer.save(uploaded_by=self.request.user)
+        
+        if rag_setting('DOCUMENT_AUTO_INGEST'):
+            document_id = str(document.id)
+            transaction.on_commit(lambda: self._queue_ingestion(document_id))
+    
+    @action(detail=True, methods=['post'])
+    def process(self, request, pk=None):
+        """
+        (Re)process a document into the vector store
+        
+        POST /api/rag/documents/{id}/process/
+        """
+        document = self.get_object()
+        if document.status == 'processing':
+            return Response(
+                {"error": "Document is already being processed"},
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        if not self._queue_ingestion(str(document.id)):
+            return Response(
+                {"error": "Could not queue document processing"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        
+        return Response(
+            {"message": "Document queued for processing", "id": str(document.id)},
+            status=status.HTTP_202_ACCEPTED
+        )
+    
+    @staticmethod
+    def _queue_ingestion(document_id: str) -> bool:
+        """Hand a document to the Celery ingestion task"""
+        from .tasks import process_document_task
+        
+        try:
+            process_document_task.delay(document_id)
+            return True
+        except Exception as e:
+            print(f"⚠️ Could not queue document {document_id}: {e}")
+            return False
\ No newline at end of file
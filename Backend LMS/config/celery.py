@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown
 
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
@@ -9,5 +10,14 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
 
 
+@worker_process_init.connect
+def warmup_rag_engine(**kwargs):
+    """Each prefork child builds its own shared RAG engine"""
+    from apps.rag_system.services.engine import warmup_if_configured
+    warmup_if_configured()
 
 
+@worker_process_shutdown.connect
+def shutdown_rag_engine(**kwargs):
+    from apps.rag_system.services.engine import shutdown_rag_engine
+    shutdown_rag_engine()
@@ -220,6 +220,8 @@ RAG_SETTINGS = {
     'GROQ_API_KEY': config('GROQ_API_KEY'),
     'GROQ_MODEL': 'llama-3.1-70b-versatile',
     'VECTOR_STORE_PATH': BASE_DIR / 'data' / 'vectorstore',
+    # Build the shared RAG engine when a web/Celery worker process starts
+    'WARMUP_ON_STARTUP': config('RAG_WARMUP_ON_STARTUP', default=False, cast=bool),
 }
 
 STATIC_URL = '/static/'
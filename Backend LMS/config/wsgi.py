@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# Load the RAG embedding model before the first chat request (opt-in)
+from apps.rag_system.services.engine import warmup_if_configured  # noqa: E402
+
+warmup_if_configured()